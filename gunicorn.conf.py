@@ -0,0 +1,54 @@
+# Production deployment: gunicorn -c gunicorn.conf.py
+#
+# Pre-fork workers with threads. Requests mostly wait on Ollama, so each
+# worker runs GUNICORN_THREADS threads and the worker count only needs to
+# cover the CPU-bound parts (parsing, validation, JSON). All workers share
+# caches and the Ollama health snapshot through one SQLite file.
+import os
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+wsgi_app = 'coding_server:app'
+
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Long generations stream for minutes; keep-alive covers editor clients
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+graceful_timeout = 30
+keepalive = 5
+
+# No preload: every worker imports the app itself and starts its own
+# prober thread, which then elects one leader through the shared store
+preload_app = False
+
+os.environ.setdefault('SHARED_STORE_PATH',
+                      os.path.join(tempfile.gettempdir(), 'coding_server_shared.sqlite3'))
+
+_LOCAL_WORKERS = int(os.getenv('LOCAL_WORKERS', 1))
+_BASE_PORT = int(os.getenv('LOCAL_WORKER_BASE_PORT', 11500))
+
+
+# Port slots of the live workers, kept by the arbiter. A slot is freed when
+# its worker exits, so a replacement never shares a live worker's ports.
+_used_slots = set()
+
+
+def pre_fork(server, arbiter_worker):
+    slot = min(set(range(len(_used_slots) + 1)) - _used_slots)
+    _used_slots.add(slot)
+    arbiter_worker.local_port_slot = slot
+
+
+def post_fork(server, arbiter_worker):
+    # Fallback `ollama serve` workers are per process; give each gunicorn
+    # worker its own port range so they don't collide
+    slot = arbiter_worker.local_port_slot
+    os.environ['LOCAL_WORKER_BASE_PORT'] = str(_BASE_PORT + slot * _LOCAL_WORKERS)
+
+
+def child_exit(server, arbiter_worker):
+    _used_slots.discard(getattr(arbiter_worker, 'local_port_slot', None))
@@ -0,0 +1,177 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import increment
+from token_budget import estimate_tokens
+from ollama_client import call_ollama_chat, call_ollama_smart, get_ollama_snapshot, OLLAMA_URLS
+from shared_store import STORE
+
+# Regular chat goes to Ollama's /api/chat. Continue resends the whole
+# history every turn, so a session only remembers how much of the front
+# has been dropped (and its summary) plus which backend serves it. The
+# window moves in large steps: between steps the messages sent keep the
+# same prefix and the backend's KV cache covers everything but the new turn.
+# The window position is kept in the shared store so every server process
+# sends the same window for a conversation.
+
+CHAT_HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', 6000))
+CHAT_SESSION_TTL = float(os.getenv('CHAT_SESSION_TTL', 3600))
+CHAT_SESSION_LIMIT = int(os.getenv('CHAT_SESSION_LIMIT', 512))
+# Model that summarizes dropped turns; unset means they are just dropped
+CHAT_SUMMARY_MODEL = os.getenv('CHAT_SUMMARY_MODEL')
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ChatSession:
+    """Window state for one conversation"""
+
+    def __init__(self, conversation_id, backend):
+        self.id = conversation_id
+        self.backend = backend
+        self.dropped = 0        # leading non-system messages no longer sent
+        self.summary = None
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def message_text(message):
+    """Content of an OpenAI message; multi-part content is joined"""
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content
+
+
+def conversation_id(data, headers):
+    """Explicit id if the client sends one, else derived from the opening messages
+
+    The OpenAI "user" field names the end user, not the thread, so it is
+    not used: one user's conversations must not share a session.
+    """
+    explicit = headers.get('X-Conversation-Id') or data.get('conversation_id')
+    if explicit:
+        return str(explicit)
+    messages = data.get('messages', [])
+    opening = [m for m in messages if m.get('role') == 'system'][:1]
+    opening += [m for m in messages if m.get('role') == 'user'][:1]
+    key = data.get('model', '') + '\0' + '\0'.join(message_text(m) for m in opening)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def backend_for(conv_id):
+    """Stable backend choice, so a conversation returns to the same KV cache"""
+    digest = int(hashlib.sha256(conv_id.encode('utf-8')).hexdigest()[:8], 16)
+    return OLLAMA_URLS[digest % len(OLLAMA_URLS)]
+
+
+def get_session(conv_id):
+    now = time.time()
+    with _sessions_lock:
+        session = _sessions.get(conv_id)
+        if session is None or now - session.last_used > CHAT_SESSION_TTL:
+            session = ChatSession(conv_id, backend_for(conv_id))
+            _sessions[conv_id] = session
+            increment('chat_sessions_created')
+        session.last_used = now
+        _sessions.move_to_end(conv_id)
+        while len(_sessions) > CHAT_SESSION_LIMIT:
+            _sessions.popitem(last=False)
+        return session
+
+
+def _size(messages, model):
+    return sum(estimate_tokens(message_text(m), model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def summarize(previous, turns):
+    """Fold dropped turns into the running summary, keeping the old one on failure"""
+    transcript = '\n'.join(f"{m.get('role', 'user')}: {message_text(m)}" for m in turns)
+    prompt = ("Summarize this conversation so it can continue without the full text. "
+              "Keep decisions, code names and open questions. Be brief.\n\n")
+    if previous:
+        prompt += f"Earlier summary:\n{previous}\n\n"
+    prompt += f"Conversation:\n{transcript}\n\nSummary:"
+    result = call_ollama_smart(CHAT_SUMMARY_MODEL, prompt)
+    if result.startswith("Error:"):
+        logging.warning(f"[CHAT] Summary failed: {result}")
+        return previous
+    return result
+
+
+def build_window(session, messages, model):
+    """Messages to send: system prompt, summary, then the kept turns"""
+    system = [m for m in messages if m.get('role') == 'system']
+    turns = [m for m in messages if m.get('role') != 'system']
+
+    if session.dropped >= len(turns):
+        # History shorter than what we dropped: edited or restarted conversation
+        session.dropped = 0
+        session.summary = None
+
+    def prefix():
+        if not session.summary:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{session.summary}"}]
+
+    if _size(system + prefix() + turns[session.dropped:], model) > CHAT_HISTORY_TOKENS:
+        # Move the window in one step down to half the budget, so the
+        # following turns are sent with an unchanged prefix
+        start = session.dropped
+        while start < len(turns) - 1 and _size(system + prefix() + turns[start:], model) > CHAT_HISTORY_TOKENS // 2:
+            start += 1
+        while start < len(turns) - 1 and turns[start].get('role') != 'user':
+            start += 1
+        if CHAT_SUMMARY_MODEL:
+            session.summary = summarize(session.summary, turns[session.dropped:start])
+        logging.info(f"[CHAT] Session {session.id}: window moved from message {session.dropped} to {start}")
+        increment('chat_window_moves')
+        session.dropped = start
+
+    window = [{"role": m.get('role', 'user'), "content": message_text(m)}
+              for m in system + prefix() + turns[session.dropped:]]
+    return window
+
+
+def flatten_messages(messages):
+    """One prompt string for backends without /api/chat (the ollama CLI)"""
+    prompt = ""
+    for message in messages:
+        role = message.get('role', '')
+        content = message_text(message)
+        if role == 'system':
+            prompt += f"System: {content}\n\n"
+        elif role == 'user':
+            prompt += f"User: {content}\n\n"
+        elif role == 'assistant':
+            prompt += f"Assistant: {content}\n\n"
+        else:
+            prompt += f"{content}\n\n"
+    return prompt + "Assistant:"
+
+
+def chat_turn(model, messages, conv_id):
+    """Answer the last message of a conversation through its session"""
+    session = get_session(conv_id)
+    with session.lock:
+        shared = STORE.get('chat', conv_id)
+        if shared:
+            session.dropped, session.summary = shared["dropped"], shared["summary"]
+        window = build_window(session, messages, model)
+        STORE.set('chat', conv_id, {"dropped": session.dropped, "summary": session.summary},
+                  ttl=CHAT_SESSION_TTL, max_entries=CHAT_SESSION_LIMIT)
+
+    result = call_ollama_chat(model, window, session.backend)
+    if result.startswith("Error: Cannot connect") and not get_ollama_snapshot().is_remote:
+        # Local server without a reachable HTTP API: the CLI takes a flat prompt
+        logging.info("[CHAT] /api/chat unreachable, falling back to a flattened prompt")
+        result = call_ollama_smart(model, flatten_messages(window))
+    return result
@@ -1,6 +1,8 @@
 # src/code_processor.py
 import re
 
+from swift_array import parse_array_elements, has_comments
+
 def format_prompt_for_remove_all_comments(code, language="swift"):
     """Prompt to remove ALL comments from code"""
     prompt = f"""You are a code formatter. Remove ALL comments completely from the code.
@@ -142,4 +144,73 @@ def clean_removed_comments_output(output, original_code):
         lang = lang_match.group(1) if lang_match else 'swift'
         return f"```{lang}\n{code_only}\n```"
     
-    return code_only
\ No newline at end of file
+    return code_only
+
+def strip_code_fence(text):
+    """Return the code inside a Markdown code block, or the text unchanged"""
+    match = re.search(r'```[\w]*\n(.*?)\n?```', text, re.DOTALL)
+    if match:
+        return match.group(1)
+    return text
+
+def count_array_elements(code):
+    """Count the number of array elements with comments"""
+    if code.startswith("Error:"):
+        return 0
+    
+    # Find all comment numbers
+    matches = re.findall(r'\/\*\s*(\d+)\s*\*\/', code)
+    numbers = [int(match) for match in matches]
+    
+    if not numbers:
+        return 0
+    
+    # Check if numbering is sequential from 1
+    expected = list(range(1, len(numbers) + 1))
+    if numbers != expected:
+        return f"{len(numbers)} (non-sequential: {numbers})"
+    
+    return len(numbers)
+
+def validate_corrected_code(original, corrected):
+    """Basic validation that the corrected code is reasonable"""
+    if corrected.startswith("Error:"):
+        return corrected
+    
+    # Check if we have roughly the same number of lines
+    orig_lines = len(original.split('\n'))
+    corr_lines = len(corrected.split('\n'))
+    
+    # Allow for some variation due to added comments
+    if corr_lines < orig_lines * 0.5:
+        return "Error: Corrected code seems incomplete"
+    
+    return corrected
+
+def validate_numbered_output(original, cleaned):
+    """Cascade validator: every input element present and numbered 1..N in order"""
+    if cleaned.startswith("Error:"):
+        return cleaned
+    if validate_corrected_code(original, cleaned).startswith("Error:"):
+        return "output seems incomplete"
+
+    expected = len(parse_array_elements(original))
+    count = count_array_elements(cleaned)
+    if not isinstance(count, int):
+        return f"numbering is not sequential: {count}"
+    if count != expected:
+        return f"{count} numbered elements, expected {expected}"
+    return None
+
+def validate_comment_free_output(original, cleaned):
+    """Cascade validator: no comments left and no elements lost"""
+    if cleaned.startswith("Error:"):
+        return cleaned
+    code_only = strip_code_fence(cleaned)
+    if has_comments(code_only):
+        return "comments remain in output"
+    expected = len(parse_array_elements(original))
+    found = len(parse_array_elements(code_only))
+    if found != expected:
+        return f"{found} elements, expected {expected}"
+    return None
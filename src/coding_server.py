@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
 import subprocess
 import json
@@ -7,6 +7,7 @@ import requests
 import os
 import time
 import logging
+from concurrent.futures import as_completed
 from urllib.parse import urlparse
 
 from datetime import datetime
@@ -24,78 +25,95 @@ logging.basicConfig(
 )
 
 from code_processor import format_prompt_for_array_comments, format_prompt_for_remove_all_comments, clean_model_output, clean_removed_comments_output
+from code_processor import validate_numbered_output, validate_comment_free_output
+from stream_validation import numbering_validator, literal_validator
+from metrics import snapshot as metrics_snapshot
+from operations import OPERATIONS, run_operation, read_code_file
+from scheduler import submit_model_task, submit_fast_task, queue_stats, run_until_disconnect, run_all_until_disconnect
+from request_context import CancelToken, ClientDisconnected, DeadlineExceeded, token_scope, new_usage, usage_scope
+from token_budget import check_input, plan_budget, estimate_tokens
+from chat_sessions import conversation_id, chat_turn
+from local_workers import LOCAL_POOL
+from translation_memory import MEMORY as TRANSLATION_MEMORY, split_verses, format_translation_prompt, translate_with_memory
+from latin_paradigm import PARADIGMS
+from metrics import increment, observe
+from incremental import process_incremental, RESULT_FIELDS
+from shared_store import STORE as SHARED_STORE
+from response_shaping import check_shape, shape_response, compress_response
+from whole_file import has_several_arrays, process_whole_file
+from swift_array import find_array_literals
+import traffic_capture
+import profiling
+import deadlines
 
 from ollama_client import (
     call_ollama_smart, 
+    call_ollama_cascade,
     check_ollama_availability, 
-    create_ollama_session,
-    get_available_models,
-    get_available_models_cli,
-    IS_REMOTE,
+    get_ollama_snapshot,
+    start_health_prober,
     OLLAMA_BASE_URL,
-    OLLAMA_AVAILABLE
+    OLLAMA_PROBE_INTERVAL,
+    DEADLINE_PREFIX,
+    adaptive_timeout
 )
-from liturgical_processor import renumber_verses_with_ai
+from liturgical_processor import renumber_verses_with_cascade
 from liturgical_processor import (
     parse_verses_from_array, 
+    parse_verse_lines,
     analyze_verse_structure_with_ai,
-    adjust_verses_to_count
+    adjust_verses_to_count,
+    create_fallback_analysis,
+    segment_verses,
+    review_segmentation_with_ai
 )
 
-from latin_morphology import analyze_latin_word
+from latin_morphology import (
+    analyze_latin_word, analyze_latin_text, text_forms, with_surface,
+    cached_form_analysis, analyze_canonical_form
+)
 from ollama_client import call_ollama_smart, check_ollama_availability
 
 app = Flask(__name__)
 CORS(app)
+traffic_capture.install(app)
+profiling.install(app)
+deadlines.install(app)
+app.after_request(compress_response)
 
 # Configuration
 PORT = int(os.getenv('PORT', 5000))
 DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'deepseek-coder:6.7b')
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 200))
+# Batch items may only read code files under this directory
+BATCH_CODE_ROOT = os.getenv('BATCH_CODE_ROOT', os.getcwd())
 logging.info(f"[STARTUP] DEFAULT_MODEL from env: {DEFAULT_MODEL}")
 logging.info(f"[STARTUP] PORT from env: {PORT}")
 print(f"Using model: {DEFAULT_MODEL}")
 print(f"Server port: {PORT}")
 
-def count_array_elements(code):
-    """Count the number of array elements with comments"""
-    if code.startswith("Error:"):
-        return 0
-    
-    # Find all comment numbers
-    matches = re.findall(r'\/\*\s*(\d+)\s*\*\/', code)
-    numbers = [int(match) for match in matches]
-    
-    if not numbers:
-        return 0
-    
-    # Check if numbering is sequential from 1
-    expected = list(range(1, len(numbers) + 1))
-    if numbers != expected:
-        return f"{len(numbers)} (non-sequential: {numbers})"
-    
-    return len(numbers)
+# Keep availability and the model catalog fresh off the request path
+start_health_prober()
 
-def validate_corrected_code(original, corrected):
-    """Basic validation that the corrected code is reasonable"""
-    if corrected.startswith("Error:"):
-        return corrected
-    
-    # Check if we have roughly the same number of lines
-    orig_lines = len(original.split('\n'))
-    corr_lines = len(corrected.split('\n'))
-    
-    # Allow for some variation due to added comments
-    if corr_lines < orig_lines * 0.5:
-        return "Error: Corrected code seems incomplete"
-    
-    return corrected
+def snapshot_age(snapshot):
+    """Seconds since the snapshot was taken, None if never probed"""
+    if not snapshot.checked_at:
+        return None
+    return round(time.time() - snapshot.checked_at, 1)
+
+def model_catalog(snapshot):
+    """Model names from the snapshot, annotated with memory residency"""
+    return [{
+        "name": name,
+        "resident": name in snapshot.running
+    } for name in snapshot.models]
 
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
-    is_available = check_ollama_availability()
-    ollama_status = "connected" if is_available else "disconnected"
-    server_type = "remote" if IS_REMOTE else "local"
+    snapshot = get_ollama_snapshot()
+    ollama_status = "connected" if snapshot.available else "disconnected"
+    server_type = "remote" if snapshot.is_remote else "local"
     
     return jsonify({
         "status": "healthy",
@@ -104,34 +122,168 @@ def health_check():
             "status": ollama_status,
             "type": server_type,
             "url": OLLAMA_BASE_URL,
-            "available": OLLAMA_AVAILABLE
+            "available": snapshot.available,
+            "method": snapshot.method,
+            "latency_ms": snapshot.latency_ms,
+            "running_models": list(snapshot.running),
+            "error": snapshot.error,
+            "snapshot_age_s": snapshot_age(snapshot)
         },
         "timestamp": datetime.now().isoformat(),
         "default_model": DEFAULT_MODEL
     })
 
+# Liveness: the process is up and serving requests
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    return jsonify({"status": "alive", "timestamp": datetime.now().isoformat()})
+
+# Readiness: a model backend was reachable at the last probe
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    snapshot = get_ollama_snapshot()
+    age = snapshot_age(snapshot)
+    stale = age is None or age > OLLAMA_PROBE_INTERVAL * 3
+    ready = snapshot.method != "none" and not stale
+
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "method": snapshot.method,
+        "snapshot_age_s": age,
+        "error": snapshot.error if not stale else "health snapshot is stale"
+    }), 200 if ready else 503
+
 # List available models
 @app.route('/api/models', methods=['GET'])
 def list_models():
-    try:
-        if check_ollama_availability():
-            session = create_ollama_session()
-            response = session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
-            models_data = response.json()
-            models = [model["name"] for model in models_data.get("models", [])]
-            method = "http"
-        else:
-            models = get_available_models_cli() if not IS_REMOTE else []
-            method = "cli" if not IS_REMOTE else "none"
-        
-        return jsonify({
-            "available_models": models,
-            "method": method,
-            "server_type": "remote" if IS_REMOTE else "local"
-        })
+    snapshot = get_ollama_snapshot()
+    return jsonify({
+        "available_models": list(snapshot.models),
+        "models": model_catalog(snapshot),
+        "running_models": snapshot.running,
+        "method": snapshot.method,
+        "server_type": "remote" if snapshot.is_remote else "local",
+        "snapshot_age_s": snapshot_age(snapshot)
+    })
 
-    except Exception as e:
-        return jsonify({"error": f"Failed to get models: {str(e)}"}), 500
+def run_for_client(fn, *args, **kwargs):
+    """Run model-bound work in a scheduler slot, cancelled if the client disconnects
+
+    Raises DeadlineExceeded when the work cannot finish by the request's deadline.
+    """
+    result = run_until_disconnect(request.environ, fn, *args, **kwargs)
+    raise_if_deadline(result)
+    return result
+
+def run_all_for_client(fn, arg_lists):
+    """run_for_client for several independent calls, run concurrently; results in order"""
+    results = run_all_until_disconnect(request.environ, fn, arg_lists)
+    for result in results:
+        raise_if_deadline(result)
+    return results
+
+def raise_if_deadline(result):
+    """Raise DeadlineExceeded if a model call gave up on the request's deadline"""
+    # Model calls return "Error: ..." strings, (text, model) pairs or error dicts
+    error = result
+    if isinstance(result, tuple) and result:
+        error = result[0]
+    elif isinstance(result, dict):
+        error = result.get("error")
+    if isinstance(error, str) and error.startswith(DEADLINE_PREFIX):
+        raise DeadlineExceeded(error[len(DEADLINE_PREFIX):].strip())
+
+def client_gone():
+    """Response for a client that is no longer listening"""
+    increment('client_disconnects', path=request.path)
+    logging.info(f"[CANCEL] Client disconnected from {request.path}, generation cancelled")
+    return jsonify({"error": "Client disconnected"}), 499
+
+def deadline_exceeded(e):
+    """Response for a request that cannot finish by its deadline"""
+    body, status = deadlines.deadline_error(str(e))
+    return jsonify(body), status
+
+def wants_incremental(data):
+    return bool(data.get('incremental') or data.get('base_hash') or data.get('document_id'))
+
+def incremental_response(operation, code, data, model, **fields):
+    """Process through the incremental path and shape the endpoint response"""
+    result = run_for_client(
+        process_incremental, operation, code, model, data.get('language', 'swift'),
+        base_hash=data.get('base_hash'),
+        document_id=data.get('document_id')
+    )
+    if "error" in result:
+        return jsonify(result), 500
+
+    response = dict(fields)
+    response.update({
+        "model_used": model,
+        "content_hash": result["content_hash"],
+        "base_hash": result["base_hash"],
+        "edits": result["edits"],
+        "incremental": result["incremental"],
+        "success": True
+    })
+    # Clients that track the document can apply the edits instead
+    if not data.get('edits_only') or result["edits"] is None:
+        response["original_code"] = code
+        response.update({k: v for k, v in result.items() if k.endswith('_code')})
+    return jsonify(shape_response(data, code, response, RESULT_FIELDS[operation]))
+
+def extract_code(user_message, bare=False):
+    """Code in a chat message: a Markdown block, else the span of its array declarations
+
+    Arrays are found with the Swift tokenizer, so a ']' in prose after the
+    code is never included. With bare=True an undeclared '[...]' counts too.
+    """
+    block = re.search(r'```[\w]*\n(.*?)\n```', user_message, re.DOTALL)
+    if block:
+        return block.group(1).strip()
+    arrays = find_array_literals(user_message, bare=bare)
+    if arrays:
+        return user_message[arrays[0].start:arrays[-1].end]
+    return user_message
+
+def whole_file_response(operation, code, data, model, **fields):
+    """Process every array literal of a file independently and splice the results back"""
+    bad_shape = check_shape(data)
+    if bad_shape:
+        return jsonify({"error": bad_shape}), 400
+    for array in find_array_literals(code):
+        too_large = check_input(operation, code[array.start:array.end], model)
+        if too_large:
+            return jsonify({"error": f"Array '{array.name}': {too_large}"}), 413
+
+    language = fields.get('language', 'swift')
+    result = process_whole_file(operation, code, model, language, run_all_for_client)
+    if "error" in result:
+        return jsonify(result), 500
+
+    field = RESULT_FIELDS[operation]
+    response = dict(fields)
+    response.update({
+        "original_code": code,
+        field: result[field],
+        "model_used": model,
+        "arrays": result["arrays"],
+        "arrays_count": result["arrays_count"],
+        "elements_count": result["elements_count"],
+        "success": True
+    })
+    return jsonify(shape_response(data, code, response, field))
+
+def chat_whole_file(operation, code, model, usage):
+    """Whole-file processing for a chat request: the spliced code, or an "Error: ..." string"""
+    with usage_scope(usage):
+        result = process_whole_file(operation, code, model, 'swift', run_all_for_client)
+    if "error" in result:
+        failures = '; '.join(f"{a['name']}: {a['error']}" for a in result["arrays"] if "error" in a)
+        return f"Error: {result['error']} ({failures})"
+    logging.info(f"[WHOLE_FILE] {operation}: {result['arrays_count']} arrays, "
+                 f"{result['elements_count']} elements")
+    return result[RESULT_FIELDS[operation]]
 
 # Fix array comments endpoint
 @app.route('/api/fix-array-comments', methods=['POST'])
@@ -150,32 +302,38 @@ def fix_array_comments():
         if not code:
             return jsonify({"error": "Empty code provided"}), 400
 
-        prompt = format_prompt_for_array_comments(code, language)
-        
-        # Use smart caller (HTTP first, CLI fallback)
-        result = call_ollama_smart(model, prompt)
-        
-        # Check if result is an error
-        if result.startswith("Error:"):
-            return jsonify({"error": result}), 500
+        if has_several_arrays(code) and not wants_incremental(data):
+            return whole_file_response('fix-array-comments', code, data, model, language=language)
 
-        cleaned_output = clean_model_output(result, code)
-        validated_output = validate_corrected_code(code, cleaned_output)
-        
-        if validated_output.startswith("Error:"):
-            return jsonify({"error": validated_output}), 500
-            
-        elements_count = count_array_elements(cleaned_output)
+        too_large = check_input('fix-array-comments', code, model)
+        if too_large:
+            return jsonify({"error": too_large}), 413
 
-        return jsonify({
+        bad_shape = check_shape(data)
+        if bad_shape:
+            return jsonify({"error": bad_shape}), 400
+
+        if wants_incremental(data):
+            return incremental_response('fix-array-comments', code, data, model, language=language)
+
+        result = run_for_client(run_operation, 'fix-array-comments', code, model, language)
+        if "error" in result:
+            return jsonify(result), 500
+
+        return jsonify(shape_response(data, code, {
             "original_code": code,
-            "corrected_code": cleaned_output,
-            "model_used": model,
+            "corrected_code": result["corrected_code"],
+            "model_used": result["model_used"],
             "language": language,
-            "elements_count": elements_count,
+            "elements_count": result["elements_count"],
+            "repaired": result.get("repaired"),
             "success": True
-        })
+        }, 'corrected_code'))
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
@@ -196,30 +354,37 @@ def remove_all_comments():
         if not code:
             return jsonify({"error": "Empty code provided"}), 400
 
-        prompt = format_prompt_for_remove_all_comments(code, language)
-        
-        # Use smart caller (HTTP first, CLI fallback)
-        result = call_ollama_smart(model, prompt)
-        
-        # Check if result is an error
-        if result.startswith("Error:"):
-            return jsonify({"error": result}), 500
+        if has_several_arrays(code) and not wants_incremental(data):
+            return whole_file_response('remove-all-comments', code, data, model, language=language)
 
-        # Use specialized cleaning for comment removal (ensures all comments are gone)
-        cleaned_output = clean_removed_comments_output(result, code)
-        validated_output = validate_corrected_code(code, cleaned_output)
-        
-        if validated_output.startswith("Error:"):
-            return jsonify({"error": validated_output}), 500
+        too_large = check_input('remove-all-comments', code, model)
+        if too_large:
+            return jsonify({"error": too_large}), 413
 
-        return jsonify({
+        bad_shape = check_shape(data)
+        if bad_shape:
+            return jsonify({"error": bad_shape}), 400
+
+        if wants_incremental(data):
+            return incremental_response('remove-all-comments', code, data, model, language=language)
+
+        result = run_for_client(run_operation, 'remove-all-comments', code, model, language)
+        if "error" in result:
+            return jsonify(result), 500
+
+        return jsonify(shape_response(data, code, {
             "original_code": code,
-            "cleaned_code": cleaned_output,
-            "model_used": model,
+            "cleaned_code": result["cleaned_code"],
+            "model_used": result["model_used"],
             "language": language,
+            "repaired": result.get("repaired"),
             "success": True
-        })
+        }, 'cleaned_code'))
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
@@ -235,10 +400,14 @@ def analyze_latin_word_endpoint():
             return jsonify({"error": "No word provided"}), 400
         
         # Analyze the word
-        analysis = analyze_latin_word(word)
+        analysis = run_for_client(analyze_latin_word, word)
         
         return jsonify(analysis)
         
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -252,25 +421,102 @@ def analyze_latin_text_endpoint():
         
         if not text:
             return jsonify({"error": "No text provided"}), 400
+
+        sse = 'text/event-stream' in request.headers.get('Accept', '') or data.get('stream') == 'sse'
+        if data.get('stream') or sse:
+            return stream_latin_text(text, sse)
         
-        # Split into words and analyze each
-        words = re.findall(r'\b[a-zA-ZāēīōūĀĒĪŌŪ]+\b', text)
-        analyses = []
-        
-        for word in words:
-            if len(word) > 2:  # Ignore very short words
-                analysis = analyze_latin_word(word)
-                analyses.append(analysis)
-        
-        return jsonify({
-            "original_text": text,
-            "word_count": len(analyses),
-            "analyses": analyses
-        })
+        # Each canonical form (spelling, accents, enclitics folded) is analyzed once
+        return jsonify(run_for_client(analyze_latin_text, text))
         
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def stream_latin_text(text, sse=False, model='mistral:7b'):
+    """Stream word analyses as they are ready: lexicon cache hits first, then model results
+
+    NDJSON by default, SSE events (start, word, done) when sse is set.
+    Every word line carries its index in the text's word list.
+    """
+    started = time.time()
+    forms = text_forms(text)
+    by_key = {}
+    for index, form in enumerate(forms):
+        by_key.setdefault(form.key, []).append(index)
+
+    # Cancelled when the client stops reading, so queued forms never start
+    token = CancelToken()
+    cached, futures = {}, {}
+    for key, indexes in by_key.items():
+        analysis = cached_form_analysis(forms[indexes[0]], model)
+        if analysis is not None:
+            cached[key] = analysis
+        else:
+            with token_scope(token):
+                futures[submit_model_task(analyze_canonical_form, forms[indexes[0]], model)] = key
+
+    def event(name, payload):
+        if sse:
+            return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+        return json.dumps(payload) + "\n"
+
+    def generate():
+        first_result_ms = None
+        failed = 0
+        yield event('start', {
+            "words": [form.surface for form in forms],
+            "word_count": len(forms),
+            "unique_forms": len(by_key),
+            "cached_forms": len(cached),
+            "model_used": model
+        })
+
+        def lines(key, analysis, source):
+            nonlocal first_result_ms
+            if first_result_ms is None:
+                first_result_ms = round((time.time() - started) * 1000, 1)
+                observe('latin_stream_first_result_ms', first_result_ms)
+            for index in by_key[key]:
+                line = {"index": index, "source": source}
+                line.update(with_surface(analysis, forms[index]))
+                yield event('word', line)
+
+        try:
+            for key, analysis in cached.items():
+                yield from lines(key, analysis, 'cache')
+            for future in as_completed(futures):
+                try:
+                    analysis = future.result()
+                except Exception as e:
+                    analysis = {"lemma": "unknown", "part_of_speech": "unknown", "error": f"Server error: {str(e)}"}
+                if "error" in analysis:
+                    failed += len(by_key[futures[future]])
+                yield from lines(futures[future], analysis, 'model')
+        except GeneratorExit:
+            for future in futures:
+                future.cancel()
+            token.cancel("client disconnected")
+            increment('client_disconnects', path='/api/analyze-latin-text')
+            logging.info("[LATIN] Client disconnected, remaining words cancelled")
+            raise
+
+        yield event('done', {
+            "done": True,
+            "word_count": len(forms),
+            "cached_forms": len(cached),
+            "model_forms": len(futures),
+            "failed": failed,
+            "time_to_first_result_ms": first_result_ms,
+            "elapsed_ms": round((time.time() - started) * 1000, 1)
+        })
+
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
 # Latin linguistic analysis endpoint
 @app.route('/api/analyze-latin', methods=['POST'])
 def analyze_latin():
@@ -297,7 +543,11 @@ Format as a structured analysis.
 Text: "{text}"
 Analysis:"""
 
-        result = call_ollama_smart(model, prompt)
+        too_large = plan_budget(None, prompt, model).error
+        if too_large:
+            return jsonify({"error": too_large}), 413
+
+        result = run_for_client(call_ollama_smart, model, prompt)
         
         if result.startswith("Error:"):
             return jsonify({"error": result}), 500
@@ -309,6 +559,10 @@ Analysis:"""
             "model_used": model
         })
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -326,19 +580,41 @@ def translate_classical():
         if not text:
             return jsonify({"error": "No text provided"}), 400
 
-        prompt = f"""Translate this {source_lang} text to {target_lang} and provide grammatical analysis:
-
-Text: "{text}"
-
-Provide:
-1. Literal translation
-2. Fluent translation  
-3. Word-by-word analysis (lemma, form, grammar)
-4. Overall grammatical structure
+        if data.get('use_memory', True):
+            verses = split_verses(text)
+            too_large = max((plan_budget(None, format_translation_prompt(v, source_lang, target_lang), model).error
+                             for v in verses), key=bool, default=None)
+            if too_large:
+                return jsonify({"error": too_large}), 413
 
-Translation and Analysis:"""
+            # Repeated and near-identical verses come from the translation memory
+            results = translate_with_memory(text, source_lang, target_lang, model, run_all_for_client)
+            failed = next((r for r in results if "error" in r), None)
+            if failed:
+                return jsonify({"error": failed["error"]}), 500
 
-        result = call_ollama_smart(model, prompt)
+            sources = [r["source"] for r in results]
+            return jsonify({
+                "original_text": text,
+                "source_language": source_lang,
+                "target_language": target_lang,
+                "translation": "\n\n".join(r["translation"] for r in results),
+                "verses": results,
+                "translation_memory": {
+                    "exact": sources.count("exact"),
+                    "model": sources.count("model"),
+                    "hinted": sum(1 for r in results if "hint" in r)
+                },
+                "model_used": model
+            })
+
+        prompt = format_translation_prompt(text, source_lang, target_lang)
+
+        too_large = plan_budget(None, prompt, model).error
+        if too_large:
+            return jsonify({"error": too_large}), 413
+
+        result = run_for_client(call_ollama_smart, model, prompt)
         
         if result.startswith("Error:"):
             return jsonify({"error": result}), 500
@@ -351,6 +627,10 @@ Translation and Analysis:"""
             "model_used": model
         })
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -413,16 +693,8 @@ def chat_completions():
         # If code_file is provided, read from file
         if code_file:
             try:
-                import os
-                # Support both absolute and relative paths
-                if not os.path.isabs(code_file):
-                    # Relative to current working directory
-                    code_file_path = os.path.join(os.getcwd(), code_file)
-                else:
-                    code_file_path = code_file
-                
-                with open(code_file_path, 'r', encoding='utf-8') as f:
-                    direct_code = f.read()
+                # Supports both absolute and relative paths
+                direct_code = read_code_file(code_file)
                 logging.info(f"[CODE_FILE] Loaded code from file: {code_file}")
                 logging.info(f"[CODE_FILE] Code preview: {direct_code[:100]}...")
             except FileNotFoundError:
@@ -493,6 +765,14 @@ def chat_completions():
         
         logging.info(f"[DETECT] Array request: {is_array_request}")
         
+        # Code operations set validators so the model cascade can escalate
+        validator = None
+        stream_validator_factory = None
+        # Set when several arrays were processed one by one and spliced back
+        whole_file = False
+        # Token counts reported by Ollama for the calls below
+        usage = new_usage()
+        
         if is_remove_comments_request:
             logging.info("[REMOVE_COMMENTS] USING REMOVE COMMENTS LOGIC")
             
@@ -501,28 +781,21 @@ def chat_completions():
                 code_to_fix = direct_code.strip()
                 logging.info(f"[REMOVE_COMMENTS] Using direct 'code' field")
             else:
-                # Extract code - try to get code block or variable assignment
-                code_to_fix = user_message
-                
-                # Try to extract code from markdown blocks first
-                code_block_match = re.search(r'```[\w]*\n(.*?)\n```', user_message, re.DOTALL)
-                if code_block_match:
-                    code_to_fix = code_block_match.group(1).strip()
-                    print(f"[OK] Extracted code from markdown block: {code_to_fix[:80]}...")
-                else:
-                    # Try to extract variable assignment
-                    full_code_match = re.search(
-                        r'((?:private\s+|public\s+|internal\s+)?(?:let|var|const)\s+\w+\s*=\s*\[.*?\])',
-                        user_message,
-                        re.DOTALL | re.IGNORECASE
-                    )
-                    if full_code_match:
-                        code_to_fix = full_code_match.group(1).strip()
-                        print(f"[OK] Extracted variable assignment: {code_to_fix[:80]}...")
+                # A code block, or every array declaration in the message
+                code_to_fix = extract_code(user_message)
+                print(f"[OK] Extracted code: {code_to_fix[:80]}...")
             
             logging.info(f"[REMOVE_COMMENTS] Code to process: {code_to_fix}")
             
-            prompt = format_prompt_for_remove_all_comments(code_to_fix, "swift")
+            if has_several_arrays(code_to_fix):
+                response_text = chat_whole_file('remove-all-comments', code_to_fix, model, usage)
+                whole_file = True
+                prompt = None
+            else:
+                prompt = format_prompt_for_remove_all_comments(code_to_fix, "swift")
+                validator = lambda raw: validate_comment_free_output(
+                    code_to_fix, clean_removed_comments_output(raw, code_to_fix))
+                stream_validator_factory = lambda: literal_validator(code_to_fix)
         elif is_renumber_verses_request:
             logging.info("[RENUMBER_VERSES] USING RENUMBER VERSES LOGIC")
             
@@ -531,29 +804,28 @@ def chat_completions():
                 code_to_fix = direct_code.strip()
                 logging.info(f"[RENUMBER_VERSES] Using direct 'code' field")
             else:
-                # Extract code - try to get code block or variable assignment
-                code_to_fix = user_message
-                
-                # Try to extract code from markdown blocks first
-                code_block_match = re.search(r'```[\w]*\n(.*?)\n```', user_message, re.DOTALL)
-                if code_block_match:
-                    code_to_fix = code_block_match.group(1).strip()
-                    logging.info(f"[OK] Extracted code from markdown block: {code_to_fix[:80]}...")
-                else:
-                    # Try to extract variable assignment
-                    full_code_match = re.search(
-                        r'((?:private\s+|public\s+|internal\s+)?(?:let|var|const)\s+\w+\s*=\s*\[.*?\])',
-                        user_message,
-                        re.DOTALL | re.IGNORECASE
-                    )
-                    if full_code_match:
-                        code_to_fix = full_code_match.group(1).strip()
-                        logging.info(f"[OK] Extracted variable assignment: {code_to_fix[:80]}...")
+                # A code block, or every array declaration in the message
+                code_to_fix = extract_code(user_message)
+                logging.info(f"[OK] Extracted code: {code_to_fix[:80]}...")
             
             logging.info(f"[RENUMBER_VERSES] Code to process: {code_to_fix[:200]}...")
             
-            # Call renumber_verses_with_ai directly (it handles its own prompt internally)
-            response_text = renumber_verses_with_ai(code_to_fix, model=model)
+            if has_several_arrays(code_to_fix):
+                response_text = chat_whole_file('renumber-verses', code_to_fix, model, usage)
+                whole_file = True
+            else:
+                too_large = check_input('renumber-verses', code_to_fix, model)
+                if too_large:
+                    return jsonify({
+                        "error": {
+                            "message": too_large,
+                            "type": "invalid_request_error"
+                        }
+                    }), 413
+
+                # Call the renumber cascade directly (it handles its own prompt internally)
+                with usage_scope(usage):
+                    response_text, model = run_for_client(renumber_verses_with_cascade, code_to_fix, model=model)
             
             # Don't send to Ollama again - we already have the response
             # Skip the normal prompt processing
@@ -566,52 +838,48 @@ def chat_completions():
                 code_to_fix = direct_code.strip()
                 logging.info(f"[ARRAY] Using direct 'code' field")
             else:
-                # Extract code properly - handle Continue's format with file paths
-                # Pattern 1: Try to extract full code with variable assignment
-                # Matches: private let text = [...] or let text = [...] or var x = [...]
-                full_code_match = re.search(
-                    r'((?:private\s+|public\s+|internal\s+)?(?:let|var|const)\s+\w+\s*=\s*\[.*\])',
-                    user_message,
-                    re.DOTALL | re.IGNORECASE
-                )
-                
-                if full_code_match:
-                    code_to_fix = full_code_match.group(1).strip()
-                    logging.info(f"[OK] Extracted full code with variable: {code_to_fix[:80]}...")
-                else:
-                    # Pattern 2: Fall back to just extracting the array
-                    array_match = re.search(r'(\[.*\])', user_message, re.DOTALL)
-                    if array_match:
-                        code_to_fix = array_match.group(1).strip()
-                        print(f"[OK] Extracted array only: {code_to_fix[:80]}...")
-                    else:
-                        # Pattern 3: Use the whole message as last resort
-                        code_to_fix = user_message
-                        print("[WARNING] Using whole message as code")
+                # Array declarations (or a bare array) in Continue's message,
+                # the whole message as a last resort
+                code_to_fix = extract_code(user_message, bare=True)
+                logging.info(f"[OK] Extracted code: {code_to_fix[:80]}...")
             
-            prompt = format_prompt_for_array_comments(code_to_fix, "swift")
+            if has_several_arrays(code_to_fix):
+                response_text = chat_whole_file('fix-array-comments', code_to_fix, model, usage)
+                whole_file = True
+                prompt = None
+            else:
+                prompt = format_prompt_for_array_comments(code_to_fix, "swift")
+                validator = lambda raw: validate_numbered_output(
+                    code_to_fix, clean_model_output(raw, code_to_fix))
+                stream_validator_factory = lambda: numbering_validator(code_to_fix)
         else:
             logging.info("[CHAT] USING REGULAR CHAT LOGIC")
-            # Use normal conversation
-            prompt = ""
-            for message in messages:
-                role = message.get('role', '')
-                content = message.get('content', '')
-                if role == 'system':
-                    prompt += f"System: {content}\n\n"
-                elif role == 'user':
-                    prompt += f"User: {content}\n\n"
-                elif role == 'assistant':
-                    prompt += f"Assistant: {content}\n\n"
-                else:
-                    prompt += f"{content}\n\n"
-            prompt += "Assistant:"
+            # Normal conversation through Ollama's chat API, windowed per session
+            conv_id = conversation_id(data, request.headers)
+            with usage_scope(usage):
+                response_text = run_for_client(chat_turn, model, messages, conv_id)
+            prompt = None
+
+        if prompt is not None:
+            endpoint = 'chat-remove-all-comments' if is_remove_comments_request else 'chat-fix-array-comments'
+            too_large = plan_budget(endpoint, prompt, model).error
+            if too_large:
+                return jsonify({
+                    "error": {
+                        "message": too_large,
+                        "type": "invalid_request_error"
+                    }
+                }), 413
 
         # Only call Ollama if we haven't already processed the request
         if prompt is not None:
-            print(f"[SEND] Sending prompt to Ollama...")
-            response_text = call_ollama_smart(model, prompt)
-            print(f"[RESPONSE] Ollama response: {response_text[:200]}...")
+            print(f"[SEND] Sending prompt to Ollama (cascade)...")
+            with usage_scope(usage):
+                response_text, model = run_for_client(
+                    call_ollama_cascade, model, prompt, validator, endpoint=endpoint,
+                    stream_validator_factory=stream_validator_factory
+                )
+            print(f"[RESPONSE] Ollama response from {model}: {response_text[:200]}...")
         else:
             print(f"[SKIP] Skipping Ollama call - response already generated")
             print(f"[RESPONSE] Pre-generated response: {response_text[:200]}...")
@@ -625,7 +893,7 @@ def chat_completions():
             }), 500
         
         # Clean the output for remove comments requests
-        if is_remove_comments_request and 'code_to_fix' in locals():
+        if is_remove_comments_request and 'code_to_fix' in locals() and not whole_file:
             print("[CLEAN] Cleaning output (remove comments mode)...")
             logging.info("[CLEAN] Cleaning output (remove comments mode)...")
             
@@ -653,7 +921,7 @@ def chat_completions():
                 logging.warning(f"[WARNING] Cleaning failed: {cleaned}")
         
         # Clean the output for array requests
-        elif is_array_request and 'code_to_fix' in locals():
+        elif is_array_request and 'code_to_fix' in locals() and not whole_file:
             print("[CLEAN] Cleaning model output...")
             cleaned = clean_model_output(response_text, code_to_fix)
             
@@ -676,9 +944,13 @@ def chat_completions():
             else:
                 print(f"[WARNING] Cleaning failed: {cleaned}")
 
-        # Convert to OpenAI format
-        prompt_tokens = len(prompt.split()) if prompt else 0
-        completion_tokens = len(response_text.split())
+        # Convert to OpenAI format, with Ollama's eval counts when it reported them
+        if usage["calls"]:
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage["completion_tokens"]
+        else:
+            prompt_tokens = estimate_tokens(prompt, model) if prompt else 0
+            completion_tokens = estimate_tokens(response_text, model)
         
         openai_response = {
             "id": f"chatcmpl-{int(time.time())}",
@@ -716,40 +988,50 @@ def chat_completions():
                 # Split response into chunks for streaming
                 chunks = [response_text[i:i+50] for i in range(0, len(response_text), 50)]
                 
-                for chunk in chunks:
-                    chunk_data = {
+                try:
+                    for chunk in chunks:
+                        chunk_data = {
+                            "id": response_id,
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"content": chunk},
+                                "finish_reason": None
+                            }]
+                        }
+                        yield f"data: {json.dumps(chunk_data)}\n\n"
+                
+                    # Send final chunk
+                    final_chunk = {
                         "id": response_id,
                         "object": "chat.completion.chunk",
                         "created": int(time.time()),
                         "model": model,
                         "choices": [{
                             "index": 0,
-                            "delta": {"content": chunk},
-                            "finish_reason": None
+                            "delta": {},
+                            "finish_reason": "stop"
                         }]
                     }
-                    yield f"data: {json.dumps(chunk_data)}\n\n"
-                
-                # Send final chunk
-                final_chunk = {
-                    "id": response_id,
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [{
-                        "index": 0,
-                        "delta": {},
-                        "finish_reason": "stop"
-                    }]
-                }
-                yield f"data: {json.dumps(final_chunk)}\n\n"
-                yield "data: [DONE]\n\n"
+                    yield f"data: {json.dumps(final_chunk)}\n\n"
+                    yield "data: [DONE]\n\n"
+                except GeneratorExit:
+                    # Closed before [DONE]: the client went away mid-stream
+                    increment('client_disconnects', path='/v1/chat/completions')
+                    logging.info("[STREAM] Client disconnected during SSE response")
+                    raise
             
             return app.response_class(generate(), mimetype='text/event-stream')
         else:
             print("[OUTPUT] Sending NON-STREAMING response")
             return jsonify(openai_response)
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         print(f"[ERROR] Error in chat_completions: {str(e)}")
         import traceback
@@ -765,35 +1047,20 @@ def chat_completions():
 @app.route('/v1/models', methods=['GET'])
 def list_models_openai():
     """OpenAI-compatible models endpoint"""
-    try:
-        models = []
-        if check_ollama_availability():
-            session = create_ollama_session()
-            response = session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
-            models_data = response.json()
-            models = [model["name"] for model in models_data.get("models", [])]
-        else:
-            models = get_available_models_cli() if not IS_REMOTE else []
-        
-        models_list = [{
-            "id": model_name,
-            "object": "model",
-            "created": int(time.time()),
-            "owned_by": "ollama"
-        } for model_name in models]
+    snapshot = get_ollama_snapshot()
+    created = int(snapshot.checked_at or time.time())
 
-        return jsonify({
-            "object": "list",
-            "data": models_list
-        })
+    models_list = [{
+        "id": model_name,
+        "object": "model",
+        "created": created,
+        "owned_by": "ollama"
+    } for model_name in snapshot.models]
 
-    except Exception as e:
-        return jsonify({
-            "error": {
-                "message": f"Failed to get models: {str(e)}",
-                "type": "internal_server_error"
-            }
-        }), 500
+    return jsonify({
+        "object": "list",
+        "data": models_list
+    })
 
 
 @app.route('/api/adjust-liturgical-verses', methods=['POST'])
@@ -808,22 +1075,43 @@ def adjust_liturgical_verses():
         if not code:
             return jsonify({"error": "No code provided"}), 400
 
+        bad_shape = check_shape(data)
+        if bad_shape:
+            return jsonify({"error": bad_shape}), 400
+
+        # 'deterministic' (default) segments locally; 'ai' uses the model throughout
+        method = data.get('method', 'deterministic')
+
         # Step 1: Parse verses from array
-        verses = parse_verses_from_array(code)
+        if method == 'ai':
+            verses = parse_verses_from_array(code)
+        else:
+            verses, continuation, gap = parse_verse_lines(code)
         if not verses:
             return jsonify({"error": "No verses found in array"}), 400
 
-        # Step 2: Analyze current structure
-        analysis = analyze_verse_structure_with_ai(verses)
-        
-        # Step 3: Adjust to target count
-        adjustment = adjust_verses_to_count(verses, analysis, target_count)
+        if method == 'ai':
+            # Step 2: Analyze current structure
+            analysis = run_for_client(analyze_verse_structure_with_ai, verses)
+            
+            # Step 3: Adjust to target count
+            adjustment = run_for_client(adjust_verses_to_count, verses, analysis, target_count)
+        else:
+            # Steps 2-3: Local segmentation, the model only reviews on request
+            analysis = create_fallback_analysis(verses)
+            adjustment = segment_verses(verses, target_count, continuation, gap)
+            if adjustment is None:
+                return jsonify({
+                    "error": f"Cannot divide {len(verses)} lines into {target_count} verses"
+                }), 400
+            if data.get('ai_review'):
+                adjustment = run_for_client(review_segmentation_with_ai, adjustment, target_count, model)
         
         # Step 4: Generate new array
         new_verses = [v["content"] for v in adjustment["new_verses"]]
         new_array = generate_swift_array(new_verses)
 
-        return jsonify({
+        return jsonify(shape_response(data, code, {
             "original_verse_count": len(verses),
             "target_verse_count": target_count,
             "new_verse_count": len(new_verses),
@@ -831,9 +1119,14 @@ def adjust_liturgical_verses():
             "adjusted_code": new_array,
             "analysis": analysis,
             "adjustment_explanation": adjustment.get("explanation", ""),
+            "method": adjustment.get("method", method),
             "success": True
-        })
+        }, 'adjusted_code'))
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": f"Liturgical processing error: {str(e)}"}), 500
 
@@ -886,14 +1179,7 @@ def renumber_verses_endpoint():
         if code_file:
             # Read code from file
             try:
-                import os
-                if not os.path.isabs(code_file):
-                    code_file_path = os.path.join(os.getcwd(), code_file)
-                else:
-                    code_file_path = code_file
-                
-                with open(code_file_path, 'r', encoding='utf-8') as f:
-                    code = f.read()
+                code = read_code_file(code_file)
                 logging.info(f"[RENUMBER_VERSES] Loaded code from file: {code_file}")
             except FileNotFoundError:
                 return jsonify({"error": f"Code file not found: {code_file}"}), 400
@@ -910,21 +1196,196 @@ def renumber_verses_endpoint():
         
         model = data.get('model', DEFAULT_MODEL) 
 
-        # Call the renumber function from liturgical_processor
-        result = renumber_verses_with_ai(code, model=model)
-        
-        if result.startswith("Error:"):
-            return jsonify({"error": result}), 500
+        if has_several_arrays(code) and not wants_incremental(data):
+            return whole_file_response('renumber-verses', code, data, model)
 
-        return jsonify({
+        too_large = check_input('renumber-verses', code, model)
+        if too_large:
+            return jsonify({"error": too_large}), 413
+
+        bad_shape = check_shape(data)
+        if bad_shape:
+            return jsonify({"error": bad_shape}), 400
+
+        if wants_incremental(data):
+            return incremental_response('renumber-verses', code, data, model)
+
+        result = run_for_client(run_operation, 'renumber-verses', code, model)
+        if "error" in result:
+            return jsonify(result), 500
+
+        return jsonify(shape_response(data, code, {
             "original_code": code,
-            "renumbered_code": result,
+            "renumbered_code": result["renumbered_code"],
+            "model_used": result["model_used"],
+            "repaired": result.get("repaired"),
             "success": True
-        })
+        }, 'renumbered_code'))
 
+    except ClientDisconnected:
+        return client_gone()
+    except DeadlineExceeded as e:
+        return deadline_exceeded(e)
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Counters and latency percentiles collected in this process"""
+    return jsonify({
+        "metrics": metrics_snapshot(),
+        "queue": queue_stats(),
+        "local_workers": LOCAL_POOL.stats(),
+        "translation_memory": TRANSLATION_MEMORY.stats(),
+        "paradigms": PARADIGMS.stats(),
+        "shared_store": SHARED_STORE.describe(),
+        "timeouts": {model: round(adaptive_timeout(model), 1) for model in get_ollama_snapshot().models}
+    })
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Ids of the stored request profiles, newest first"""
+    if not profiling.is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"profiles": profiling.list_profiles(), "directory": profiling.PROFILE_DIR})
+
+@app.route('/api/profiles/continuous', methods=['GET'])
+def continuous_profile():
+    """Hot stacks aggregated by the continuous sampler"""
+    if not profiling.is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    if profiling.CONTINUOUS is None:
+        return jsonify({"error": "Continuous profiling is off (set PROFILE_CONTINUOUS_HZ)"}), 404
+
+    samples, total = profiling.CONTINUOUS.snapshot()
+    if request.args.get('format') == 'collapsed':
+        return app.response_class(profiling.collapsed(samples), mimetype='text/plain')
+    top = int(request.args.get('top', 20))
+    return jsonify({
+        "samples": total,
+        "since": profiling.CONTINUOUS.started,
+        "hot_stacks": [{"stack": [f[0] for f in stack], "samples": count,
+                        "share": round(count / total, 4) if total else None}
+                       for stack, count in samples.most_common(top)]
+    })
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """One stored profile as speedscope JSON (default) or collapsed stacks"""
+    if not profiling.is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    fmt = request.args.get('format', 'speedscope')
+    if not re.fullmatch(r'[0-9a-f]{16}', profile_id) or fmt not in ('speedscope', 'collapsed'):
+        return jsonify({"error": "Invalid profile id or format"}), 400
+    path = profiling.profile_path(profile_id, fmt)
+    if not os.path.exists(path):
+        return jsonify({"error": f"Profile not found: {profile_id}"}), 404
+    with open(path, 'r', encoding='utf-8') as f:
+        body = f.read()
+    return app.response_class(body, mimetype='application/json' if fmt == 'speedscope' else 'text/plain')
+
+def run_batch_item(index, item, default_model):
+    """Resolve one batch item's input and run its operation"""
+    operation = item.get('operation')
+    model = item.get('model', default_model)
+    language = item.get('language', 'swift')
+    started = time.time()
+
+    code = item.get('code')
+    code_file = item.get('code_file')
+    if code_file:
+        try:
+            code = read_code_file(code_file, root=BATCH_CODE_ROOT)
+        except FileNotFoundError:
+            return {"error": f"Code file not found: {code_file}"}
+        except PermissionError:
+            return {"error": f"Code file not allowed: {code_file}"}
+        except Exception as e:
+            return {"error": f"Error reading code file: {str(e)}"}
+
+    if not code or not code.strip():
+        return {"error": "No code provided (use 'code' or 'code_file' parameter)"}
+
+    result = run_operation(operation, code.strip(), model, language)
+    result["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+    return result
+
+@app.route('/api/batch', methods=['POST'])
+def batch_operations():
+    """Run many operations in one request, streaming NDJSON results as they finish"""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('items'), list):
+        return jsonify({"error": "No items provided"}), 400
+
+    items = data['items']
+    if not items:
+        return jsonify({"error": "Empty items list"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items: {len(items)} (max {BATCH_MAX_ITEMS})"}), 400
+
+    default_model = data.get('model', DEFAULT_MODEL)
+    started = time.time()
+    logging.info(f"[BATCH] {len(items)} items, queue {queue_stats()}")
+
+    futures = {}
+    early = []
+    # Cancelled when the client stops reading, so queued items never start
+    token = CancelToken()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            early.append((index, {}, {"error": "Item must be an object"}))
+            continue
+        operation = OPERATIONS.get(item.get('operation'))
+        if operation is None:
+            early.append((index, item, {"error": f"Unknown operation: {item.get('operation')}"}))
+            continue
+        # Deterministic work takes the fast path, model calls wait in the queue
+        submit = submit_model_task if operation.uses_model else submit_fast_task
+        with token_scope(token):
+            futures[submit(run_batch_item, index, item, default_model)] = (index, item)
+
+    def result_line(index, item, result):
+        line = {"index": index, "operation": item.get('operation')}
+        if 'id' in item:
+            line["id"] = item['id']
+        line["success"] = "error" not in result
+        line.update(result)
+        return json.dumps(line) + "\n"
+
+    def generate():
+        failed = 0
+        for index, item, result in early:
+            failed += 1
+            yield result_line(index, item, result)
+
+        try:
+            for future in as_completed(futures):
+                index, item = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": f"Server error: {str(e)}"}
+                if "error" in result:
+                    failed += 1
+                yield result_line(index, item, result)
+        except GeneratorExit:
+            for future in futures:
+                future.cancel()
+            token.cancel("client disconnected")
+            increment('client_disconnects', path='/api/batch')
+            logging.info("[BATCH] Client disconnected, remaining items cancelled")
+            raise
+
+        yield json.dumps({
+            "done": True,
+            "total": len(items),
+            "succeeded": len(items) - failed,
+            "failed": failed,
+            "elapsed_ms": round((time.time() - started) * 1000, 1)
+        }) + "\n"
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 if __name__ == '__main__':
     print(f"[START] Starting Enhanced Python coding server on port {PORT}")
     print(f"[INFO] Default model: {DEFAULT_MODEL}")
@@ -932,16 +1393,17 @@ if __name__ == '__main__':
     print(f"[INFO] Health check: http://localhost:{PORT}/health")
     print(f"[INFO] Fix array comments: http://localhost:{PORT}/api/fix-array-comments")
     print(f"[INFO] Latin analysis: http://localhost:{PORT}/api/analyze-latin-word")
+    print(f"[INFO] Batch operations: http://localhost:{PORT}/api/batch")
     print(f"[INFO] OpenAI API: http://localhost:{PORT}/v1/chat/completions")
     
     # Initial Ollama check
     if check_ollama_availability():
-        if IS_REMOTE:
+        if get_ollama_snapshot().is_remote:
             print("[OK] Connected to REMOTE Ollama server")
         else:
             print("[OK] Connected to LOCAL Ollama server")
     else:
-        if IS_REMOTE:
+        if get_ollama_snapshot().is_remote:
             print("[ERROR] Cannot connect to REMOTE Ollama server")
         else:
             print("[ERROR] Cannot connect to LOCAL Ollama server - will use CLI fallback")
@@ -0,0 +1,82 @@
+import os
+import time
+import logging
+
+from flask import request, g
+
+from metrics import increment
+from request_context import set_deadline, reset_deadline
+
+# End-to-end request deadlines. A request may send X-Request-Timeout
+# (seconds); otherwise, or if it asks for more, the route's deadline
+# applies. The deadline is a context variable, so it follows the work
+# into the scheduler, bounds every Ollama call and fallback, and lets the
+# queue shed work that cannot finish in time (504 instead of a late
+# answer nobody waits for).
+#
+# REQUEST_DEADLINE: default seconds for every route, 0 for none.
+# ROUTE_DEADLINES: per-route overrides, "path=seconds,path=seconds".
+
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 600))
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Interactive lookups are useless to an editor after a minute
+ROUTE_DEADLINES = {
+    '/api/analyze-latin-word': 60.0,
+    '/api/analyze-latin': 120.0,
+}
+
+
+def _parse_routes(spec):
+    routes = {}
+    for item in spec.split(','):
+        path, _, seconds = item.partition('=')
+        try:
+            routes[path.strip()] = float(seconds)
+        except ValueError:
+            if item.strip():
+                logging.warning(f"[DEADLINE] Ignoring ROUTE_DEADLINES entry {item!r}")
+    return routes
+
+
+ROUTE_DEADLINES.update(_parse_routes(os.getenv('ROUTE_DEADLINES', '')))
+
+
+def request_timeout():
+    """Seconds this request may take: the client's timeout capped by the route's, or None"""
+    route = ROUTE_DEADLINES.get(request.path, REQUEST_DEADLINE) or None
+    try:
+        client = float(request.headers.get(DEADLINE_HEADER, ''))
+    except ValueError:
+        client = None
+    if client is not None and client > 0:
+        return min(client, route) if route else client
+    return route
+
+
+def start_deadline():
+    """before_request hook"""
+    timeout = request_timeout()
+    if timeout is None:
+        return
+    g.deadline_reset = set_deadline(time.time() + timeout)
+
+
+def end_deadline(exc=None):
+    """teardown_request hook"""
+    reset = g.pop('deadline_reset', None)
+    if reset is not None:
+        reset_deadline(reset)
+
+
+def deadline_error(reason):
+    """Body and status for a request that cannot finish by its deadline"""
+    increment('deadline_exceeded', path=request.path)
+    logging.info(f"[DEADLINE] {request.path}: {reason}")
+    return {"error": f"Deadline exceeded: {reason}"}, 504
+
+
+def install(app):
+    """Register the hooks that set and clear the request deadline"""
+    app.before_request(start_deadline)
+    app.teardown_request(end_deadline)
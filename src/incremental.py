@@ -0,0 +1,204 @@
+import os
+import difflib
+import hashlib
+import logging
+from collections import namedtuple
+
+from operations import run_operation
+from code_processor import strip_code_fence
+from swift_array import tokenize, parse_array_elements, number_elements
+from shared_store import STORE
+
+INCREMENTAL_CACHE_SIZE = int(os.getenv('INCREMENTAL_CACHE_SIZE', 256))
+INCREMENTAL_CACHE_TTL = float(os.getenv('INCREMENTAL_CACHE_TTL', 86400))
+
+# Operations whose output labels every element with /* N */; after splicing
+# the labels are renumbered so insertions and deletions shift the tail.
+NUMBERING_OPERATIONS = {'fix-array-comments', 'renumber-verses', 'number-elements'}
+RESULT_FIELDS = {
+    'fix-array-comments': 'corrected_code',
+    'number-elements': 'corrected_code',
+    'renumber-verses': 'renumbered_code',
+    'remove-all-comments': 'cleaned_code',
+    'strip-comments': 'cleaned_code',
+}
+
+# A processed document remembered for the next incremental request. States
+# live in the shared store so a follow-up request can land on any worker.
+# prefix and suffix are the input's code around the elements; only
+# documents whose code outside the elements is unchanged are spliced.
+DocumentState = namedtuple('DocumentState', ['hash', 'operation', 'model', 'element_texts', 'output',
+                                             'prefix', 'suffix'], defaults=(None, None))
+
+
+def content_hash(code):
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def _remember(state, document_id=None):
+    keys = [f"hash:{state.hash}:{state.operation}:{state.model}"]
+    if document_id is not None:
+        keys.append(f"doc:{document_id}")
+    for key in keys:
+        STORE.set('incremental', key, state._asdict(),
+                  ttl=INCREMENTAL_CACHE_TTL, max_entries=INCREMENTAL_CACHE_SIZE)
+
+
+def _lookup(operation, model, base_hash=None, document_id=None):
+    data = None
+    if base_hash:
+        data = STORE.get('incremental', f"hash:{base_hash}:{operation}:{model}")
+    if data is None and document_id:
+        data = STORE.get('incremental', f"doc:{document_id}")
+    if data is None or data["operation"] != operation or data["model"] != model:
+        return None
+    return DocumentState(**data)
+
+
+def element_chunks(code):
+    """Split an array into prefix, one chunk per element line(s) and suffix
+
+    Returns (texts, prefix, chunks, suffix) or None when elements share a
+    line, in which case the document can't be spliced element by element.
+    """
+    elements = parse_array_elements(code)
+    if not elements:
+        return None
+
+    bounds = []
+    for element in elements:
+        start = element.number_span[0] if element.number_span else element.start
+        bounds.append(code.rfind('\n', 0, start) + 1)
+
+    # The last chunk runs to the end of the last element's line
+    last_end = code.find('\n', elements[-1].end)
+    bounds.append(len(code) if last_end == -1 else last_end + 1)
+
+    if any(b >= a for b, a in zip(bounds, bounds[1:])):
+        return None
+
+    chunks = [code[bounds[i]:bounds[i + 1]] for i in range(len(elements))]
+    return [e.text for e in elements], code[:bounds[0]], chunks, code[bounds[-1]:]
+
+
+def process_window(operation, chunks, model, language):
+    """Run the operation on a few element chunks wrapped as a small array"""
+    window = "let window = [\n" + ''.join(chunks) + "]"
+    result = run_operation(operation, window, model, language)
+    if "error" in result:
+        return None, result["error"]
+
+    output = strip_code_fence(result[RESULT_FIELDS[operation]])
+    split = element_chunks(output)
+    if split is None or len(split[2]) != len(chunks):
+        return None, "window output does not line up with its input"
+    return split[2], None
+
+
+def ensure_comma(chunk):
+    """Add a comma after the chunk's last string literal if it has none"""
+    tokens = tokenize(chunk)
+    last_string = max((i for i, t in enumerate(tokens) if t.kind == 'string'), default=None)
+    if last_string is None or any(t.kind == 'comma' for t in tokens[last_string + 1:]):
+        return chunk
+    end = tokens[last_string].end
+    return chunk[:end] + ',' + chunk[end:]
+
+
+def line_edits(old, new):
+    """Minimal line-level edits turning old into new"""
+    old_lines = old.split('\n')
+    new_lines = new.split('\n')
+    edits = []
+    matcher = difflib.SequenceMatcher(a=old_lines, b=new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        edits.append({
+            "op": tag,
+            "start_line": i1,
+            "end_line": i2,
+            "lines": new_lines[j1:j2]
+        })
+    return edits
+
+
+def process_incremental(operation, code, model, language='swift', base_hash=None, document_id=None):
+    """Process code, reusing the remembered result for unchanged elements
+
+    Falls back to processing the whole document when there is no usable
+    base state. The result carries the usual output field plus
+    "content_hash" for the next request, "edits" against the base output
+    and "incremental" statistics.
+    """
+    if operation not in RESULT_FIELDS:
+        return {"error": f"Incremental mode not supported for {operation}"}
+
+    field = RESULT_FIELDS[operation]
+    new_hash = content_hash(code)
+    split = element_chunks(code)
+    base = _lookup(operation, model, base_hash, document_id)
+    stats = {"base_found": base is not None, "reused_elements": 0, "reprocessed_elements": 0}
+
+    output = None
+    if base is not None and split is not None:
+        base_split = element_chunks(base.output)
+        if (split[1], split[3]) != (base.prefix, base.suffix):
+            logging.info("[INCREMENTAL] Code outside the elements changed, reprocessing whole document")
+        elif base_split is not None and len(base_split[2]) == len(base.element_texts):
+            output = _splice(operation, model, language, base, base_split, split, stats)
+
+    if output is None:
+        result = run_operation(operation, code, model, language)
+        if "error" in result:
+            return result
+        output = strip_code_fence(result[field])
+        stats["reused_elements"] = 0
+        stats["reprocessed_elements"] = len(split[0]) if split else 0
+        stats["mode"] = "full"
+    else:
+        stats["mode"] = "incremental"
+
+    if split is not None:
+        _remember(DocumentState(new_hash, operation, model, split[0], output, split[1], split[3]), document_id)
+
+    logging.info(f"[INCREMENTAL] {operation} {stats}")
+    return {
+        field: output,
+        "content_hash": new_hash,
+        "base_hash": base.hash if base else None,
+        "edits": line_edits(base.output, output) if base else None,
+        "incremental": stats
+    }
+
+
+def _splice(operation, model, language, base, base_split, split, stats):
+    """Assemble the new output from reused and reprocessed element chunks"""
+    texts, _, chunks, _ = split
+    _, base_prefix, base_chunks, base_suffix = base_split
+
+    body = []
+    matcher = difflib.SequenceMatcher(a=base.element_texts, b=texts, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            body.extend(base_chunks[i1:i2])
+            stats["reused_elements"] += i2 - i1
+        elif tag == 'delete':
+            continue
+        else:
+            processed, error = process_window(operation, chunks[j1:j2], model, language)
+            if processed is None:
+                logging.info(f"[INCREMENTAL] Window {j1}:{j2} failed ({error}), reprocessing whole document")
+                return None
+            body.extend(processed)
+            stats["reprocessed_elements"] += j2 - j1
+
+    # A reused chunk that used to be last may now need a separator
+    for i, chunk in enumerate(body[:-1]):
+        body[i] = ensure_comma(chunk)
+
+    output = base_prefix + ''.join(body) + base_suffix
+    if operation in NUMBERING_OPERATIONS:
+        output = number_elements(output)
+    return output
+
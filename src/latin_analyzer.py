@@ -1,5 +1,5 @@
 # src/latin_analyzer.py
-import re
+from latin_normalize import latin_words
 
 def create_latin_analysis_prompt(text, language="latin"):
     """Create specialized prompt for classical language analysis"""
@@ -44,6 +44,4 @@ Translation and Analysis:"""
 
 def extract_latin_words(text):
     """Extract individual Latin words for analysis"""
-    # Simple Latin word extraction - you can enhance this
-    words = re.findall(r'\b[a-zA-ZāēīōūĀĒĪŌŪ]+\b', text)
-    return [word for word in words if len(word) > 1]
\ No newline at end of file
+    return [word for word in latin_words(text) if len(word) > 1]
\ No newline at end of file
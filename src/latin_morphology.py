@@ -1,6 +1,44 @@
 # src/latin_morphology.py
-import re
-import json
+import os
+
+from shared_store import STORE
+from metrics import increment
+from latin_normalize import normalize_word, latin_words
+from structured_output import output_format, parse_json, validate
+from latin_paradigm import LATIN_PARADIGMS, PARADIGMS
+
+LEXICON_CACHE_TTL = float(os.getenv('LEXICON_CACHE_TTL', 7 * 86400))
+LEXICON_CACHE_SIZE = int(os.getenv('LEXICON_CACHE_SIZE', 50000))
+
+# Output schemas passed to Ollama as "format", one per prompt
+_TEXT = {"type": "string"}
+_TRANSLATIONS = {"type": "object", "properties": {"en": _TEXT, "la": _TEXT}, "required": ["en"]}
+_CONFIDENCE = {"type": "string", "enum": ["high", "medium", "low"]}
+_VERB_FIELDS = {
+    "conjugation": {"type": "integer"}, "infinitive": _TEXT, "perfect": _TEXT,
+    "supine": _TEXT, "future": _TEXT,
+}
+_NOUN_FIELDS = {"declension": {"type": "integer"}, "gender": _TEXT, "genitive": _TEXT}
+_NOUN_FORM_FIELDS = {"case": _TEXT, "number": _TEXT}
+_FORM_FIELDS = {"identified_form": _TEXT, "person": _TEXT, "number": _TEXT, "case": _TEXT,
+                "tense": _TEXT, "mood": _TEXT, "voice": _TEXT, "confidence": _CONFIDENCE}
+
+def _morphology_schema(fields, analysis_fields):
+    properties = {"input": _TEXT, "lemma": _TEXT, "part_of_speech": _TEXT}
+    properties.update(fields)
+    properties["translations"] = _TRANSLATIONS
+    properties["analysis"] = {
+        "type": "object",
+        "properties": {name: _FORM_FIELDS[name] for name in analysis_fields},
+        "required": ["confidence"]
+    }
+    return {"type": "object", "properties": properties,
+            "required": ["input", "lemma", "part_of_speech", "translations", "analysis"]}
+
+VERB_SCHEMA = _morphology_schema(
+    _VERB_FIELDS, ["identified_form", "person", "number", "tense", "mood", "voice", "confidence"])
+NOUN_SCHEMA = _morphology_schema(dict(_NOUN_FIELDS, **_NOUN_FORM_FIELDS), ["identified_form", "confidence"])
+GENERAL_SCHEMA = _morphology_schema(dict(_VERB_FIELDS, **_NOUN_FIELDS), list(_FORM_FIELDS))
 
 def create_latin_verb_analysis_prompt(word):
     """Create AI prompt for Latin verb analysis"""
@@ -53,6 +91,7 @@ Respond with EXACTLY this JSON format, no other text:
     "part_of_speech": "noun",
     "declension": 1,
     "gender": "masculine|feminine|neuter",
+    "genitive": "genitive_singular_form",
     "case": "nominative|genitive|dative|accusative|ablative|vocative",
     "number": "singular|plural",
     "translations": {{
@@ -79,8 +118,10 @@ Respond with EXACTLY this JSON format, no other text:
     "conjugation": 1,
     "declension": 1,
     "gender": "masculine|feminine|neuter",
+    "genitive": "genitive_singular_form",
     "infinitive": "infinitive_form",
     "perfect": "perfect_form",
+    "supine": "supine_form",
     "future": "future_form",
     "translations": {{
         "en": "english_translation_here",
@@ -102,18 +143,10 @@ Only include fields you can confidently identify. Use null for unknown values.""
 
 def extract_json_from_response(response):
     """Extract JSON from AI response, handling markdown and other formatting"""
-    # Remove markdown code blocks
-    cleaned = re.sub(r'```json\n?', '', response)
-    cleaned = re.sub(r'\n?```', '', cleaned)
-    cleaned = cleaned.strip()
-    
-    # Try to find JSON object
-    json_match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group())
-        except json.JSONDecodeError:
-            pass
+    # The first complete object; code fences and trailing prose are skipped
+    value, _ = parse_json(response)
+    if isinstance(value, dict):
+        return value
     
     # If no JSON found, return error structure
     return {
@@ -124,23 +157,46 @@ def extract_json_from_response(response):
         "raw_response": response[:500]  # First 500 chars for debugging
     }
 
+def validate_morphology_response(response, schema=None):
+    """Cascade validator: parseable JSON with a lemma and no low confidence"""
+    result = extract_json_from_response(response)
+    if "error" in result:
+        increment('structured_parse_failures', operation='analyze-latin-word')
+        return result["error"]
+    errors = validate(result, schema) if schema else []
+    if errors:
+        increment('structured_schema_failures', operation='analyze-latin-word')
+        return '; '.join(f"{path}: {message}" for path, message in errors[:5])
+    if not result.get("lemma") or result.get("lemma") == "unknown":
+        return "no lemma identified"
+    if not result.get("part_of_speech") or result.get("part_of_speech") == "unknown":
+        return "no part of speech identified"
+    analysis = result.get("analysis")
+    if isinstance(analysis, dict) and analysis.get("confidence") == "low":
+        return "low confidence"
+    return None
+
 def analyze_latin_word_with_ai(word, model='mistral:7b'):
     """Analyze Latin word using AI"""
-    from ollama_client import call_ollama_smart
+    from ollama_client import call_ollama_cascade
     
     # Clean the input
     word = word.strip().lower()
     
     # Choose prompt based on likely part of speech
     if looks_like_verb(word):
-        prompt = create_latin_verb_analysis_prompt(word)
+        prompt, schema = create_latin_verb_analysis_prompt(word), VERB_SCHEMA
     elif looks_like_noun(word):
-        prompt = create_latin_noun_analysis_prompt(word)
+        prompt, schema = create_latin_noun_analysis_prompt(word), NOUN_SCHEMA
     else:
-        prompt = create_general_latin_analysis_prompt(word)
+        prompt, schema = create_general_latin_analysis_prompt(word), GENERAL_SCHEMA
     
-    # Call AI
-    response = call_ollama_smart(model, prompt)
+    # Call AI, small models first when a cascade is configured
+    increment('structured_calls', operation='analyze-latin-word')
+    response, model = call_ollama_cascade(
+        model, prompt, lambda raw: validate_morphology_response(raw, schema),
+        endpoint='analyze-latin-word', output_format=output_format(schema)
+    )
     
     if response.startswith("Error:"):
         return {
@@ -167,19 +223,76 @@ def looks_like_noun(word):
     noun_endings = ['a', 'us', 'um', 'is', 'es', 'em', 'ibus', 'orum', 'arum']
     return any(word.endswith(ending) for ending in noun_endings)
 
+def cached_form_analysis(form, model='mistral:7b'):
+    """Lexicon cache entry for a normalized form, or None
+
+    Forms of a lemma analyzed before are answered from its generated
+    paradigm and written to the lexicon like a model result.
+    """
+    cached = STORE.get('lexicon', f"{model}:{form.key}")
+    increment('lexicon_cache_hits' if cached is not None else 'lexicon_cache_misses')
+    if not LATIN_PARADIGMS:
+        return cached
+    if cached is not None:
+        # Entries from an earlier run seed the paradigms of this one
+        PARADIGMS.add(cached, model)
+        return cached
+    expanded = PARADIGMS.lookup(form, model)
+    if expanded is not None:
+        increment('paradigm_hits')
+        STORE.set('lexicon', f"{model}:{form.key}", expanded, ttl=LEXICON_CACHE_TTL,
+                  max_entries=LEXICON_CACHE_SIZE)
+    return expanded
+
+def store_form_analysis(form, model, result, ttl=LEXICON_CACHE_TTL):
+    """Put a successful analysis in the lexicon; ttl None keeps it until evicted"""
+    if "error" not in result:
+        STORE.set('lexicon', f"{model}:{form.key}", result, ttl=ttl, max_entries=LEXICON_CACHE_SIZE)
+        if LATIN_PARADIGMS:
+            PARADIGMS.add(result, model)
+
+def analyze_canonical_form(form, model='mistral:7b'):
+    """Analysis of a normalized form, through the shared lexicon cache"""
+    cached = cached_form_analysis(form, model)
+    if cached is not None:
+        return cached
+    result = analyze_latin_word_with_ai(form.display, model)
+    store_form_analysis(form, model, result)
+    return result
+
+def with_surface(result, form):
+    """Copy of a canonical analysis labelled with the word as it was written"""
+    result = dict(result)
+    result['input'] = form.surface
+    result['normalized'] = form.key
+    if form.enclitic:
+        result['enclitic'] = form.enclitic
+    return result
+
 def analyze_latin_word(word, model='mistral:7b'):
-    """Main function to analyze Latin word using AI"""
-    return analyze_latin_word_with_ai(word, model)
+    """Main function to analyze Latin word using AI
+
+    Spelling variants, accents and enclitics are normalized first, so
+    every variant of a form shares one lexicon entry and one model call.
+    """
+    form = normalize_word(word)
+    return with_surface(analyze_canonical_form(form, model), form)
+
+def text_forms(text):
+    """Normalized forms of the words in text that are worth analyzing"""
+    forms = [normalize_word(word) for word in latin_words(text)]
+    return [form for form in forms if len(form.surface) > 2]  # Ignore very short words
 
 def analyze_latin_text(text, model='mistral:7b'):
-    """Analyze multiple Latin words in text"""
-    words = re.findall(r'\b[a-zA-ZāēīōūĀĒĪŌŪ]+\b', text)
+    """Analyze multiple Latin words in text, each canonical form once"""
+    forms = text_forms(text)
+    canonical = {}
     analyses = []
-    
-    for word in words:
-        if len(word) > 2:  # Ignore very short words
-            analysis = analyze_latin_word(word, model)
-            analyses.append(analysis)
+
+    for form in forms:
+        if form.key not in canonical:
+            canonical[form.key] = analyze_canonical_form(form, model)
+        analyses.append(with_surface(canonical[form.key], form))
     
     return {
         "original_text": text,
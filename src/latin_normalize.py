@@ -0,0 +1,80 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+# Canonical forms for Latin words, so spelling variants share one lexicon
+# entry and one model call: "Jerusalem"/"Ierusalem", "cæli"/"caeli",
+# "salutáris"/"salutaris", "Dominumque" -> "dominum" + "que".
+#
+#   display  - lowercase, accents and ligatures folded, enclitic removed;
+#              what the model is asked about
+#   key      - display with j -> i and v -> u as well; the cache key
+
+LIGATURES = {'æ': 'ae', 'Æ': 'ae', 'œ': 'oe', 'Œ': 'oe'}
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+# Words ending in -que, -ne, -ve (-ue once folded) that are not an enclitic
+# attached to a shorter word: conjunctions, adverbs in -usque and -que
+# (from adjectives in -quus), and verbs in -quo / -queo
+NOT_ENCLITIC = {
+    'que': {'atque', 'neque', 'usque', 'itaque', 'denique', 'undique', 'ubique', 'utique',
+            'namque', 'plerumque', 'absque', 'unusquisque', 'uniuscuiusque', 'unicuique',
+            'hucusque', 'adusque', 'abusque', 'eousque', 'usquequaque', 'susque', 'deque',
+            'aeque', 'inique', 'oblique', 'antique', 'propinque', 'longinque',
+            'utrobique', 'utrubique', 'alicubique',
+            'linque', 'relinque', 'derelinque', 'torque', 'contorque', 'extorque', 'coque'},
+    'ne': {'nonne', 'sine', 'bene', 'pene', 'paene', 'mane', 'lene'},
+    'ue': {'siue', 'neue', 'seue', 'salue', 'ue', 'aue', 'caue', 'uiue'},
+}
+# The letter before -ne / -ve must be one of these (estne, videsne; plusve,
+# eumve). Not o: bove, move, Iove, nove are whole words far more often
+# than a stem in -o plus -ve.
+ENCLITIC_BEFORE = {'que': None, 'ne': 'st', 'ue': 'sm'}
+# Declined quisque / uterque / quicumque: the -que belongs to the pronoun
+PRONOUN_STEMS = ('qu', 'cu', 'utr', 'uter')
+MIN_STEM = 2
+
+LatinForm = namedtuple('LatinForm', ['surface', 'display', 'key', 'enclitic'])
+
+
+def fold(text):
+    """Lowercase text with ligatures expanded and diacritics removed"""
+    # Decompose first: accented ligatures (ǽ) only become æ + accent here
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    for ligature, expansion in LIGATURES.items():
+        text = text.replace(ligature, expansion)
+    return text.lower()
+
+
+def fold_spelling(text):
+    """Folded text with the i/j and u/v spelling variants merged"""
+    return fold(text).replace('j', 'i').replace('v', 'u')
+
+
+def split_enclitic(display):
+    """(word, enclitic) for a folded word; enclitic is None when there is none"""
+    spelled = display.replace('j', 'i').replace('v', 'u')
+    for enclitic in ('que', 'ne', 'ue'):
+        stem_length = len(spelled) - len(enclitic)
+        if (not spelled.endswith(enclitic) or stem_length < MIN_STEM
+                or spelled in NOT_ENCLITIC[enclitic]):
+            continue
+        if enclitic == 'que' and (spelled.startswith(PRONOUN_STEMS) or spelled.endswith('cumque')):
+            continue
+        before = ENCLITIC_BEFORE[enclitic]
+        if before is not None and spelled[stem_length - 1] not in before:
+            continue
+        return display[:stem_length], 've' if enclitic == 'ue' else enclitic
+    return display, None
+
+
+def normalize_word(word):
+    """LatinForm for one surface word"""
+    display, enclitic = split_enclitic(fold(word.strip()))
+    return LatinForm(word, display, display.replace('j', 'i').replace('v', 'u'), enclitic)
+
+
+def latin_words(text):
+    """Words of text in order, including accented and ligature forms"""
+    return WORD_PATTERN.findall(text)
@@ -0,0 +1,379 @@
+import os
+import re
+import logging
+import threading
+from array import array
+from collections import namedtuple
+
+from metrics import increment
+from latin_normalize import fold, normalize_word
+
+# Regular paradigms from one lemma analysis. When the model identifies a
+# verb's conjugation and principal parts, or a noun's declension, gender
+# and genitive, every regular form of the lemma is generated with its parse
+# and put in an in-memory form index. A later lookup of a related form
+# ("rigabunt" after "rigabo") is answered from the index without a model
+# call. Irregular and deponent verbs, adjectives and participles are not
+# expanded. A lemma is only expanded when its paradigm contains the form
+# that was analyzed, so a wrong conjugation or stem is not multiplied.
+#
+# Records are packed: each form is a dict entry pointing into flat arrays
+# of lemma ids and 16-bit feature codes, so millions of forms fit in a few
+# hundred MB.
+
+LATIN_PARADIGMS = os.getenv('LATIN_PARADIGMS', '1').lower() in ('1', 'true', 'yes')
+PARADIGM_INDEX_SIZE = int(os.getenv('PARADIGM_INDEX_SIZE', 2000000))   # records
+
+# Feature values are interned as their position in these tables and
+# packed into one code: (name, values, bits)
+FEATURES = (
+    ('case', (None, 'nominative', 'genitive', 'dative', 'accusative', 'ablative', 'vocative'), 3),
+    ('number', (None, 'singular', 'plural'), 2),
+    ('person', (None, '1', '2', '3'), 2),
+    ('tense', (None, 'present', 'imperfect', 'future', 'perfect', 'pluperfect', 'future_perfect'), 3),
+    ('mood', (None, 'indicative', 'subjunctive', 'imperative', 'infinitive', 'supine'), 3),
+    ('voice', (None, 'active', 'passive'), 2),
+)
+_SHIFTS = {}
+_shift = 0
+for _name, _values, _bits in FEATURES:
+    _SHIFTS[_name] = _shift
+    _shift += _bits
+
+# Fields of a lemma analysis that hold for all of its forms
+LEMMA_FIELDS = ('lemma', 'part_of_speech', 'conjugation', 'infinitive', 'perfect', 'supine',
+                'future', 'declension', 'gender', 'genitive', 'translations')
+
+Lemma = namedtuple('Lemma', ['model', 'fields', 'confidence'])
+
+
+def pack(**features):
+    code = 0
+    for name, values, _ in FEATURES:
+        code |= values.index(features.get(name)) << _SHIFTS[name]
+    return code
+
+
+def unpack(code):
+    features = {}
+    for name, values, bits in FEATURES:
+        value = values[(code >> _SHIFTS[name]) & ((1 << bits) - 1)]
+        if value is not None:
+            features[name] = value
+    return features
+
+
+def identified_form(features):
+    """Readable description, e.g. "1st person singular future active indicative" """
+    words = []
+    if 'person' in features:
+        words.append({'1': '1st', '2': '2nd', '3': '3rd'}[features['person']] + ' person')
+    for name in ('case', 'number', 'tense', 'voice', 'mood'):
+        if name in features:
+            words.append(features[name].replace('_', ' '))
+    return ' '.join(words)
+
+
+# Verbs. Endings follow the root: the infinitive without -are/-ere/-ire.
+PERSONS = (('1', 'singular'), ('2', 'singular'), ('3', 'singular'),
+           ('1', 'plural'), ('2', 'plural'), ('3', 'plural'))
+ACTIVE = ('m', 's', 't', 'mus', 'tis', 'nt')
+PASSIVE = ('r', 'ris', 'tur', 'mur', 'mini', 'ntur')
+
+PRESENT_ACTIVE = {
+    '1': ('o', 'as', 'at', 'amus', 'atis', 'ant'),
+    '2': ('eo', 'es', 'et', 'emus', 'etis', 'ent'),
+    '3': ('o', 'is', 'it', 'imus', 'itis', 'unt'),
+    '3io': ('io', 'is', 'it', 'imus', 'itis', 'iunt'),
+    '4': ('io', 'is', 'it', 'imus', 'itis', 'iunt'),
+}
+PRESENT_PASSIVE = {
+    '1': ('or', 'aris', 'atur', 'amur', 'amini', 'antur'),
+    '2': ('eor', 'eris', 'etur', 'emur', 'emini', 'entur'),
+    '3': ('or', 'eris', 'itur', 'imur', 'imini', 'untur'),
+    '3io': ('ior', 'eris', 'itur', 'imur', 'imini', 'iuntur'),
+    '4': ('ior', 'iris', 'itur', 'imur', 'imini', 'iuntur'),
+}
+# Future in -bo (1st, 2nd) or -am (3rd, 4th), after the thematic vowel
+FUTURE_VOWEL = {'1': 'a', '2': 'e', '3': '', '3io': 'i', '4': 'i'}
+FUTURE_BO = (('o', 'is', 'it', 'imus', 'itis', 'unt'), ('or', 'eris', 'itur', 'imur', 'imini', 'untur'))
+FUTURE_AM = (('am', 'es', 'et', 'emus', 'etis', 'ent'), ('ar', 'eris', 'etur', 'emur', 'emini', 'entur'))
+IMPERFECT_VOWEL = {'1': 'a', '2': 'e', '3': 'e', '3io': 'ie', '4': 'ie'}
+SUBJUNCTIVE_VOWEL = {'1': 'e', '2': 'ea', '3': 'a', '3io': 'ia', '4': 'ia'}
+INFINITIVE_VOWEL = {'1': 'a', '2': 'e', '3': 'e', '3io': 'e', '4': 'i'}
+PRESENT_PASSIVE_INFINITIVE = {'1': 'ari', '2': 'eri', '3': 'i', '3io': 'i', '4': 'iri'}
+IMPERATIVE = {'1': ('a', 'ate'), '2': ('e', 'ete'), '3': ('e', 'ite'), '3io': ('e', 'ite'), '4': ('i', 'ite')}
+
+PERFECT_SYSTEM = (
+    ('perfect', 'indicative', ('i', 'isti', 'it', 'imus', 'istis', 'erunt')),
+    ('pluperfect', 'indicative', ('eram', 'eras', 'erat', 'eramus', 'eratis', 'erant')),
+    ('future_perfect', 'indicative', ('ero', 'eris', 'erit', 'erimus', 'eritis', 'erint')),
+    ('perfect', 'subjunctive', ('erim', 'eris', 'erit', 'erimus', 'eritis', 'erint')),
+    ('pluperfect', 'subjunctive', ('issem', 'isses', 'isset', 'issemus', 'issetis', 'issent')),
+)
+
+INFINITIVE_ENDINGS = {'1': 'are', '2': 'ere', '3': 'ere', '4': 'ire'}
+
+
+def verb_class(lemma, conjugation, infinitive):
+    """(class, root) for a regular active verb, or None"""
+    ending = INFINITIVE_ENDINGS.get(str(conjugation))
+    if not ending or not infinitive.endswith(ending) or len(infinitive) <= len(ending):
+        return None
+    cls = str(conjugation)
+    if cls == '3' and lemma.endswith('io'):
+        cls = '3io'
+    return cls, infinitive[:-len(ending)]
+
+
+def _persons(stem, endings, tense, mood, voice):
+    for (person, number), ending in zip(PERSONS, endings):
+        yield stem + ending, pack(person=person, number=number, tense=tense, mood=mood, voice=voice)
+
+
+def verb_forms(lemma, conjugation, infinitive, perfect=None, supine=None):
+    """(form, feature code) for every regular form of a verb"""
+    found = verb_class(lemma, conjugation, infinitive)
+    if found is None:
+        return []
+    cls, root = found
+    forms = []
+    forms += _persons(root, PRESENT_ACTIVE[cls], 'present', 'indicative', 'active')
+    forms += _persons(root, PRESENT_PASSIVE[cls], 'present', 'indicative', 'passive')
+
+    imperfect = root + IMPERFECT_VOWEL[cls] + 'ba'
+    forms += _persons(imperfect, ACTIVE, 'imperfect', 'indicative', 'active')
+    forms += _persons(imperfect, PASSIVE, 'imperfect', 'indicative', 'passive')
+
+    if cls in ('1', '2'):
+        future, (active, passive) = root + FUTURE_VOWEL[cls] + 'b', FUTURE_BO
+    else:
+        future, (active, passive) = root + FUTURE_VOWEL[cls], FUTURE_AM
+    forms += _persons(future, active, 'future', 'indicative', 'active')
+    forms += _persons(future, passive, 'future', 'indicative', 'passive')
+
+    subjunctive = root + SUBJUNCTIVE_VOWEL[cls]
+    forms += _persons(subjunctive, ACTIVE, 'present', 'subjunctive', 'active')
+    forms += _persons(subjunctive, PASSIVE, 'present', 'subjunctive', 'passive')
+    infinitive = root + INFINITIVE_VOWEL[cls] + 're'
+    forms += _persons(infinitive, ACTIVE, 'imperfect', 'subjunctive', 'active')
+    forms += _persons(infinitive, PASSIVE, 'imperfect', 'subjunctive', 'passive')
+
+    singular, plural = IMPERATIVE[cls]
+    forms.append((root + singular, pack(person='2', number='singular', tense='present', mood='imperative', voice='active')))
+    forms.append((root + plural, pack(person='2', number='plural', tense='present', mood='imperative', voice='active')))
+    forms.append((infinitive, pack(tense='present', mood='infinitive', voice='active')))
+    forms.append((root + PRESENT_PASSIVE_INFINITIVE[cls], pack(tense='present', mood='infinitive', voice='passive')))
+
+    if perfect and perfect.endswith('i') and len(perfect) > 2:
+        stem = perfect[:-1]
+        for tense, mood, endings in PERFECT_SYSTEM:
+            forms += _persons(stem, endings, tense, mood, 'active')
+        forms.append((stem + 'isse', pack(tense='perfect', mood='infinitive', voice='active')))
+    if supine and supine.endswith('um') and len(supine) > 3:
+        forms.append((supine, pack(case='accusative', mood='supine')))
+        forms.append((supine[:-1], pack(case='ablative', mood='supine')))
+    return forms
+
+
+# Nouns: endings in case order, singular then plural
+CASES = ('nominative', 'genitive', 'dative', 'accusative', 'ablative', 'vocative')
+DECLENSIONS = {
+    (1, 'a'): ('a', 'ae', 'ae', 'am', 'a', 'a', 'ae', 'arum', 'is', 'as', 'is', 'ae'),
+    (2, 'us'): ('us', 'i', 'o', 'um', 'o', 'e', 'i', 'orum', 'is', 'os', 'is', 'i'),
+    (2, 'er'): ('', 'i', 'o', 'um', 'o', '', 'i', 'orum', 'is', 'os', 'is', 'i'),
+    (2, 'um'): ('um', 'i', 'o', 'um', 'o', 'um', 'a', 'orum', 'is', 'a', 'is', 'a'),
+    (3, 'mf'): ('', 'is', 'i', 'em', 'e', '', 'es', 'um', 'ibus', 'es', 'ibus', 'es'),
+    (3, 'n'): ('', 'is', 'i', '', 'e', '', 'a', 'um', 'ibus', 'a', 'ibus', 'a'),
+    (3, 'n-i'): ('', 'is', 'i', '', 'i', '', 'ia', 'ium', 'ibus', 'ia', 'ibus', 'ia'),
+    (4, 'us'): ('us', 'us', 'ui', 'um', 'u', 'us', 'us', 'uum', 'ibus', 'us', 'ibus', 'us'),
+    (4, 'u'): ('u', 'us', 'u', 'u', 'u', 'u', 'ua', 'uum', 'ibus', 'ua', 'ibus', 'ua'),
+    (5, 'es'): ('es', 'ei', 'ei', 'em', 'e', 'es', 'es', 'erum', 'ebus', 'es', 'ebus', 'es'),
+}
+VOWELS = re.compile(r'[aeiouy]+')
+
+
+def noun_class(nominative, declension, gender, genitive):
+    """(declension key, stem) for a regular noun, or None"""
+    neuter = (gender or '').startswith('n')
+    if declension == 1 and nominative.endswith('a'):
+        return (1, 'a'), nominative[:-1]
+    if declension == 2:
+        if nominative.endswith('um'):
+            return (2, 'um'), nominative[:-2]
+        if nominative.endswith('us'):
+            return (2, 'us'), nominative[:-2]
+        if nominative.endswith(('er', 'ir')):
+            # puer, pueri keeps the e; ager, agri drops it
+            stem = genitive[:-1] if genitive and genitive.endswith('i') else nominative
+            return (2, 'er'), stem
+    if declension == 3 and genitive and genitive.endswith('is') and len(genitive) > 2:
+        stem = genitive[:-2]
+        if neuter:
+            return ((3, 'n-i') if nominative.endswith(('e', 'al', 'ar')) else (3, 'n')), stem
+        return (3, 'mf'), stem
+    if declension == 4:
+        if nominative.endswith('u') and neuter:
+            return (4, 'u'), nominative[:-1]
+        if nominative.endswith('us'):
+            return (4, 'us'), nominative[:-2]
+    if declension == 5 and nominative.endswith('es'):
+        return (5, 'es'), nominative[:-2]
+    return None
+
+
+def _i_stem(nominative, genitive, stem):
+    """Masculine and feminine 3rd declension nouns with genitive plural -ium"""
+    if nominative.endswith(('is', 'es')) and len(nominative) == len(genitive):
+        return True   # civis, civis
+    # urbs, urbis; nox, noctis
+    return (len(VOWELS.findall(nominative)) == 1 and len(stem) > 1
+            and not VOWELS.fullmatch(stem[-1]) and not VOWELS.fullmatch(stem[-2]))
+
+
+def noun_forms(nominative, declension, gender=None, genitive=None):
+    """(form, feature code) for every case and number of a noun"""
+    try:
+        declension = int(declension)
+    except (TypeError, ValueError):
+        return []
+    found = noun_class(nominative, declension, gender, genitive)
+    if found is None:
+        return []
+    key, stem = found
+    endings = DECLENSIONS[key]
+    forms = []
+    for i, ending in enumerate(endings):
+        case, number = CASES[i % 6], 'singular' if i < 6 else 'plural'
+        if ending == '' and i < 6 and case in ('nominative', 'vocative', 'accusative'):
+            form = nominative
+        else:
+            form = stem + ending
+        if key == (2, 'us') and case == 'vocative' and number == 'singular' and stem.endswith('i'):
+            form = stem   # filius -> fili
+        if key == (3, 'mf') and case == 'genitive' and number == 'plural' and _i_stem(nominative, genitive, stem):
+            form = stem + 'ium'
+        forms.append((form, pack(case=case, number=number)))
+    return forms
+
+
+def paradigm(result):
+    """(form, feature code) pairs for an analysis' lemma; [] when it can't be expanded"""
+    lemma = fold(str(result.get('lemma') or ''))
+    part_of_speech = str(result.get('part_of_speech') or '').lower()
+    if not lemma or lemma == 'unknown':
+        return []
+    if part_of_speech == 'verb' and result.get('infinitive') and result.get('conjugation'):
+        return verb_forms(lemma, result['conjugation'], fold(result['infinitive']),
+                          fold(result.get('perfect') or ''), fold(result.get('supine') or ''))
+    if part_of_speech == 'noun' and result.get('declension'):
+        return noun_forms(lemma, result['declension'], result.get('gender'),
+                          fold(result.get('genitive') or ''))
+    return []
+
+
+class FormIndex:
+    """Inflected form -> (lemma, features) records held in flat arrays"""
+
+    __slots__ = ('lock', 'max_records', 'forms', 'lemmas', 'lemma_ids',
+                 'record_lemma', 'record_features', 'record_next', 'full')
+
+    def __init__(self, max_records=PARADIGM_INDEX_SIZE):
+        self.lock = threading.Lock()
+        self.max_records = max_records
+        self.forms = {}                    # form key -> newest record
+        self.lemmas = []                   # Lemma per lemma id
+        self.lemma_ids = {}                # (model, part of speech, lemma key) -> lemma id
+        self.record_lemma = array('I')     # record -> lemma id
+        self.record_features = array('H')  # record -> packed features
+        self.record_next = array('i')      # record -> older record of the same form, -1 ends
+        self.full = False
+
+    def add(self, result, model):
+        """Expand an analysis' lemma into the index; returns the number of forms added"""
+        if not isinstance(result, dict) or "error" in result:
+            return 0
+        analysis = result.get("analysis") if isinstance(result.get("analysis"), dict) else {}
+        if analysis.get("confidence") == "low":
+            return 0
+        lemma_key = (model, str(result.get('part_of_speech')).lower(), normalize_word(str(result.get('lemma'))).key)
+        with self.lock:
+            if lemma_key in self.lemma_ids or self.full:
+                return 0
+
+        forms = paradigm(result)
+        if not forms:
+            return 0
+        keys = [normalize_word(form).key for form, _ in forms]
+        if normalize_word(str(result.get('input') or '')).key not in keys:
+            # The analyzed word is not in its own paradigm: wrong class or stem
+            increment('paradigm_inconsistent')
+            return 0
+
+        fields = {name: result[name] for name in LEMMA_FIELDS if result.get(name) is not None}
+        with self.lock:
+            if lemma_key in self.lemma_ids:
+                return 0
+            if len(self.record_lemma) + len(forms) > self.max_records:
+                self.full = True
+                logging.warning(f"[PARADIGM] Index full at {len(self.record_lemma)} records")
+                return 0
+            lemma_id = len(self.lemmas)
+            self.lemma_ids[lemma_key] = lemma_id
+            self.lemmas.append(Lemma(model, fields, analysis.get("confidence") or "medium"))
+            for key, (_, code) in zip(keys, forms):
+                self.record_lemma.append(lemma_id)
+                self.record_features.append(code)
+                self.record_next.append(self.forms.get(key, -1))
+                self.forms[key] = len(self.record_lemma) - 1
+        increment('paradigm_lemmas')
+        increment('paradigm_forms', len(forms))
+        return len(forms)
+
+    def records(self, key, model):
+        """(Lemma, features) for a form key, oldest first"""
+        found = []
+        with self.lock:
+            record = self.forms.get(key, -1)
+            while record >= 0:
+                lemma = self.lemmas[self.record_lemma[record]]
+                if lemma.model == model:
+                    found.append((lemma, unpack(self.record_features[record])))
+                record = self.record_next[record]
+        found.reverse()
+        return found
+
+    def lookup(self, form, model):
+        """Analysis of a normalized form shaped like the model's answer, or None"""
+        found = self.records(form.key, model)
+        if not found:
+            return None
+        lemma, features = found[0]
+        result = dict(lemma.fields)
+        result["input"] = form.display
+        result["analysis"] = dict(features, identified_form=identified_form(features),
+                                  confidence=lemma.confidence)
+        if len(found) > 1:
+            result["alternatives"] = [
+                {"lemma": other.fields.get("lemma"), "part_of_speech": other.fields.get("part_of_speech"),
+                 "analysis": dict(other_features, identified_form=identified_form(other_features))}
+                for other, other_features in found[1:]
+            ]
+        result["source"] = "paradigm"
+        result["model_used"] = model
+        return result
+
+    def stats(self):
+        with self.lock:
+            records = len(self.record_lemma)
+            return {
+                "lemmas": len(self.lemmas),
+                "forms": len(self.forms),
+                "records": records,
+                "record_bytes": records * (self.record_lemma.itemsize + self.record_features.itemsize
+                                           + self.record_next.itemsize),
+                "full": self.full
+            }
+
+
+PARADIGMS = FormIndex()
@@ -0,0 +1,233 @@
+"""Pre-analyze the Latin words of a corpus into the persistent lexicon.
+
+Usage:
+    python src/lexicon_prebuild.py psalms/ canticles/ --store lexicon.sqlite3
+    python src/lexicon_prebuild.py psalter.txt --jobs 4 --model mistral:7b --json
+
+Swift files contribute the string elements of their arrays, other files
+their whole text. Words are normalized as /api/analyze-latin-word does,
+so every spelling variant and enclitic form of a word is analyzed once.
+Forms already in the lexicon are skipped, the rest are analyzed with at
+most --jobs model calls at once and stored without expiry. Progress is
+checkpointed, so an interrupted run resumes with the forms it had not
+finished. Forms in the paradigm of a verb or noun analyzed earlier in
+the run are filled in without a model call. The report gives forms/sec
+and the share of corpus words the lexicon now covers.
+
+Point the server at the same file with SHARED_STORE_PATH to use the
+results.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from swift_array import parse_array_elements
+
+CHECKPOINT_NAME = '.lexicon_checkpoint.json'
+CHECKPOINT_VERSION = 1
+CHECKPOINT_EVERY = 25
+
+
+def corpus_texts(paths, extensions):
+    """(path, text) for every corpus file under paths"""
+    from psalm_cli import find_sources
+
+    for path in paths:
+        sources = [path] if os.path.isfile(path) else find_sources(path, extensions)
+        for source in sources:
+            with open(source, 'r', encoding='utf-8') as f:
+                text = f.read()
+            if source.endswith('.swift'):
+                text = '\n'.join(element.text for element in parse_array_elements(text))
+            yield source, text
+
+
+def collect_forms(texts):
+    """(forms by key, word count per key) over all texts; the first spelling seen is kept"""
+    # Imported late: importing it opens the store that SHARED_STORE_PATH names
+    from latin_morphology import text_forms
+
+    forms, counts = {}, {}
+    for _, text in texts:
+        for form in text_forms(text):
+            forms.setdefault(form.key, form)
+            counts[form.key] = counts.get(form.key, 0) + 1
+    return forms, counts
+
+
+def load_checkpoint(path, model):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('version') == CHECKPOINT_VERSION and checkpoint.get('model') == model:
+            return checkpoint
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": CHECKPOINT_VERSION, "model": model, "done": [], "failed": {},
+            "analyzed": 0, "seconds": 0.0}
+
+
+def save_checkpoint(path, checkpoint):
+    from psalm_cli import atomic_write
+
+    atomic_write(path, json.dumps(checkpoint, indent=1, sort_keys=True, ensure_ascii=False))
+
+
+def prebuild(forms, counts, model, jobs, checkpoint, checkpoint_path, force=False, ttl=None):
+    """Analyze the forms missing from the lexicon; returns the run report"""
+    from latin_morphology import analyze_latin_word_with_ai, cached_form_analysis, store_form_analysis
+    from latin_paradigm import LATIN_PARADIGMS, PARADIGMS
+    from ollama_client import check_ollama_availability
+
+    done = set() if force else set(checkpoint["done"])
+    if force:
+        checkpoint["failed"] = {}
+    pending, cached = [], 0
+    for key, form in forms.items():
+        if key in done:
+            continue
+        if not force and cached_form_analysis(form, model) is not None:
+            cached += 1
+            done.add(key)
+        else:
+            pending.append(form)
+
+    print(f"[PREBUILD] {len(forms)} forms, {len(forms) - len(pending)} already analyzed, "
+          f"{len(pending)} to analyze with {model}, {jobs} jobs")
+
+    def record():
+        checkpoint["done"] = sorted(done)
+        checkpoint["seconds"] = round(previous_seconds + time.time() - started, 3)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    # Probe once up front; concurrent first calls would all see an unprobed snapshot
+    if pending and not check_ollama_availability():
+        print("[PREBUILD] Ollama is not reachable over HTTP, using local workers")
+
+    previous_seconds = checkpoint["seconds"]
+    started = time.time()
+    analyzed = failed = expanded = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+
+    def analyze(form):
+        # A lemma analyzed earlier in the run may already cover this form.
+        # The lexicon was checked above, so only the paradigms are asked.
+        from_paradigm = PARADIGMS.lookup(form, model) if LATIN_PARADIGMS else None
+        return from_paradigm if from_paradigm is not None else analyze_latin_word_with_ai(form.display, model)
+
+    futures = {pool.submit(analyze, form): form for form in pending}
+    try:
+        for future in as_completed(futures):
+            form = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+
+            if "error" in result:
+                failed += 1
+                checkpoint["failed"][form.key] = result["error"]
+                print(f"[ERROR] {form.display}: {result['error']}")
+            else:
+                store_form_analysis(form, model, result, ttl=ttl)
+                analyzed += 1
+                if result.get("source") == "paradigm":
+                    expanded += 1
+                checkpoint["analyzed"] += 1
+                checkpoint["failed"].pop(form.key, None)
+                done.add(form.key)
+
+            if (analyzed + failed) % CHECKPOINT_EVERY == 0:
+                record()
+                rate = analyzed / (time.time() - started)
+                print(f"[PREBUILD] {analyzed + failed}/{len(pending)} ({rate:.2f} forms/sec)")
+    except KeyboardInterrupt:
+        # Queued forms are dropped; the ones in flight are lost and redone next run
+        pool.shutdown(wait=False, cancel_futures=True)
+        record()
+        print(f"[PREBUILD] Interrupted, checkpoint saved to {checkpoint_path}")
+        raise
+    pool.shutdown()
+    record()
+
+    elapsed = time.time() - started
+    total_words = sum(counts.values())
+    covered = [key for key in forms if key in done]
+    return {
+        "forms": len(forms),
+        "words": total_words,
+        "already_analyzed": len(forms) - len(pending),
+        "cached_in_lexicon": cached,
+        "analyzed": analyzed,
+        "from_paradigms": expanded,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "forms_per_second": round(analyzed / elapsed, 3) if elapsed > 0 else None,
+        "total_analyzed": checkpoint["analyzed"],
+        "total_seconds": checkpoint["seconds"],
+        "form_coverage": round(len(covered) / len(forms), 4) if forms else None,
+        "word_coverage": round(sum(counts[key] for key in covered) / total_words, 4) if total_words else None,
+        "missing": sorted(forms[key].display for key in forms if key not in done)[:50]
+    }
+
+
+def print_report(report):
+    print(f"[DONE] {report['analyzed']} analyzed ({report['from_paradigms']} from paradigms), "
+          f"{report['failed']} failed, "
+          f"{report['already_analyzed']} already analyzed in {report['elapsed_seconds']}s "
+          f"({report['forms_per_second']} forms/sec)")
+    print(f"[COVERAGE] {report['form_coverage']:.1%} of {report['forms']} forms, "
+          f"{report['word_coverage']:.1%} of {report['words']} words")
+    if report["missing"]:
+        print(f"[COVERAGE] Missing: {', '.join(report['missing'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-analyze a Latin corpus into the lexicon")
+    parser.add_argument('paths', nargs='+', help="Files or directories to read")
+    parser.add_argument('--store', help="Lexicon SQLite file (default: SHARED_STORE_PATH)")
+    parser.add_argument('--model', default='mistral:7b', help="Model the server analyzes words with")
+    parser.add_argument('--jobs', '-j', type=int, default=2, help="Model calls at once")
+    parser.add_argument('--ext', default='.swift,.txt', help="Comma-separated file extensions")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_NAME, help="Checkpoint file")
+    parser.add_argument('--ttl', type=float, default=0,
+                        help="Seconds the results stay in the lexicon; 0 keeps them")
+    parser.add_argument('--force', action='store_true', help="Ignore the checkpoint and lexicon, analyze everything")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # The store is opened when latin_morphology is first imported
+    if args.store:
+        os.environ['SHARED_STORE_PATH'] = os.path.abspath(args.store)
+    if not os.getenv('SHARED_STORE_PATH'):
+        print("A lexicon store is needed: pass --store or set SHARED_STORE_PATH", file=sys.stderr)
+        return 2
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    extensions = tuple(e.strip() for e in args.ext.split(',') if e.strip())
+    forms, counts = collect_forms(corpus_texts(args.paths, extensions))
+    if not forms:
+        print("No Latin words found", file=sys.stderr)
+        return 1
+
+    checkpoint = load_checkpoint(args.checkpoint, args.model)
+    try:
+        report = prebuild(forms, counts, args.model, args.jobs, checkpoint, args.checkpoint,
+                          force=args.force, ttl=args.ttl or None)
+    except KeyboardInterrupt:
+        return 130
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
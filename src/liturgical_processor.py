@@ -1,12 +1,73 @@
 import re
 import json
 import logging
-from ollama_client import call_ollama_smart
-from code_processor import clean_model_output
+from collections import namedtuple
+from ollama_client import call_ollama_cascade
+from structured_output import generate_json
+from metrics import increment
+from code_processor import clean_model_output, validate_numbered_output
+from stream_validation import numbering_validator
+from swift_array import parse_array_elements
 logger = logging.getLogger(__name__)
 
+VERSE_STRUCTURE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verse_boundaries": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "verse_number": {"type": "integer"},
+                    "content": {"type": "string", "minLength": 1},
+                    "array_lines": {"type": "array", "items": {"type": "integer"}}
+                },
+                "required": ["verse_number", "content", "array_lines"]
+            }
+        },
+        "total_complete_verses": {"type": "integer"},
+        "notes": {"type": "string"}
+    },
+    "required": ["verse_boundaries", "total_complete_verses"]
+}
+
+VERSE_ADJUSTMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "new_verses": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "verse_number": {"type": "integer"},
+                    "content": {"type": "string", "minLength": 1},
+                    "source_lines": {"type": "array", "items": {"type": "integer"}}
+                },
+                "required": ["verse_number", "content"]
+            }
+        },
+        "explanation": {"type": "string"}
+    },
+    "required": ["new_verses"]
+}
+
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {"verses": {"type": "array", "items": {"type": "string"}}},
+    "required": ["verses"]
+}
+
 def renumber_verses_with_ai(code, model="mixtral:8x7b"):
     """Ultra-simple prompt that might actually work"""
+    return renumber_verses_with_cascade(code, model)[0]
+
+def renumber_verses_with_cascade(code, model="mixtral:8x7b"):
+    """Renumber verses, trying the cascade's small models first
+
+    Returns (cleaned_result, model_used).
+    """
     prompt = f"""
 
 You are an expert Swift code formatter.
@@ -48,14 +109,19 @@ private let text = [
 
 """
     logger.info(f"[RENUMBER] ollama {model}")
-    result = call_ollama_smart(model, prompt)
+    result, model_used = call_ollama_cascade(
+        model, prompt,
+        lambda raw: validate_numbered_output(code, clean_model_output(raw, code)),
+        endpoint='renumber-verses',
+        stream_validator_factory=lambda: numbering_validator(code)
+    )
 
     logger.info(f"[RENUMBER] Received response from Ollama")
     logger.debug(f"[RENUMBER] Raw response length: {len(result)} chars")
     logger.debug(f"[RENUMBER] Raw response first 200 chars: {result[:200]}")
     logger.debug(f"[RENUMBER] Raw response last 200 chars: {result[-200:]}")
 
-    return clean_model_output(result, code)
+    return clean_model_output(result, code), model_used
 
 
 def parse_verses_from_array(code):
@@ -75,18 +141,9 @@ Some verses may span multiple string literals in the code array.
 VERSES:
 {verses_text}
 
-Return JSON analysis with this structure:
-{{
-    "verse_boundaries": [
-        {{
-            "verse_number": 1,
-            "content": "full verse text",
-            "array_lines": [0]  // indices of array elements that form this verse
-        }}
-    ],
-    "total_complete_verses": 17,
-    "notes": "any observations about verse structure"
-}}
+Return JSON with "verse_boundaries" (one entry per verse: "verse_number", full verse
+"content", and "array_lines", the 0-based indices of the array elements that form it),
+"total_complete_verses" and "notes" (observations about the verse structure).
 
 Focus on:
 1. Semantic completeness - each verse should make sense as a complete thought
@@ -94,16 +151,19 @@ Focus on:
 3. Multi-line verses - identify which array lines belong together
 """
     
-    try:
-        response = call_ollama_smart("deepseek-coder:6.7b", prompt)
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
-            return create_fallback_analysis(verses)
-    except:
+    def check(analysis):
+        lines = [i for b in analysis["verse_boundaries"] for i in b.get("array_lines", [])]
+        if any(i < 0 or i >= len(verses) for i in lines):
+            return [("verse_boundaries", f"array_lines must be between 0 and {len(verses) - 1}")]
+        return []
+
+    analysis, error = generate_json("deepseek-coder:6.7b", prompt, VERSE_STRUCTURE_SCHEMA,
+                                    'analyze-verse-structure', check)
+    if error:
+        logger.warning(f"[LITURGICAL] Verse structure analysis failed ({error}), using fallback")
+        increment('structured_fallbacks', operation='analyze-verse-structure')
         return create_fallback_analysis(verses)
+    return analysis
 
 def create_fallback_analysis(verses):
     """Fallback analysis when AI fails"""
@@ -132,17 +192,9 @@ CURRENT STRUCTURE:
 
 TARGET: {target_count} verses
 
-Return JSON with the new structure:
-{{
-    "new_verses": [
-        {{
-            "verse_number": 1,
-            "content": "full reconstructed verse text",
-            "source_lines": [0, 1]  // which original array lines were used
-        }}
-    ],
-    "explanation": "how verses were restructured"
-}}
+Return JSON with "new_verses" (exactly {target_count} entries: "verse_number", the full
+reconstructed verse "content", and "source_lines", the original array lines used) and
+"explanation" (how the verses were restructured).
 
 RULES:
 1. Preserve ALL original Latin text
@@ -152,22 +204,236 @@ RULES:
 5. Split long verses or merge short ones appropriately
 """
     
-    try:
-        response = call_ollama_smart("deepseek-coder:6.7b", prompt)
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
-            return create_adjusted_fallback(verses, target_count)
-    except:
+    def check(adjustment):
+        if len(adjustment["new_verses"]) != target_count:
+            return [("new_verses", f"expected {target_count} verses, got {len(adjustment['new_verses'])}")]
+        return []
+
+    adjustment, error = generate_json("deepseek-coder:6.7b", prompt, VERSE_ADJUSTMENT_SCHEMA,
+                                      'adjust-verses', check)
+    if error:
+        logger.warning(f"[LITURGICAL] Verse adjustment failed ({error}), using fallback")
+        increment('structured_fallbacks', operation='adjust-verses')
         return create_adjusted_fallback(verses, target_count)
+    return adjustment
 
 def create_adjusted_fallback(verses, target_count):
     """Fallback when verse adjustment fails"""
+    adjustment = segment_verses(verses, target_count)
+    if adjustment is None:
+        return {
+            "new_verses": [
+                {"verse_number": i+1, "content": verse, "source_lines": [i]} 
+                for i, verse in enumerate(verses)
+            ],
+            "explanation": "AI adjustment failed - using original structure"
+        }
+    adjustment["explanation"] = "AI adjustment failed - " + adjustment["explanation"]
+    return adjustment
+
+def parse_verse_lines(code):
+    """Extract verse lines plus continuation flags from a Swift array
+
+    A line is a continuation when it has no leading /* N */ comment. The
+    gap flag marks continuations followed by a skipped number (9, cont.,
+    11), which suggests the continuation is really the missing verse.
+    """
+    elements = [e for e in parse_array_elements(code) if e.text.strip()]
+    if not elements:
+        verses = parse_verses_from_array(code)
+        return verses, [False] * len(verses), [False] * len(verses)
+
+    lines = [e.text for e in elements]
+    continuation = [e.number is None for e in elements]
+    gap = [False] * len(elements)
+    last_number = None
+    for i, element in enumerate(elements):
+        if element.number is None:
+            continue
+        if last_number is not None and element.number - last_number > 1:
+            # Continuations between last_number and this one fill the gap
+            for j in range(i - 1, -1, -1):
+                if not continuation[j]:
+                    break
+                gap[j] = True
+        last_number = element.number
+    return lines, continuation, gap
+
+# Candidate verse boundaries inside a line, strongest first.
+BOUNDARY_COSTS = {'.': 1.5, '?': 1.5, '!': 1.5, ';': 2.0, ':': 2.0, ',': 4.0, ' ': 8.0}
+LINE_END_COST = 0.0            # next line starts with /* N */
+GAP_CONTINUATION_COST = 0.5    # continuation standing in for a skipped number
+CONTINUATION_COST = 3.0        # continuation of the same numbered verse
+WEAK_LINE_END_COST = 1.0       # line does not end on punctuation
+BALANCE_WEIGHT = 2.0
+
+Unit = namedtuple('Unit', ['text', 'line', 'cost_after'])
+
+def _split_units(lines, continuation, gap, marks):
+    """Split lines at the given punctuation marks into scored units
+
+    A ' ' among the marks splits between any two words.
+    """
+    units = []
+    pattern = None
+    if marks and ' ' in marks:
+        pattern = re.compile(r'(?<=\S)\s+')
+    elif marks:
+        pattern = re.compile(r'(?<=[' + re.escape(''.join(marks)) + r'])\s+')
+
+    for i, line in enumerate(lines):
+        pieces = [line]
+        if pattern is not None:
+            pieces = []
+            last = 0
+            for match in pattern.finditer(line):
+                if line[match.end():].strip():
+                    pieces.append(line[last:match.end()])
+                    last = match.end()
+            pieces.append(line[last:])
+
+        for k, piece in enumerate(pieces):
+            if k < len(pieces) - 1:
+                mark = piece.rstrip()[-1:] or ' '
+                cost = BOUNDARY_COSTS.get(mark, BOUNDARY_COSTS[' '])
+            elif i + 1 < len(lines):
+                if not continuation[i + 1]:
+                    cost = LINE_END_COST
+                elif gap[i + 1]:
+                    cost = GAP_CONTINUATION_COST
+                else:
+                    cost = CONTINUATION_COST
+                if piece.rstrip()[-1:] not in ('.', ';', ':', '?', '!'):
+                    cost += WEAK_LINE_END_COST
+            else:
+                cost = 0.0
+            units.append(Unit(piece, i, cost))
+    return units
+
+def _join_units(units):
+    """Concatenate units, separating lines with a space where needed"""
+    text = ""
+    for k, unit in enumerate(units):
+        if k and unit.line != units[k - 1].line and text and not text[-1].isspace() and not unit.text[:1].isspace():
+            text += " "
+        text += unit.text
+    return text.strip()
+
+def segment_verses(lines, target_count, continuation=None, gap=None):
+    """Split or merge verse lines into exactly target_count verses
+
+    Dynamic programming over candidate boundaries (line ends and
+    punctuation inside lines), minimizing boundary cost plus a length
+    balance penalty. Every non-whitespace character is kept in order.
+    Returns an adjustment dict like adjust_verses_to_count, or None if
+    the text cannot be divided that many times.
+    """
+    if not lines or target_count < 1:
+        return None
+    continuation = continuation or [False] * len(lines)
+    gap = gap or [False] * len(lines)
+
+    # Only fall back to weaker split points when the strong ones run out
+    units = None
+    for marks in (('.', '?', '!', ';', ':'), ('.', '?', '!', ';', ':', ','), tuple(BOUNDARY_COSTS)):
+        units = _split_units(lines, continuation, gap, marks)
+        if len(units) >= target_count:
+            break
+    if len(units) < target_count:
+        return None
+
+    m = len(units)
+    prefix = [0]
+    for unit in units:
+        prefix.append(prefix[-1] + len(unit.text.strip()))
+    mean = max(prefix[-1] / target_count, 1.0)
+
+    def segment_cost(i, j):
+        deviation = (prefix[j] - prefix[i] - mean) / mean
+        return BALANCE_WEIGHT * deviation * deviation
+
+    inf = float('inf')
+    # cost[k][j]: best cost of k verses covering units[:j]
+    cost = [[inf] * (m + 1) for _ in range(target_count + 1)]
+    back = [[0] * (m + 1) for _ in range(target_count + 1)]
+    cost[0][0] = 0.0
+    for k in range(1, target_count + 1):
+        # Leave at least one unit for each remaining verse
+        for j in range(k, m - (target_count - k) + 1):
+            boundary = units[j - 1].cost_after if j < m else 0.0
+            best = inf
+            best_i = 0
+            for i in range(k - 1, j):
+                if cost[k - 1][i] == inf:
+                    continue
+                candidate = cost[k - 1][i] + segment_cost(i, j)
+                if candidate < best:
+                    best = candidate
+                    best_i = i
+            cost[k][j] = best + boundary
+            back[k][j] = best_i
+
+    bounds = [m]
+    for k in range(target_count, 0, -1):
+        bounds.append(back[k][bounds[-1]])
+    bounds.reverse()
+
+    new_verses = []
+    for n in range(target_count):
+        segment = units[bounds[n]:bounds[n + 1]]
+        new_verses.append({
+            "verse_number": n + 1,
+            "content": _join_units(segment),
+            "source_lines": sorted({u.line for u in segment})
+        })
+
+    original = re.sub(r'\s+', '', ''.join(lines))
+    result = re.sub(r'\s+', '', ''.join(v["content"] for v in new_verses))
+    if original != result:
+        logger.error("[SEGMENT] Segmentation lost text, refusing result")
+        return None
+
+    splits = sum(1 for n in range(1, target_count) if units[bounds[n]].line == units[bounds[n] - 1].line)
+    merges = sum(len(v["source_lines"]) - 1 for v in new_verses)
     return {
-        "new_verses": [
-            {"verse_number": i+1, "content": verse, "source_lines": [i]} 
-            for i, verse in enumerate(verses)
-        ],
-        "explanation": "AI adjustment failed - using original structure"
-    }
\ No newline at end of file
+        "new_verses": new_verses,
+        "explanation": f"Deterministic segmentation of {len(lines)} lines into {target_count} verses "
+                       f"({splits} split(s) inside lines, {merges} line merge(s))",
+        "method": "deterministic",
+        "cost": round(cost[target_count][m], 3)
+    }
+
+def review_segmentation_with_ai(adjustment, target_count, model="deepseek-coder:6.7b"):
+    """Ask the model to review a deterministic segmentation
+
+    The model's proposal is accepted only if it keeps exactly
+    target_count verses and every character of the text.
+    """
+    proposal = json.dumps([v["content"] for v in adjustment["new_verses"]], indent=2, ensure_ascii=False)
+    prompt = f"""
+These Latin psalm verses were divided into {target_count} verses. Review the division
+following proper liturgical verse boundaries. Move text between neighbouring verses only
+if a boundary is clearly wrong. PRESERVE ALL TEXT CONTENT - do not remove, add or change any Latin text.
+
+VERSES:
+{proposal}
+
+Return ONLY a JSON object whose "verses" field is an array of exactly {target_count} strings.
+"""
+    schema = dict(REVIEW_SCHEMA, properties={"verses": dict(REVIEW_SCHEMA["properties"]["verses"],
+                                                            minItems=target_count, maxItems=target_count)})
+    result, _ = generate_json(model, prompt, schema, 'review-segmentation')
+    reviewed = result.get("verses") if isinstance(result, dict) else None
+
+    original = re.sub(r'\s+', '', ''.join(v["content"] for v in adjustment["new_verses"]))
+    if (not isinstance(reviewed, list) or len(reviewed) != target_count
+            or not all(isinstance(v, str) for v in reviewed)
+            or re.sub(r'\s+', '', ''.join(reviewed)) != original):
+        adjustment["review"] = "rejected"
+        return adjustment
+
+    for verse, content in zip(adjustment["new_verses"], reviewed):
+        verse["content"] = content.strip()
+    adjustment["review"] = "accepted"
+    adjustment["explanation"] += f"; reviewed by {model}"
+    return adjustment
\ No newline at end of file
@@ -0,0 +1,215 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+import requests
+
+from metrics import increment
+from request_context import is_cancelled
+
+# Fallback for a local setup whose Ollama daemon is unreachable. Instead of
+# spawning `ollama run` per request, a few private `ollama serve` processes
+# are kept on loopback ports and reached over keep-alive HTTP sessions, so
+# the model stays attached between requests. Workers start lazily, are
+# health-checked, recycled after LOCAL_WORKER_MAX_REQUESTS requests and
+# stopped once they sit idle (normally because the main daemon is back).
+
+LOCAL_WORKERS = int(os.getenv('LOCAL_WORKERS', 1))
+LOCAL_WORKER_PARALLEL = int(os.getenv('LOCAL_WORKER_PARALLEL', 1))
+LOCAL_WORKER_BASE_PORT = int(os.getenv('LOCAL_WORKER_BASE_PORT', 11500))
+LOCAL_WORKER_MAX_REQUESTS = int(os.getenv('LOCAL_WORKER_MAX_REQUESTS', 500))
+LOCAL_WORKER_START_TIMEOUT = float(os.getenv('LOCAL_WORKER_START_TIMEOUT', 30))
+LOCAL_WORKER_IDLE_TIMEOUT = float(os.getenv('LOCAL_WORKER_IDLE_TIMEOUT', 600))
+LOCAL_WORKER_HEALTH_INTERVAL = float(os.getenv('LOCAL_WORKER_HEALTH_INTERVAL', 30))
+LOCAL_WORKER_RETRY_DELAY = float(os.getenv('LOCAL_WORKER_RETRY_DELAY', 30))
+
+
+class LocalWorkerUnavailable(Exception):
+    """No local worker could take the request"""
+
+
+class LocalWorker:
+    """One `ollama serve` process on a loopback port"""
+
+    def __init__(self, index):
+        self.index = index
+        self.url = f"http://127.0.0.1:{LOCAL_WORKER_BASE_PORT + index}"
+        self.process = None
+        self.session = None
+        self.active = 0
+        self.served = 0
+        self.last_used = 0
+        self.last_check = 0
+        self.start_lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        env = dict(os.environ, OLLAMA_HOST=self.url.split('//', 1)[1],
+                   OLLAMA_NUM_PARALLEL=str(LOCAL_WORKER_PARALLEL))
+        try:
+            self.process = subprocess.Popen(
+                ['ollama', 'serve'], env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            raise LocalWorkerUnavailable("Ollama not installed or not in PATH")
+
+        self.session = requests.Session()
+        deadline = time.time() + LOCAL_WORKER_START_TIMEOUT
+        while time.time() < deadline:
+            if self.healthy():
+                self.served = 0
+                increment('local_worker_starts')
+                logging.info(f"[LOCAL] Worker {self.index} serving at {self.url}")
+                return
+            if not self.running:
+                break
+            time.sleep(0.25)
+        self.stop()
+        raise LocalWorkerUnavailable(f"Local Ollama worker did not start at {self.url}")
+
+    def healthy(self):
+        self.last_check = time.time()
+        if not self.running:
+            return False
+        try:
+            return self.session.get(f"{self.url}/api/tags", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def stop(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+
+class LocalWorkerPool:
+    """Bounded pool of local workers shared by every fallback request"""
+
+    def __init__(self, size=LOCAL_WORKERS, parallel=LOCAL_WORKER_PARALLEL):
+        self.workers = [LocalWorker(i) for i in range(size)]
+        self.slots = threading.BoundedSemaphore(size * parallel)
+        self.lock = threading.Lock()
+        self.failed_at = 0
+        self.last_error = None
+
+    def _ready_worker(self):
+        """Least busy worker, started, recycled or health-checked as needed"""
+        with self.lock:
+            # Prefer workers below the recycle limit so a draining one can go idle
+            worker = min(self.workers, key=lambda w: (w.served >= LOCAL_WORKER_MAX_REQUESTS, w.active, not w.running))
+            worker.active += 1
+        try:
+            with worker.start_lock:
+                self._prepare(worker)
+            return worker
+        except Exception:
+            with self.lock:
+                worker.active -= 1
+            raise
+
+    def _prepare(self, worker):
+        if worker.running and time.time() - worker.last_check > LOCAL_WORKER_HEALTH_INTERVAL:
+            if not worker.healthy():
+                logging.warning(f"[LOCAL] Worker {worker.index} failed its health check, restarting")
+                increment('local_worker_restarts')
+                worker.stop()
+        if not worker.running:
+            if time.time() - self.failed_at < LOCAL_WORKER_RETRY_DELAY:
+                raise LocalWorkerUnavailable(self.last_error)
+            try:
+                worker.start()
+            except LocalWorkerUnavailable as e:
+                self.failed_at = time.time()
+                self.last_error = str(e)
+                raise
+
+    @contextmanager
+    def worker(self, timeout=240):
+        """Hold a worker slot for one request"""
+        deadline = time.time() + timeout
+        while not self.slots.acquire(timeout=0.25):
+            if is_cancelled() or time.time() > deadline:
+                raise LocalWorkerUnavailable("All local workers busy")
+        try:
+            worker = self._ready_worker()
+            try:
+                yield worker
+            finally:
+                with self.lock:
+                    worker.active -= 1
+                    worker.served += 1
+                    worker.last_used = time.time()
+                self._recycle_if_due(worker)
+        finally:
+            self.slots.release()
+
+    def _recycle_if_due(self, worker):
+        with worker.start_lock:
+            if worker.active == 0 and worker.running and worker.served >= LOCAL_WORKER_MAX_REQUESTS:
+                logging.info(f"[LOCAL] Recycling worker {worker.index} after {worker.served} requests")
+                increment('local_worker_recycles')
+                worker.stop()
+
+    def models(self):
+        """Model names known to the local Ollama installation"""
+        with self.worker(timeout=LOCAL_WORKER_START_TIMEOUT) as worker:
+            response = worker.session.get(f"{worker.url}/api/tags", timeout=5)
+            return [m["name"] for m in response.json().get("models", [])]
+
+    def running_models(self):
+        """Model names from a worker that is already serving, None if none is
+
+        Never starts a worker, so the health prober can call it.
+        """
+        with self.lock:
+            worker = next((w for w in self.workers if w.running and w.session is not None), None)
+        if worker is None:
+            return None
+        try:
+            response = worker.session.get(f"{worker.url}/api/tags", timeout=2)
+            return [m["name"] for m in response.json().get("models", [])]
+        except (requests.exceptions.RequestException, ValueError, AttributeError):
+            return None
+
+    def reap_idle(self):
+        """Stop workers nobody used for LOCAL_WORKER_IDLE_TIMEOUT seconds"""
+        with self.lock:
+            idle = [w for w in self.workers
+                    if w.running and w.active == 0 and time.time() - w.last_used > LOCAL_WORKER_IDLE_TIMEOUT]
+        for worker in idle:
+            with worker.start_lock:
+                if worker.active == 0:
+                    logging.info(f"[LOCAL] Stopping idle worker {worker.index}")
+                    worker.stop()
+
+    def stats(self):
+        with self.lock:
+            return [{
+                "url": w.url,
+                "running": w.running,
+                "active": w.active,
+                "served": w.served
+            } for w in self.workers]
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+LOCAL_POOL = LocalWorkerPool()
+atexit.register(LOCAL_POOL.shutdown)
@@ -0,0 +1,73 @@
+import threading
+from collections import deque, defaultdict
+
+# In-process counters and latency samples, exposed at /api/metrics.
+# Names are flat strings; labels become part of the key, e.g.
+# increment('cascade_escalations', endpoint='renumber-verses').
+
+SAMPLE_WINDOW = 512
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f"{k}={labels[k]}" for k in sorted(labels)) + '}'
+
+
+def increment(name, value=1, **labels):
+    """Add value to a counter"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, value, **labels):
+    """Record one sample (latency in seconds, sizes, ...) in a sliding window"""
+    with _lock:
+        _samples[_key(name, labels)].append(value)
+
+
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def _pick(values, q):
+    return values[min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))]
+
+
+def percentile(name, q, default=None, **labels):
+    """q-th percentile (0-100) of the recent samples, or default when there are none"""
+    with _lock:
+        samples = sorted(_samples.get(_key(name, labels), ()))
+    if not samples:
+        return default
+    return _pick(samples, q)
+
+
+def sample_count(name, **labels):
+    with _lock:
+        return len(_samples.get(_key(name, labels), ()))
+
+
+def snapshot():
+    """All counters plus count/p50/p95/p99 for every sample series"""
+    with _lock:
+        counters = dict(_counters)
+        series = {key: sorted(values) for key, values in _samples.items()}
+
+    summaries = {}
+    for key, values in series.items():
+        if not values:
+            continue
+        summaries[key] = {
+            "count": len(values),
+            "p50": _pick(values, 50),
+            "p95": _pick(values, 95),
+            "p99": _pick(values, 99),
+            "max": values[-1]
+        }
+    return {"counters": counters, "samples": summaries}
@@ -0,0 +1,154 @@
+"""Stand-in Ollama server for load tests and traffic replay.
+
+Usage:
+    python src/mock_ollama.py --port 11434 --parallel 2 --gen-tps 40
+
+Serves /api/tags, /api/ps, /api/generate and /api/chat with Ollama's
+streaming format and eval counts. Time is simulated from the prompt and
+output size: prompt tokens at --prompt-tps, output tokens at --gen-tps,
+with at most --parallel generations at once (like OLLAMA_NUM_PARALLEL).
+Code prompts get their Swift array back numbered or stripped, so the
+server's validators accept the result; Latin word prompts get JSON.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from swift_array import number_elements, strip_comments
+
+CHARS_PER_TOKEN = 3.5
+ARRAY_PATTERN = re.compile(r'(?:private )?(?:let|var) \w+(?:: \[\w+\])? = \[.*?\n\s*\]', re.DOTALL)
+WORD_PATTERN = re.compile(r'Word: "([^"]+)"')
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+
+
+def tokens(text):
+    return max(1, int(len(text) / CHARS_PER_TOKEN))
+
+
+def mock_output(prompt, num_predict):
+    """Plausible answer for one of the server's prompt templates"""
+    arrays = ARRAY_PATTERN.findall(prompt)
+    if arrays:
+        code = arrays[-1]
+        code = strip_comments(code) if 'Remove ALL comments' in prompt else number_elements(code)
+        return f"```swift\n{code}\n```"
+    word = WORD_PATTERN.search(prompt)
+    if word and 'JSON' in prompt:
+        return json.dumps({
+            "input": word.group(1), "lemma": word.group(1), "part_of_speech": "noun",
+            "translations": {"en": "mock"}, "analysis": {"confidence": "high"}
+        }, indent=4)
+    length = int(min(num_predict or 200, 200) * CHARS_PER_TOKEN)
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+class MockOllama:
+    def __init__(self, models, parallel, prompt_tps, gen_tps):
+        self.models = models
+        self.slots = threading.Semaphore(parallel)
+        self.prompt_tps = prompt_tps
+        self.gen_tps = gen_tps
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, payload):
+            line = json.dumps(payload).encode('utf-8') + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self._json({"models": [{"name": m} for m in mock.models]})
+            elif self.path == '/api/ps':
+                self._json({"models": [{"name": mock.models[0], "size": 0}]})
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            req = json.loads(self.rfile.read(length) or b'{}')
+            options = req.get('options') or {}
+            if self.path == '/api/chat':
+                prompt = '\n'.join(m.get('content', '') for m in req.get('messages', []))
+            elif self.path == '/api/generate':
+                prompt = req.get('prompt', '')
+            else:
+                return self._json({"error": "not found"}, 404)
+
+            output = mock_output(prompt, options.get('num_predict'))
+            prompt_tokens, output_tokens = tokens(prompt), tokens(output)
+            with mock.slots:
+                time.sleep(prompt_tokens / mock.prompt_tps)
+                if req.get('stream', True):
+                    self._stream(output, output_tokens, prompt_tokens)
+                else:
+                    time.sleep(output_tokens / mock.gen_tps)
+                    self._json(self._final(output, prompt_tokens, output_tokens))
+
+        def _final(self, text, prompt_tokens, output_tokens):
+            final = {"model": "mock", "done": True,
+                     "prompt_eval_count": prompt_tokens, "eval_count": output_tokens,
+                     "prompt_eval_duration": int(prompt_tokens / mock.prompt_tps * 1e9)}
+            if self.path == '/api/chat':
+                final["message"] = {"role": "assistant", "content": text}
+            else:
+                final["response"] = text
+            return final
+
+        def _stream(self, output, output_tokens, prompt_tokens):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            step = max(1, int(CHARS_PER_TOKEN * 4))
+            try:
+                for i in range(0, len(output), step):
+                    time.sleep(tokens(output[i:i + step]) / mock.gen_tps)
+                    self._chunk(dict(self._final(output[i:i + step], 0, 0), done=False))
+                self._chunk(self._final("", prompt_tokens, output_tokens))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass   # the server cancelled the generation
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Ollama server with simulated generation time")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--models', default='deepseek-coder:6.7b,mistral:7b',
+                        help="Comma-separated model names to advertise")
+    parser.add_argument('--parallel', type=int, default=1, help="Concurrent generations")
+    parser.add_argument('--prompt-tps', type=float, default=2000, help="Prompt tokens per second")
+    parser.add_argument('--gen-tps', type=float, default=40, help="Generated tokens per second")
+    args = parser.parse_args(argv)
+
+    mock = MockOllama([m.strip() for m in args.models.split(',') if m.strip()],
+                      args.parallel, args.prompt_tps, args.gen_tps)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    print(f"Mock Ollama on http://{args.host}:{args.port} "
+          f"(parallel {args.parallel}, {args.gen_tps} tokens/s)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
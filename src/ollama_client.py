@@ -1,13 +1,23 @@
 # src/ollama_client.py
 from tkinter import W
 import requests
-import subprocess
 import os
+import json
+import shutil
 import time
 import logging
+import threading
+import contextvars
+from collections import namedtuple
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 
+from metrics import increment, observe, percentile, sample_count
+from request_context import CancelToken, current_token, is_cancelled, record_usage, time_left, token_scope
+from local_workers import LOCAL_POOL, LocalWorkerUnavailable
+from shared_store import STORE
+from token_budget import plan_budget, generation_options, request_body, restore_stop, calibrate, INPUT_TOO_LARGE_PREFIX
+
 load_dotenv()
 
 # Configuration
@@ -15,6 +25,51 @@ OLLAMA_BASE_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 OLLAMA_USERNAME = os.getenv('OLLAMA_USERNAME')
 OLLAMA_PASSWORD = os.getenv('OLLAMA_PASSWORD')
 
+# Backends for /api/chat conversations; each conversation sticks to one of them
+OLLAMA_URLS = [u.strip().rstrip('/') for u in os.getenv('OLLAMA_URLS', '').split(',') if u.strip()] or [OLLAMA_BASE_URL]
+
+OLLAMA_PROBE_INTERVAL = float(os.getenv('OLLAMA_PROBE_INTERVAL', 15))
+
+# Small, fast models tried before the requested model (comma-separated, smallest first)
+CASCADE_MODELS = [m.strip() for m in os.getenv('CASCADE_MODELS', '').split(',') if m.strip()]
+
+# Same-model retries after a stream validator aborted the final model's generation
+STREAM_RETRIES = int(os.getenv('STREAM_RETRIES', 1))
+STREAM_ABORT_PREFIX = "Error: Aborted generation:"
+CANCELLED_PREFIX = "Error: Cancelled:"
+DEADLINE_PREFIX = "Error: Deadline exceeded:"
+
+# Per-call timeouts. Without an explicit timeout a model gets
+# ADAPTIVE_TIMEOUT_FACTOR times its p99 latency once enough calls have been
+# observed, within [OLLAMA_MIN_TIMEOUT, OLLAMA_MAX_TIMEOUT], and
+# OLLAMA_TIMEOUT before that. Every call is also cut to the time left
+# before the request's deadline.
+OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', 240))
+OLLAMA_MIN_TIMEOUT = float(os.getenv('OLLAMA_MIN_TIMEOUT', 15))
+OLLAMA_MAX_TIMEOUT = float(os.getenv('OLLAMA_MAX_TIMEOUT', 600))
+ADAPTIVE_TIMEOUT_FACTOR = float(os.getenv('ADAPTIVE_TIMEOUT_FACTOR', 3))
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20
+
+# Hedged chat requests. With OLLAMA_HEDGING=1 and several OLLAMA_URLS, a
+# chat generation that has not produced its first token within the
+# model's HEDGE_PERCENTILE time-to-first-token is sent to a second backend
+# as well. The first attempt to produce a token wins and the other is
+# cancelled. Every chat request earns HEDGE_BUDGET hedges (0.05: at most
+# about 5% extra generations, HEDGE_BURST banked), so hedging cannot
+# double the load when every backend is slow. A primary that lost to its
+# hedge runs on until its first token, which measures the latency saved.
+OLLAMA_HEDGING = os.getenv('OLLAMA_HEDGING', '0').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', 0.05))
+HEDGE_BURST = float(os.getenv('HEDGE_BURST', 3))
+HEDGE_MIN_SAMPLES = 20
+
+GENERATE_OPTIONS = {
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "top_k": 40
+}
+
 # Track Ollama availability
 OLLAMA_AVAILABLE = False
 LAST_OLLAMA_CHECK = 0
@@ -26,6 +81,27 @@ def is_remote_url(url):
     local_hosts = ['localhost', '127.0.0.1', '0.0.0.0']
     return parsed.hostname not in local_hosts
 
+# Immutable view of Ollama state published by the background prober.
+# Readers grab the module attribute once and never block; the prober
+# swaps in a fresh tuple after every probe.
+OllamaSnapshot = namedtuple('OllamaSnapshot', [
+    'available',       # /api/tags answered 200
+    'is_remote',
+    'method',          # "http", "cli" or "none"
+    'latency_ms',      # round trip of the /api/tags probe
+    'models',          # tuple of model names from the catalog
+    'running',         # dict name -> /api/ps entry (models resident in memory)
+    'checked_at',      # time.time() of the probe, 0 if never probed
+    'error',
+])
+
+_SNAPSHOT = OllamaSnapshot(False, is_remote_url(OLLAMA_BASE_URL), "none", None, (), {}, 0, None)
+IS_REMOTE = _SNAPSHOT.is_remote
+_PROBE_LOCK = threading.Lock()
+_PROBER_START_LOCK = threading.Lock()
+_PROBER_THREAD = None
+_PROBER_STOP = threading.Event()
+
 def create_ollama_session():
     """Create requests session with authentication if needed"""
     session = requests.Session()
@@ -39,167 +115,691 @@ def create_ollama_session():
     
     return session
 
-def check_ollama_availability():
-    """Check if Ollama is available (local or remote)"""
-    global OLLAMA_AVAILABLE, LAST_OLLAMA_CHECK, IS_REMOTE
-    
-    # Cache check for 30 seconds
-    if time.time() - LAST_OLLAMA_CHECK < 30:
-        return OLLAMA_AVAILABLE
-    
-    IS_REMOTE = is_remote_url(OLLAMA_BASE_URL)
-    
+def probe_ollama():
+    """Probe Ollama once and publish a new snapshot"""
+    global OLLAMA_AVAILABLE, LAST_OLLAMA_CHECK, IS_REMOTE, _SNAPSHOT
+
+    is_remote = is_remote_url(OLLAMA_BASE_URL)
+    available = False
+    latency_ms = None
+    models = ()
+    running = {}
+    error = None
+
     try:
         session = create_ollama_session()
+        started = time.time()
         response = session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        OLLAMA_AVAILABLE = response.status_code == 200
-        
-        if OLLAMA_AVAILABLE and IS_REMOTE:
-            logging.info(f"[OK] Connected to remote Ollama server: {OLLAMA_BASE_URL}")
-        elif OLLAMA_AVAILABLE:
-            logging.info("[OK] Connected to local Ollama server")
+        latency_ms = round((time.time() - started) * 1000, 1)
+        available = response.status_code == 200
+
+        if available:
+            models = tuple(model["name"] for model in response.json().get("models", []))
+            try:
+                ps = session.get(f"{OLLAMA_BASE_URL}/api/ps", timeout=5)
+                if ps.status_code == 200:
+                    running = {m["name"]: {
+                        "size": m.get("size"),
+                        "size_vram": m.get("size_vram"),
+                        "expires_at": m.get("expires_at")
+                    } for m in ps.json().get("models", [])}
+            except requests.exceptions.RequestException:
+                pass  # /api/ps is optional on older servers
         else:
-            logging.info(f"[ERROR] Ollama server not responding: {response.status_code}")
-            
+            error = f"HTTP {response.status_code}"
+
     except requests.exceptions.ConnectionError:
-        OLLAMA_AVAILABLE = False
-        if IS_REMOTE:
-            logging.info(f"[ERROR] Cannot connect to remote Ollama server: {OLLAMA_BASE_URL}")
-        else:
-            logging.info("[ERROR] Cannot connect to local Ollama server - is it running?")
+        error = "connection refused"
     except requests.exceptions.Timeout:
-        OLLAMA_AVAILABLE = False
-        logging.info("[ERROR] Ollama server timeout")
+        error = "timeout"
     except Exception as e:
-        OLLAMA_AVAILABLE = False
-        logging.info(f"[ERROR] Error connecting to Ollama: {e}")
-    
-    LAST_OLLAMA_CHECK = time.time()
-    return OLLAMA_AVAILABLE
+        error = str(e)
+
+    method = "http" if available else "none"
+    if available:
+        LOCAL_POOL.reap_idle()
+    if not available and not is_remote:
+        # A probe never starts a local worker. Without one already serving,
+        # the local models are unknown until a request starts it.
+        local_models = LOCAL_POOL.running_models()
+        models = tuple(local_models or ())
+        method = "cli" if local_models is not None or shutil.which('ollama') else "none"
+
+    if available != _SNAPSHOT.available or _SNAPSHOT.checked_at == 0:
+        if available and is_remote:
+            logging.info(f"[OK] Connected to remote Ollama server: {OLLAMA_BASE_URL}")
+        elif available:
+            logging.info("[OK] Connected to local Ollama server")
+        elif is_remote:
+            logging.info(f"[ERROR] Cannot connect to remote Ollama server: {OLLAMA_BASE_URL} ({error})")
+        else:
+            logging.info(f"[ERROR] Cannot connect to local Ollama server - is it running? ({error})")
+
+    _SNAPSHOT = OllamaSnapshot(available, is_remote, method, latency_ms,
+                               models, running, time.time(), error)
+    OLLAMA_AVAILABLE = available
+    IS_REMOTE = is_remote
+    LAST_OLLAMA_CHECK = _SNAPSHOT.checked_at
+    return _SNAPSHOT
+
+def get_ollama_snapshot():
+    """Return the latest published Ollama snapshot without touching the network"""
+    return _SNAPSHOT
+
+def _adopt_shared_snapshot():
+    """Take the snapshot another process published, if it is newer than ours"""
+    global OLLAMA_AVAILABLE, LAST_OLLAMA_CHECK, IS_REMOTE, _SNAPSHOT
+    data = STORE.get('health', 'ollama')
+    if not data or data["checked_at"] <= _SNAPSHOT.checked_at:
+        return
+    data["models"] = tuple(data["models"])
+    _SNAPSHOT = OllamaSnapshot(**data)
+    OLLAMA_AVAILABLE = _SNAPSHOT.available
+    IS_REMOTE = _SNAPSHOT.is_remote
+    LAST_OLLAMA_CHECK = _SNAPSHOT.checked_at
+
+def _probe_round(owner, interval):
+    """One prober iteration; True if owner held the lease and probed"""
+    # With several server processes only the lease holder probes Ollama;
+    # the others adopt the snapshot it publishes in the shared store
+    if STORE.try_lease('ollama-prober', owner, interval * 3):
+        STORE.set('health', 'ollama', probe_ollama()._asdict())
+        return True
+    _adopt_shared_snapshot()
+    return False
 
-def call_ollama_http(model_name, prompt, timeout=45):
+def _prober_loop(interval):
+    owner = f"{os.getpid()}"
+    while not _PROBER_STOP.is_set():
+        leader = False
+        try:
+            leader = _probe_round(owner, interval)
+        except Exception as e:
+            logging.error(f"[PROBER] Probe failed: {e}")
+        _PROBER_STOP.wait(interval if leader else min(interval, 2))
+
+def start_health_prober(interval=None):
+    """Start the background prober thread (idempotent)"""
+    global _PROBER_THREAD
+    with _PROBER_START_LOCK:
+        if _PROBER_THREAD is not None and _PROBER_THREAD.is_alive():
+            return _PROBER_THREAD
+        _PROBER_STOP.clear()
+        _PROBER_THREAD = threading.Thread(
+            target=_prober_loop,
+            args=(interval or OLLAMA_PROBE_INTERVAL,),
+            name="ollama-prober",
+            daemon=True
+        )
+        _PROBER_THREAD.start()
+        logging.info(f"[PROBER] Started, interval {interval or OLLAMA_PROBE_INTERVAL}s")
+        return _PROBER_THREAD
+
+def stop_health_prober():
+    """Stop the background prober thread"""
+    _PROBER_STOP.set()
+
+def prober_running():
+    return _PROBER_THREAD is not None and _PROBER_THREAD.is_alive()
+
+def check_ollama_availability():
+    """Check if Ollama is available (local or remote)"""
+    # With the prober running the snapshot is always fresh enough
+    if prober_running() and _SNAPSHOT.checked_at:
+        return _SNAPSHOT.available
+
+    # Cache check for 30 seconds
+    if time.time() - _SNAPSHOT.checked_at < 30:
+        return _SNAPSHOT.available
+
+    # Single flight: one thread re-probes, the others keep the stale answer
+    if not _PROBE_LOCK.acquire(blocking=False):
+        return _SNAPSHOT.available
+    try:
+        return probe_ollama().available
+    finally:
+        _PROBE_LOCK.release()
+
+def _http_error(response, model_name):
+    if response.status_code == 401:
+        return "Error: Authentication failed - check OLLAMA_USERNAME and OLLAMA_PASSWORD"
+    elif response.status_code == 404:
+        return f"Error: Model '{model_name}' not found on remote server"
+    else:
+        return f"Error: HTTP {response.status_code} - {response.text}"
+
+def _record_eval_counts(model_name, prompt, data):
+    """Report Ollama's real token counts and calibrate the estimator"""
+    prompt_tokens = data.get("prompt_eval_count")
+    completion_tokens = data.get("eval_count")
+    if prompt_tokens is None and completion_tokens is None:
+        return
+    calibrate(model_name, prompt, prompt_tokens)
+    record_usage(prompt_tokens, completion_tokens)
+    if data.get("prompt_eval_duration"):
+        observe('prompt_eval_s', data["prompt_eval_duration"] / 1e9, model=model_name)
+    increment('prompt_tokens', prompt_tokens or 0, model=model_name)
+    increment('completion_tokens', completion_tokens or 0, model=model_name)
+
+def call_ollama_http(model_name, prompt, timeout=OLLAMA_TIMEOUT, budget=None, base_url=None, session=None):
     """Call Ollama using HTTP API with remote support"""
+    budget = budget or plan_budget(None, prompt, model_name)
+    base_url = base_url or OLLAMA_BASE_URL
     try:
-        session = create_ollama_session()
+        session = session or create_ollama_session()
         logging.info(f"[INFO] Ollama model name: {model_name}")
         logging.info(f"[INFO] prompt: {prompt}")
         
         response = session.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "num_predict": 4096
-                }
-            },
+            f"{base_url}/api/generate",
+            json=request_body(model_name, prompt, False, GENERATE_OPTIONS, budget),
             timeout=timeout
         )
         
         if response.status_code == 200:
-            return response.json().get("response", "").strip()
-        elif response.status_code == 401:
-            return "Error: Authentication failed - check OLLAMA_USERNAME and OLLAMA_PASSWORD"
-        elif response.status_code == 404:
-            return f"Error: Model '{model_name}' not found on remote server"
-        else:
-            return f"Error: HTTP {response.status_code} - {response.text}"
+            data = response.json()
+            _record_eval_counts(model_name, prompt, data)
+            return restore_stop(data.get("response", "").strip(), budget)
+        return _http_error(response, model_name)
             
     except requests.exceptions.Timeout:
         return "Error: Request timeout - remote server took too long to respond"
     except requests.exceptions.ConnectionError:
-        return f"Error: Cannot connect to Ollama server at {OLLAMA_BASE_URL}"
+        return f"Error: Cannot connect to Ollama server at {base_url}"
     except Exception as e:
         return f"Error: {str(e)}"
 
-def call_ollama_cli(model_name, prompt):
-    """Call Ollama using CLI - only for local Ollama"""
-    if IS_REMOTE:
-        return "Error: CLI mode not available for remote Ollama servers"
-    
+def _cancelled_error():
+    token = current_token()
+    return f"{CANCELLED_PREFIX} {token.reason if token else 'cancelled'}"
+
+def adaptive_timeout(model_name):
+    """Default timeout for model_name, from its observed latency when there is enough of it"""
+    if sample_count('model_latency_s', model=model_name) < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+        return OLLAMA_TIMEOUT
+    p99 = percentile('model_latency_s', 99, model=model_name)
+    return min(OLLAMA_MAX_TIMEOUT, max(OLLAMA_MIN_TIMEOUT, p99 * ADAPTIVE_TIMEOUT_FACTOR))
+
+def call_timeout(model_name, timeout=None):
+    """Timeout for one call: the given or adaptive one, cut to the request's deadline"""
+    timeout = timeout or adaptive_timeout(model_name)
+    left = time_left()
+    return timeout if left is None else min(timeout, left)
+
+def _deadline_error():
+    increment('deadline_shed', stage='call')
+    return f"{DEADLINE_PREFIX} no time left for another model call"
+
+def _record_cancellation(model_name, elapsed):
+    """Count a cancelled generation and estimate the GPU time it would have used"""
+    increment('cancelled_generations', model=model_name)
+    expected = percentile('model_latency_s', 50, model=model_name)
+    if expected is not None:
+        increment('reclaimed_gpu_seconds', max(0.0, expected - elapsed), model=model_name)
+    logging.info(f"[CANCEL] Stopped {model_name} after {elapsed:.1f}s")
+
+def call_ollama_http_stream(model_name, prompt, stream_validator=None, timeout=OLLAMA_TIMEOUT, budget=None,
+                            base_url=None, session=None):
+    """
+    Stream a generation and feed it to stream_validator as it arrives.
+    Closing the connection when the validator objects makes Ollama stop
+    generating, so rejected output costs only the tokens produced so far.
+    The same happens when the request's cancel token fires.
+    """
+    started = time.time()
+    pieces = []
+    token = current_token()
+    budget = budget or plan_budget(None, prompt, model_name)
+    base_url = base_url or OLLAMA_BASE_URL
     try:
-        result = subprocess.run(
-            ['ollama', 'run', model_name],
-            input=prompt,
-            text=True,
-            capture_output=True,
-            timeout=45
+        session = session or create_ollama_session()
+        logging.info(f"[INFO] Ollama model name: {model_name} (streaming)")
+        
+        response = session.post(
+            f"{base_url}/api/generate",
+            json=request_body(model_name, prompt, True, GENERATE_OPTIONS, budget),
+            timeout=timeout,
+            stream=True
         )
         
-        if result.returncode == 0:
-            return result.stdout.strip()
-        else:
-            error_msg = result.stderr.strip()
-            if "file does not exist" in error_msg:
-                return f"Error: Model '{model_name}' not found. Available models: {get_available_models_cli()}"
-            return f"Error: {error_msg}"
-            
-    except subprocess.TimeoutExpired:
-        return "Error: Request timeout - Ollama took too long to respond"
-    except FileNotFoundError:
-        return "Error: Ollama not installed or not in PATH"
+        if response.status_code != 200:
+            return _http_error(response, model_name)
+
+        unregister = token.on_cancel(response.close) if token else (lambda: None)
+        try:
+            for line in response.iter_lines():
+                if token and token.cancelled:
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    return f"Error: {chunk['error']}"
+
+                piece = chunk.get("response", "")
+                pieces.append(piece)
+                if chunk.get("done"):
+                    _record_eval_counts(model_name, prompt, chunk)
+                if stream_validator is None:
+                    if chunk.get("done"):
+                        break
+                    continue
+                reason = stream_validator.feed(piece)
+                if reason is None and chunk.get("done"):
+                    reason = stream_validator.finish()
+                if reason:
+                    generated = ''.join(pieces)
+                    increment('stream_aborts', model=model_name)
+                    observe('stream_abort_chars', len(generated), model=model_name)
+                    logging.info(f"[STREAM] Aborted {model_name} after {len(generated)} chars "
+                                 f"in {time.time() - started:.1f}s: {reason}")
+                    return f"{STREAM_ABORT_PREFIX} {reason}"
+                if stream_validator.done:
+                    increment('stream_early_stops', model=model_name)
+                    break
+                if chunk.get("done"):
+                    break
+                if time.time() - started > timeout:
+                    return "Error: Request timeout - remote server took too long to respond"
+        except Exception:
+            # Reading from a response closed by the cancel callback fails
+            if not (token and token.cancelled):
+                raise
+        finally:
+            unregister()
+            response.close()
+
+        if token and token.cancelled:
+            _record_cancellation(model_name, time.time() - started)
+            return _cancelled_error()
+        return restore_stop(''.join(pieces).strip(), budget)
+
+    except requests.exceptions.Timeout:
+        return "Error: Request timeout - remote server took too long to respond"
+    except requests.exceptions.ConnectionError:
+        return f"Error: Cannot connect to Ollama server at {base_url}"
     except Exception as e:
         return f"Error: {str(e)}"
 
-def get_available_models_cli():
-    """Get available models via CLI fallback"""
+def call_ollama_chat(model_name, messages, base_url=None, timeout=None):
+    """
+    Call Ollama's /api/chat with a message list. Sending the conversation
+    as messages (instead of one flattened prompt) lets the backend reuse
+    the KV cache for the unchanged prefix. Streams so a cancelled request
+    stops the generation. Hedged on a second backend when enabled.
+    """
+    base_url = base_url or OLLAMA_BASE_URL
+    delay = hedge_delay(model_name)
+    alternates = [url for url in OLLAMA_URLS if url != base_url]
+    if not OLLAMA_HEDGING or delay is None or not alternates:
+        return _call_ollama_chat(model_name, messages, base_url, timeout)
+    return _hedged_chat(model_name, messages, base_url, alternates, timeout, delay)
+
+def _call_ollama_chat(model_name, messages, base_url, timeout=None, on_first_token=None):
+    """One /api/chat generation; on_first_token() is called when content starts arriving"""
+    if is_cancelled():
+        return _cancelled_error()
+    timeout = call_timeout(model_name, timeout)
+    if timeout <= 0:
+        return _deadline_error()
+    text = ''.join(m.get("content", "") for m in messages)
+    budget = plan_budget(None, text, model_name)
+    if budget.error:
+        return budget.error
+
+    started = time.time()
+    pieces = []
+    token = current_token()
     try:
-        result = subprocess.run(
-            ['ollama', 'list'],
-            capture_output=True,
-            text=True,
-            timeout=10
+        session = create_ollama_session()
+        logging.info(f"[INFO] Ollama chat: {model_name} at {base_url}, {len(messages)} messages")
+
+        response = session.post(
+            f"{base_url}/api/chat",
+            json={
+                "model": model_name,
+                "messages": messages,
+                "stream": True,
+                "options": generation_options(GENERATE_OPTIONS, budget)
+            },
+            timeout=timeout,
+            stream=True
+        )
+
+        if response.status_code != 200:
+            return _http_error(response, model_name)
+
+        unregister = token.on_cancel(response.close) if token else (lambda: None)
+        try:
+            for line in response.iter_lines():
+                if token and token.cancelled:
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    return f"Error: {chunk['error']}"
+                content = chunk.get("message", {}).get("content", "")
+                if content and not pieces:
+                    observe('time_to_first_token_s', time.time() - started, model=model_name)
+                    if on_first_token is not None:
+                        on_first_token()
+                pieces.append(content)
+                if chunk.get("done"):
+                    _record_eval_counts(model_name, text, chunk)
+                    break
+                if time.time() - started > timeout:
+                    return "Error: Request timeout - remote server took too long to respond"
+        except Exception:
+            if not (token and token.cancelled):
+                raise
+        finally:
+            unregister()
+            response.close()
+
+        if token and token.cancelled:
+            _record_cancellation(model_name, time.time() - started)
+            return _cancelled_error()
+        observe('model_latency_s', time.time() - started, model=model_name)
+        return ''.join(pieces).strip()
+
+    except requests.exceptions.Timeout:
+        return "Error: Request timeout - remote server took too long to respond"
+    except requests.exceptions.ConnectionError:
+        return f"Error: Cannot connect to Ollama server at {base_url}"
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def call_ollama_local(model_name, prompt, timeout=None, stream_validator=None, budget=None):
+    """Fallback for local Ollama: run the request on a managed local worker"""
+    if IS_REMOTE:
+        return "Error: Local fallback not available for remote Ollama servers"
+
+    try:
+        timeout = call_timeout(model_name, timeout)
+        with LOCAL_POOL.worker(timeout) as worker:
+            increment('local_worker_requests', model=model_name)
+            result = _call_ollama_http(model_name, prompt, timeout, stream_validator, budget,
+                                       base_url=worker.url, session=worker.session)
+    except LocalWorkerUnavailable as e:
+        return f"Error: {e}"
+
+    if result.startswith(f"Error: Model '{model_name}' not found"):
+        return f"Error: Model '{model_name}' not found. Available models: {get_available_models_local()}"
+    return result
+
+class HedgeBudget:
+    """Token bucket: each request earns ratio hedges, each hedge spends one"""
+
+    def __init__(self, ratio, burst):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = min(1.0, burst)
+        self.lock = threading.Lock()
+
+    def earn(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+HEDGES = HedgeBudget(HEDGE_BUDGET, HEDGE_BURST)
+
+def hedge_delay(model_name):
+    """Seconds to wait for a first token before hedging, None until the model's TTFT is known"""
+    if sample_count('time_to_first_token_s', model=model_name) < HEDGE_MIN_SAMPLES:
+        return None
+    return percentile('time_to_first_token_s', HEDGE_PERCENTILE, model=model_name)
+
+class _ChatAttempt:
+    """One generation of a hedged chat request, running in its own thread"""
+
+    def __init__(self, model_name, messages, base_url, timeout, progress):
+        self.base_url = base_url
+        self.token = CancelToken()
+        self.progress = progress
+        self.first_token_at = None
+        self.finished_at = None
+        self.on_answer = None    # called once with the attempt when it answers
+        self.result = None
+        self.done = threading.Event()
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(
+            target=context.run, args=(self._run, model_name, messages, timeout),
+            name=f"hedge-{base_url}", daemon=True
         )
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')[1:]
-            models = [line.split()[0] for line in lines if line.strip()]
-            return models
-    except:
-        pass
-    return []
-
-def call_ollama_smart(model_name, prompt, timeout=240):
+
+    def _run(self, model_name, messages, timeout):
+        try:
+            with token_scope(self.token):
+                self.result = _call_ollama_chat(model_name, messages, self.base_url, timeout,
+                                                on_first_token=self._first_token)
+        except Exception as e:
+            self.result = f"Error: {str(e)}"
+        finally:
+            with self.progress:
+                self.finished_at = time.time()
+                self.done.set()
+                self.progress.notify_all()
+                callback = self.on_answer if self.first_token_at is None and self.answered() else None
+            if callback:
+                callback(self)
+
+    def _first_token(self):
+        with self.progress:
+            self.first_token_at = time.time()
+            self.progress.notify_all()
+            callback = self.on_answer
+        if callback:
+            callback(self)
+
+    def answered(self):
+        """Producing output, or finished without an error"""
+        return self.first_token_at is not None or (self.done.is_set() and not self.result.startswith("Error:"))
+
+    def answered_at(self):
+        return self.first_token_at or self.finished_at
+
+def _first_answered(attempts):
+    """The attempt that started answering first, else the primary"""
+    answered = [a for a in attempts if a.answered()]
+    return min(answered, key=lambda a: a.answered_at()) if answered else attempts[0]
+
+def _hedged_chat(model_name, messages, base_url, alternates, timeout, delay):
+    """Chat generation duplicated on an alternate backend if the first token is late
+
+    When the hedge wins, the primary runs on until its own first token, so
+    the latency saved is measured, and is cancelled then; a losing hedge is
+    cancelled right away.
     """
-    Smart Ollama caller that handles both local and remote servers
+    HEDGES.earn()
+    increment('hedge_eligible', model=model_name)
+    started = time.time()
+    progress = threading.Condition()
+    attempts = [_ChatAttempt(model_name, messages, base_url, timeout, progress)]
+
+    # The request's own cancellation (client gone, deadline) stops every attempt
+    parent = current_token()
+    unregister = parent.on_cancel(
+        lambda: [attempt.token.cancel(parent.reason) for attempt in list(attempts)]
+    ) if parent else (lambda: None)
+
+    def settled():
+        return any(a.answered() for a in attempts) or all(a.done.is_set() for a in attempts)
+
+    try:
+        attempts[0].thread.start()
+        with progress:
+            progress.wait_for(settled, timeout=delay)
+        if not settled():
+            if HEDGES.spend():
+                # Another backend than the conversation's, picked by request time
+                alternate = alternates[int(started * 1000) % len(alternates)]
+                increment('hedges_sent', model=model_name)
+                logging.info(f"[HEDGE] {model_name}: no first token from {base_url} after "
+                             f"{delay:.2f}s, hedging on {alternate}")
+                attempts.append(_ChatAttempt(model_name, messages, alternate, timeout, progress))
+                attempts[-1].thread.start()
+            else:
+                increment('hedge_budget_exhausted', model=model_name)
+        with progress:
+            progress.wait_for(settled)
+            winner = _first_answered(attempts)
+            primary = attempts[0]
+            measure = winner is not primary and primary.answered_at() is None and not primary.done.is_set()
+            if measure:
+                def measured(attempt):
+                    increment('hedge_latency_saved_s', attempt.answered_at() - winner.answered_at(),
+                              model=model_name)
+                    attempt.token.cancel("hedge lost")
+                primary.on_answer = measured
+        for attempt in attempts:
+            if attempt is not winner and not (measure and attempt is primary):
+                attempt.token.cancel("hedge lost")
+        winner.done.wait()
+    finally:
+        unregister()
+
+    if winner is not primary:
+        increment('hedge_wins', model=model_name)
+        if not measure and primary.answered():
+            # Both had answered by the time the winner was picked
+            increment('hedge_latency_saved_s', primary.answered_at() - winner.answered_at(), model=model_name)
+    return winner.result
+
+def get_available_models_local():
+    """Get available models from a local worker"""
+    try:
+        return LOCAL_POOL.models()
+    except (LocalWorkerUnavailable, requests.exceptions.RequestException, ValueError):
+        return []
+
+def call_ollama_smart(model_name, prompt, timeout=None, stream_validator=None, operation=None,
+                      output_format=None):
     """
+    Smart Ollama caller that handles both local and remote servers.
+    operation selects the output budget and stop sequences (token_budget);
+    output_format ("json" or a JSON schema) constrains the output.
+    timeout defaults to the model's adaptive timeout and never runs past
+    the request's deadline.
+    """
+    if is_cancelled():
+        return _cancelled_error()
+    timeout = call_timeout(model_name, timeout)
+    if timeout <= 0:
+        return _deadline_error()
+    budget = plan_budget(operation, prompt, model_name, output_format)
+    if budget.error:
+        return budget.error
+    started = time.time()
+    result = _call_ollama_smart(model_name, prompt, timeout, stream_validator, budget)
+    if not result.startswith("Error:"):
+        observe('model_latency_s', time.time() - started, model=model_name)
+    return result
+
+def _call_ollama_http(model_name, prompt, timeout, stream_validator, budget, base_url=None, session=None):
+    # Streaming lets a cancelled request close the connection mid-generation
+    if stream_validator is not None or current_token() is not None:
+        return call_ollama_http_stream(model_name, prompt, stream_validator, timeout, budget, base_url, session)
+    return call_ollama_http(model_name, prompt, timeout, budget, base_url, session)
+
+def _call_ollama_smart(model_name, prompt, timeout, stream_validator=None, budget=None):
     # For remote servers, only use HTTP
     if IS_REMOTE:
-        return call_ollama_http(model_name, prompt)
+        return _call_ollama_http(model_name, prompt, timeout, stream_validator, budget)
     
     # For local servers, try HTTP first, then CLI fallback
     if check_ollama_availability():
 
-        result = call_ollama_http(model_name, prompt, timeout)
-        if not result.startswith("Error:"):
+        result = _call_ollama_http(model_name, prompt, timeout, stream_validator, budget)
+        if not result.startswith("Error:") or result.startswith((STREAM_ABORT_PREFIX, CANCELLED_PREFIX)):
             return result
-        # If HTTP fails, try CLI
-        return call_ollama_cli(model_name, prompt)
+        # If HTTP fails, try a local worker with whatever time the deadline leaves
+        timeout = call_timeout(model_name, timeout)
+        if timeout <= 0:
+            return _deadline_error()
+        return call_ollama_local(model_name, prompt, timeout, stream_validator, budget)
     else:
-        # Ollama not available via HTTP, try CLI
-        return call_ollama_cli(model_name, prompt)
+        # Ollama not available via HTTP, try a local worker
+        return call_ollama_local(model_name, prompt, timeout, stream_validator, budget)
 
-def get_available_models():
-    """Get available models from Ollama server"""
-    try:
-        if check_ollama_availability():
-            session = create_ollama_session()
-            response = session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
-            models_data = response.json()
-            models = [model["name"] for model in models_data.get("models", [])]
-            method = "http"
+def cascade_chain(model_name):
+    """Models to try for a request: configured small models, then the requested one"""
+    chain = [m for m in CASCADE_MODELS if m != model_name]
+    chain.append(model_name)
+    return chain
+
+def call_ollama_cascade(model_name, prompt, validator, endpoint="default", timeout=None,
+                        stream_validator_factory=None, output_format=None):
+    """
+    Try the cascade's small models first and escalate to model_name only
+    when the endpoint's validator rejects the output.
+
+    validator(result) returns None when the output is acceptable, or a
+    short reason string. stream_validator_factory, when given, builds a
+    fresh streaming validator per attempt so a generation going wrong is
+    cancelled mid-stream and escalated (or retried on the final model)
+    right away. Returns (result, model_used).
+    """
+    chain = cascade_chain(model_name)
+    attempts = chain + [chain[-1]] * (STREAM_RETRIES if stream_validator_factory else 0)
+    started = time.time()
+    increment('cascade_requests', endpoint=endpoint)
+    result = ""
+
+    for position, model in enumerate(attempts):
+        stream_validator = stream_validator_factory() if stream_validator_factory else None
+        result = call_ollama_smart(model, prompt, timeout, stream_validator, operation=endpoint,
+                                   output_format=output_format)
+        if result.startswith((CANCELLED_PREFIX, INPUT_TOO_LARGE_PREFIX, DEADLINE_PREFIX)):
+            return result, model
+        aborted = result.startswith(STREAM_ABORT_PREFIX)
+        if aborted:
+            increment('cascade_stream_aborts', endpoint=endpoint, model=model)
+        final = position == len(attempts) - 1
+        if final:
+            break
+
+        if position >= len(chain) - 1:
+            # Final model already ran: only a stream abort earns a retry
+            if not aborted:
+                break
+            logging.info(f"[CASCADE] {endpoint}: {model} aborted ({result}), retrying")
+            continue
+
+        reason = result if result.startswith("Error:") else validator(result)
+        if reason is None:
+            increment('cascade_accepted', endpoint=endpoint, model=model)
+            # Compare against what the final model usually takes
+            expected = percentile('model_latency_s', 50, model=chain[-1])
+            if expected is not None:
+                saved = max(0.0, expected - (time.time() - started))
+                increment('cascade_latency_saved_s', saved, endpoint=endpoint)
+            logging.info(f"[CASCADE] {endpoint}: accepted {model}")
+            return result, model
+
+        increment('cascade_escalations', endpoint=endpoint, model=model)
+        logging.info(f"[CASCADE] {endpoint}: {model} rejected ({reason[:100]}), escalating")
+
+    if len(chain) > 1:
+        if result.startswith("Error:"):
+            increment('cascade_failed', endpoint=endpoint, model=chain[-1])
         else:
-            models = get_available_models_cli() if not IS_REMOTE else []
-            method = "cli" if not IS_REMOTE else "none"
-        
-        return {
-            "available_models": models,
-            "method": method,
-            "server_type": "remote" if IS_REMOTE else "local"
-        }
+            increment('cascade_accepted', endpoint=endpoint, model=chain[-1])
+    return result, chain[-1]
 
-    except Exception as e:
-        return {"error": f"Failed to get models: {str(e)}"}
\ No newline at end of file
+def get_available_models():
+    """Get available models from the cached Ollama snapshot"""
+    snapshot = get_ollama_snapshot()
+    return {
+        "available_models": list(snapshot.models),
+        "running_models": snapshot.running,
+        "method": snapshot.method,
+        "server_type": "remote" if snapshot.is_remote else "local",
+        "checked_at": snapshot.checked_at or None
+    }
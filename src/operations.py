@@ -0,0 +1,196 @@
+import os
+import hashlib
+import logging
+from collections import namedtuple
+
+from code_processor import (
+    format_prompt_for_array_comments,
+    format_prompt_for_remove_all_comments,
+    clean_model_output,
+    clean_removed_comments_output,
+    count_array_elements,
+    validate_corrected_code,
+    validate_numbered_output,
+    validate_comment_free_output
+)
+from liturgical_processor import renumber_verses_with_cascade, parse_verses_from_array
+from ollama_client import call_ollama_cascade
+from swift_array import parse_array_elements, number_elements, strip_comments
+from stream_validation import numbering_validator, literal_validator
+from shared_store import STORE
+from metrics import increment
+
+# Code transforms shared by the HTTP endpoints, /api/batch and the CLI.
+# Each returns a dict of result fields, or {"error": "..."} on failure.
+
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 86400))   # 0 disables
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 2000))
+
+def read_code_file(code_file, root=None):
+    """Read a code file, relative paths resolve against the working directory
+
+    With root, the path resolves against root and must stay inside it
+    (symlinks followed); anything else raises PermissionError.
+    """
+    if root is not None:
+        root = os.path.realpath(root)
+        resolved = os.path.realpath(os.path.join(root, code_file))
+        if os.path.commonpath([root, resolved]) != root:
+            raise PermissionError(f"Code file outside {root}: {code_file}")
+        code_file = resolved
+    elif not os.path.isabs(code_file):
+        code_file = os.path.join(os.getcwd(), code_file)
+    with open(code_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def verified_output(operation, code, output, model, language):
+    """(output, repair report or None) with the elements the model broke
+    regenerated, or (None, "Error: ...") when the output can't be repaired"""
+    # Imported late: the verifier runs its windows through run_operation
+    from output_verifier import repair_output
+
+    repaired, report = repair_output(operation, code, output, model, language)
+    if repaired is None:
+        return None, f"Error: Output failed verification: {report}"
+    return repaired, report
+
+def run_fix_array_comments(code, model, language='swift'):
+    """Add sequential /* N */ comments using the model"""
+    prompt = format_prompt_for_array_comments(code, language)
+    result, model_used = call_ollama_cascade(
+        model, prompt,
+        lambda raw: validate_numbered_output(code, clean_model_output(raw, code)),
+        endpoint='fix-array-comments',
+        stream_validator_factory=lambda: numbering_validator(code)
+    )
+    if result.startswith("Error:"):
+        return {"error": result}
+
+    cleaned_output = clean_model_output(result, code)
+    validated_output = validate_corrected_code(code, cleaned_output)
+    if validated_output.startswith("Error:"):
+        return {"error": validated_output}
+
+    cleaned_output, repaired = verified_output('fix-array-comments', code, cleaned_output, model, language)
+    if cleaned_output is None:
+        return {"error": repaired}
+
+    return {
+        "corrected_code": cleaned_output,
+        "elements_count": count_array_elements(cleaned_output),
+        "model_used": model_used,
+        "repaired": repaired
+    }
+
+def run_remove_all_comments(code, model, language='swift'):
+    """Remove all comments using the model"""
+    prompt = format_prompt_for_remove_all_comments(code, language)
+    result, model_used = call_ollama_cascade(
+        model, prompt,
+        lambda raw: validate_comment_free_output(code, clean_removed_comments_output(raw, code)),
+        endpoint='remove-all-comments',
+        stream_validator_factory=lambda: literal_validator(code)
+    )
+    if result.startswith("Error:"):
+        return {"error": result}
+
+    # Specialized cleaning ensures all comments are gone
+    cleaned_output = clean_removed_comments_output(result, code)
+    validated_output = validate_corrected_code(code, cleaned_output)
+    if validated_output.startswith("Error:"):
+        return {"error": validated_output}
+
+    cleaned_output, repaired = verified_output('remove-all-comments', code, cleaned_output, model, language)
+    if cleaned_output is None:
+        return {"error": repaired}
+
+    return {
+        "cleaned_code": cleaned_output,
+        "model_used": model_used,
+        "repaired": repaired
+    }
+
+def run_renumber_verses(code, model, language='swift'):
+    """Renumber verse comments using the model"""
+    result, model_used = renumber_verses_with_cascade(code, model=model)
+    if result.startswith("Error:"):
+        return {"error": result}
+
+    result, repaired = verified_output('renumber-verses', code, result, model, language)
+    if result is None:
+        return {"error": repaired}
+
+    return {
+        "renumbered_code": result,
+        "model_used": model_used,
+        "repaired": repaired
+    }
+
+def run_number_elements(code, model=None, language='swift'):
+    """Number every array element locally, no model involved"""
+    numbered = number_elements(code)
+    return {
+        "corrected_code": numbered,
+        "elements_count": count_array_elements(numbered)
+    }
+
+def run_strip_comments(code, model=None, language='swift'):
+    """Remove all comments locally, no model involved"""
+    return {"cleaned_code": strip_comments(code)}
+
+def run_count_elements(code, model=None, language='swift'):
+    """Count array elements and how many carry a number comment"""
+    elements = parse_array_elements(code)
+    return {
+        "elements_count": len(elements),
+        "numbered_count": sum(1 for e in elements if e.number is not None)
+    }
+
+def run_parse_verses(code, model=None, language='swift'):
+    """Extract verse strings from a Swift array"""
+    verses = parse_verses_from_array(code)
+    return {
+        "verses": verses,
+        "verse_count": len(verses)
+    }
+
+Operation = namedtuple('Operation', ['fn', 'uses_model'])
+
+OPERATIONS = {
+    'fix-array-comments': Operation(run_fix_array_comments, True),
+    'remove-all-comments': Operation(run_remove_all_comments, True),
+    'renumber-verses': Operation(run_renumber_verses, True),
+    'number-elements': Operation(run_number_elements, False),
+    'strip-comments': Operation(run_strip_comments, False),
+    'count-elements': Operation(run_count_elements, False),
+    'parse-verses': Operation(run_parse_verses, False),
+}
+
+def _cache_key(name, code, model, language):
+    return hashlib.sha256('\0'.join((name, model or '', language, code)).encode('utf-8')).hexdigest()
+
+def run_operation(name, code, model, language='swift'):
+    """Run a named operation, turning unexpected failures into error dicts
+
+    Successful model results are cached in the shared store, so the same
+    input sent to any server process is answered without the model.
+    """
+    operation = OPERATIONS.get(name)
+    if operation is None:
+        return {"error": f"Unknown operation: {name}"}
+    key = None
+    if operation.uses_model and RESPONSE_CACHE_TTL > 0:
+        key = _cache_key(name, code, model, language)
+        cached = STORE.get('responses', key)
+        if cached is not None:
+            increment('response_cache_hits')
+            return cached
+        increment('response_cache_misses')
+    try:
+        result = operation.fn(code, model, language)
+    except Exception as e:
+        logging.exception(f"[OPERATION] {name} failed")
+        return {"error": f"Server error: {str(e)}"}
+    if key and "error" not in result:
+        STORE.set('responses', key, result, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_SIZE)
+    return result
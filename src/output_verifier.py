@@ -0,0 +1,172 @@
+import os
+import difflib
+import logging
+from collections import namedtuple
+
+from incremental import NUMBERING_OPERATIONS, element_chunks, process_window, ensure_comma
+from swift_array import parse_array_elements, number_elements, strip_comments, has_comments
+from metrics import increment
+
+# Structural check of a transform's output against its input. The string
+# literals of both are aligned element by element, so a verse the model
+# dropped, rewrote, duplicated or mis-numbered is located exactly. Only the
+# broken elements, with VERIFY_CONTEXT neighbours on each side, are sent to
+# the model again and spliced into the output; numbering and leftover
+# comments are fixed locally. If more than VERIFY_MAX_REPAIR_FRACTION of the
+# elements are broken the output is rejected instead.
+
+VERIFY_CONTEXT = int(os.getenv('VERIFY_CONTEXT', 1))
+VERIFY_MAX_REPAIR_FRACTION = float(os.getenv('VERIFY_MAX_REPAIR_FRACTION', 0.5))
+
+# One run of broken input elements [start, end). 'added' marks output
+# elements with no input counterpart, inserted before input element start.
+#   kind  - 'lost', 'altered', 'added', 'misnumbered' or 'comment'
+Problem = namedtuple('Problem', ['kind', 'start', 'end'])
+
+# Problems that need the model; the rest are fixed without it
+MODEL_PROBLEMS = ('lost', 'altered')
+
+
+def _align(texts, elements):
+    matcher = difflib.SequenceMatcher(a=texts, b=[e.text for e in elements], autojunk=False)
+    return matcher.get_opcodes()
+
+
+def _add(problems, kind, start, end):
+    if problems and problems[-1].kind == kind and problems[-1].end == start:
+        problems[-1] = Problem(kind, problems[-1].start, end)
+    else:
+        problems.append(Problem(kind, start, end))
+
+
+def verify_output(original, output, numbered):
+    """Problems of output's array elements against original's; [] when none
+
+    numbered outputs must label element i with /* i+1 */, the others must
+    carry no comments next to their elements.
+    """
+    texts = [e.text for e in parse_array_elements(original)]
+    if not texts:
+        return []
+    elements = parse_array_elements(output)
+    split = element_chunks(output)
+
+    problems = []
+    for tag, i1, i2, j1, j2 in _align(texts, elements):
+        if tag == 'delete':
+            _add(problems, 'lost', i1, i2)
+        elif tag == 'insert':
+            problems.append(Problem('added', i1, i1))
+        elif tag == 'replace':
+            _add(problems, 'altered', i1, i2)
+        else:
+            for k in range(i2 - i1):
+                if numbered and elements[j1 + k].number != i1 + k + 1:
+                    _add(problems, 'misnumbered', i1 + k, i1 + k + 1)
+                elif not numbered and split is not None and has_comments(split[2][j1 + k]):
+                    _add(problems, 'comment', i1 + k, i1 + k + 1)
+    return problems
+
+
+def describe(problems):
+    return ', '.join(f"{p.kind} {p.start + 1}" + (f"-{p.end}" if p.end - p.start > 1 else '')
+                     for p in problems[:10])
+
+
+def _windows(problems, count):
+    """Merged [start, end) input ranges to regenerate, with context"""
+    windows = []
+    for p in problems:
+        start = max(0, p.start - VERIFY_CONTEXT)
+        end = min(count, p.end + VERIFY_CONTEXT)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def _splice(operation, original, output, windows, model, language):
+    """output with the input windows regenerated and unmatched elements dropped"""
+    split_in = element_chunks(original)
+    split_out = element_chunks(output)
+    if split_in is None or split_out is None:
+        return None, "elements share a line"
+    texts, _, chunks, _ = split_in
+    _, prefix, out_chunks, suffix = split_out
+
+    # Output chunk of every input element that came through unchanged
+    source = [None] * len(texts)
+    for tag, i1, i2, j1, _ in _align(texts, parse_array_elements(output)):
+        if tag == 'equal':
+            for k in range(i2 - i1):
+                source[i1 + k] = j1 + k
+
+    body = []
+    position = 0
+    for start, end in windows + [(len(texts), len(texts))]:
+        for i in range(position, start):
+            if source[i] is None:
+                return None, f"element {i + 1} has no output"
+            body.append(out_chunks[source[i]])
+        if start < end:
+            processed, error = process_window(operation, chunks[start:end], model, language)
+            if processed is None:
+                return None, error
+            if [e.text for e in parse_array_elements('[' + ''.join(processed) + ']')] != texts[start:end]:
+                return None, f"elements {start + 1}-{end} changed again"
+            body.extend(processed)
+        position = end
+
+    for i, chunk in enumerate(body[:-1]):
+        body[i] = ensure_comma(chunk)
+    return prefix + ''.join(body) + suffix, None
+
+
+def repair_output(operation, original, output, model, language='swift'):
+    """(output, report) with broken elements repaired, or (None, reason)
+
+    report is None when output passed as it was, else the problems found
+    and how many elements were regenerated.
+    """
+    numbered = operation in NUMBERING_OPERATIONS
+    problems = verify_output(original, output, numbered)
+    if not problems:
+        return output, None
+
+    count = len(parse_array_elements(original))
+    for p in problems:
+        increment('verifier_problems', max(1, p.end - p.start), kind=p.kind, operation=operation)
+    logging.info(f"[VERIFY] {operation}: {describe(problems)} of {count} elements")
+
+    windows = _windows([p for p in problems if p.kind in MODEL_PROBLEMS], count)
+    regenerated = sum(end - start for start, end in windows)
+    if regenerated > count * VERIFY_MAX_REPAIR_FRACTION:
+        increment('verifier_rejected', operation=operation)
+        return None, f"{describe(problems)} of {count} elements"
+
+    repaired = output
+    if windows or any(p.kind == 'added' for p in problems):
+        repaired, error = _splice(operation, original, output, windows, model, language)
+        if repaired is None:
+            logging.info(f"[VERIFY] {operation}: repair failed ({error})")
+            increment('verifier_rejected', operation=operation)
+            return None, f"{describe(problems)} of {count} elements, repair failed: {error}"
+    if numbered:
+        repaired = number_elements(repaired)
+    elif any(p.kind == 'comment' for p in problems):
+        repaired = strip_comments(repaired)
+
+    remaining = verify_output(original, repaired, numbered)
+    if remaining:
+        increment('verifier_rejected', operation=operation)
+        return None, f"{describe(remaining)} of {count} elements after repair"
+
+    increment('verifier_repairs', operation=operation)
+    increment('verifier_regenerated_elements', regenerated, operation=operation)
+    # Elements a full rerun would have sent to the model again
+    increment('verifier_elements_saved', count - regenerated, operation=operation)
+    return repaired, {
+        "problems": [p._asdict() for p in problems],
+        "regenerated_elements": regenerated
+    }
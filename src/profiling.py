@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import hmac
+import uuid
+import logging
+import tempfile
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import request, g
+
+# On-demand sampling profiler. An admin request with the X-Profile: 1
+# header (or ?profile=1) is sampled every PROFILE_SAMPLE_INTERVAL seconds
+# on every thread working for it: the request thread and the scheduler
+# workers it hands the model call to. The profile is written to PROFILE_DIR
+# as collapsed stacks (<id>.folded, for flamegraph.pl / speedscope) and
+# speedscope JSON, and served at /api/profiles/<id>. The response carries
+# the id in X-Profile-Id.
+#
+# PROFILE_CONTINUOUS_HZ > 0 also samples all busy threads at that rate and
+# aggregates the hot stacks, served at /api/profiles/continuous.
+#
+# Admin means the X-Admin-Token header matches PROFILE_ADMIN_TOKEN. With no
+# token configured nobody may profile, unless PROFILE_ALLOW_LOOPBACK=1 lets
+# loopback clients in (behind a local reverse proxy every client is one).
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'coding_server_profiles'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN')
+PROFILE_ALLOW_LOOPBACK = os.getenv('PROFILE_ALLOW_LOOPBACK', '0').lower() in ('1', 'true', 'yes')
+PROFILE_CONTINUOUS_HZ = float(os.getenv('PROFILE_CONTINUOUS_HZ', 0))
+CONTINUOUS_MAX_STACKS = 5000
+
+LOOPBACK = ('127.0.0.1', '::1', 'localhost')
+# Leaf frames in these files are threads waiting for work, not doing it
+IDLE_FILES = ('threading.py', 'selectors.py', 'socketserver.py', 'queue.py', 'thread.py', 'ssl.py')
+
+_current_profile = contextvars.ContextVar('profile', default=None)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    """Frames root first as (name, file, line)"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((_frame_name(code), code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class RequestProfile:
+    """Stack samples of the threads working for one request"""
+
+    def __init__(self, profile_id, label):
+        self.id = profile_id
+        self.label = label
+        self.threads = Counter()    # thread ident -> attach count
+        self.samples = Counter()    # stack -> sample count
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.duration = None
+        self.stop_event = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name=f"profile-{profile_id}", daemon=True)
+
+    def attach(self, ident):
+        with self.lock:
+            self.threads[ident] += 1
+
+    def detach(self, ident):
+        with self.lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+
+    def _sample(self):
+        while not self.stop_event.wait(PROFILE_SAMPLE_INTERVAL):
+            with self.lock:
+                idents = list(self.threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = _stack(frame)
+                    with self.lock:
+                        self.samples[stack] += 1
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.sampler.join()
+        self.duration = time.time() - self.started
+
+
+def collapsed(samples):
+    """Brendan Gregg's folded format: one 'a;b;c count' line per stack"""
+    return '\n'.join(f"{';'.join(f[0] for f in stack)} {count}"
+                     for stack, count in samples.most_common()) + '\n'
+
+
+def speedscope(samples, name, duration, interval):
+    """Speedscope 'sampled' profile for the samples"""
+    frames, index = [], {}
+    profile_samples, weights = [], []
+    for stack, count in samples.items():
+        indexes = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0].split(' (')[0], "file": frame[1], "line": frame[2]})
+            indexes.append(index[frame])
+        profile_samples.append(indexes)
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "coding-server",
+        "name": name,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": round(duration or sum(weights), 6),
+            "samples": profile_samples,
+            "weights": weights
+        }]
+    }
+
+
+def profile_path(profile_id, fmt):
+    extension = 'folded' if fmt == 'collapsed' else 'speedscope.json'
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _save(profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile.id, 'collapsed'), 'w', encoding='utf-8') as f:
+        f.write(collapsed(profile.samples))
+    with open(profile_path(profile.id, 'speedscope'), 'w', encoding='utf-8') as f:
+        json.dump(speedscope(profile.samples, profile.label, profile.duration, PROFILE_SAMPLE_INTERVAL), f)
+
+    # Keep the newest PROFILE_KEEP profiles
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith('.folded')),
+                   key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)))
+    for name in names[:max(0, len(names) - PROFILE_KEEP)]:
+        for fmt in ('collapsed', 'speedscope'):
+            try:
+                os.remove(profile_path(name[:-len('.folded')], fmt))
+            except OSError:
+                pass
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = [n for n in os.listdir(PROFILE_DIR) if n.endswith('.folded')]
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)), reverse=True)
+    return [n[:-len('.folded')] for n in names]
+
+
+def is_admin():
+    """Profiling is limited to the admin token holder; loopback only when allowed and no token is set"""
+    if PROFILE_ADMIN_TOKEN:
+        supplied = request.headers.get('X-Admin-Token', '')
+        return hmac.compare_digest(supplied.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8'))
+    return PROFILE_ALLOW_LOOPBACK and request.remote_addr in LOOPBACK
+
+
+def requested():
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    return flag is not None and flag.lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def attached():
+    """Sample the current thread for the active request profile, if any"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profile.attach(ident)
+    try:
+        yield
+    finally:
+        profile.detach(ident)
+
+
+def start_request_profile():
+    """before_request hook"""
+    if not requested() or not is_admin():
+        return
+    profile = RequestProfile(uuid.uuid4().hex[:16], f"{request.method} {request.path}")
+    g.profile = profile
+    g.profile_reset = _current_profile.set(profile)
+    profile.attach(threading.get_ident())
+    profile.start()
+
+
+def finish_request_profile(response):
+    """after_request hook; sampling ends when the response body has been sent"""
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    response.headers['X-Profile-Id'] = profile.id
+
+    def on_close():
+        profile.stop()
+        try:
+            _save(profile)
+            logging.info(f"[PROFILE] {profile.label}: {sum(profile.samples.values())} samples "
+                         f"in {profile.duration:.3f}s saved as {profile.id}")
+        except OSError as e:
+            logging.warning(f"[PROFILE] Cannot save profile {profile.id}: {e}")
+
+    response.call_on_close(on_close)
+    return response
+
+
+def end_request_context(exc=None):
+    """teardown_request hook: leave the profile context of this thread"""
+    reset = g.pop('profile_reset', None)
+    if reset is not None:
+        g.profile.detach(threading.get_ident())
+        try:
+            _current_profile.reset(reset)
+        except ValueError:
+            _current_profile.set(None)   # torn down from another context
+
+
+class ContinuousSampler:
+    """Low-rate sampling of every busy thread, aggregated into hot stacks"""
+
+    def __init__(self, hz):
+        self.interval = 1.0 / hz
+        self.samples = Counter()
+        self.total = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="profile-continuous", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            for ident, frame in sys._current_frames().items():
+                if ident == me or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = _stack(frame)
+                with self.lock:
+                    self.samples[stack] += 1
+                    self.total += 1
+                    if len(self.samples) > CONTINUOUS_MAX_STACKS:
+                        # Drop the rarest half so memory stays bounded
+                        self.samples = Counter(dict(self.samples.most_common(CONTINUOUS_MAX_STACKS // 2)))
+
+    def start(self):
+        self.thread.start()
+
+    def snapshot(self):
+        with self.lock:
+            samples = Counter(self.samples)
+            total = self.total
+        return samples, total
+
+
+CONTINUOUS = None
+
+
+def install(app):
+    """Register the per-request hooks and start continuous sampling if configured"""
+    global CONTINUOUS
+    app.before_request(start_request_profile)
+    app.after_request(finish_request_profile)
+    app.teardown_request(end_request_context)
+    if PROFILE_CONTINUOUS_HZ > 0 and CONTINUOUS is None:
+        CONTINUOUS = ContinuousSampler(PROFILE_CONTINUOUS_HZ)
+        CONTINUOUS.start()
+        logging.info(f"[PROFILE] Continuous sampling at {PROFILE_CONTINUOUS_HZ} Hz")
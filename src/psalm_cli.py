@@ -0,0 +1,186 @@
+"""Process a tree of Swift psalm sources with the same code the server uses.
+
+Usage:
+    python src/psalm_cli.py psalms/ --operation renumber
+    python src/psalm_cli.py psalms/ --operation remove-comments --local --output out/
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from operations import run_operation
+from code_processor import strip_code_fence
+
+MANIFEST_NAME = '.psalm_manifest.json'
+MANIFEST_VERSION = 1
+
+# CLI operation -> (model operation, local deterministic operation)
+CLI_OPERATIONS = {
+    'renumber': ('renumber-verses', 'number-elements'),
+    'remove-comments': ('remove-all-comments', 'strip-comments'),
+    'fix-array-comments': ('fix-array-comments', 'number-elements'),
+}
+RESULT_FIELDS = ('renumbered_code', 'corrected_code', 'cleaned_code')
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def atomic_write(path, text):
+    """Write text to path via a temp file and rename, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def find_sources(root, extensions):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+
+def process_file(source_path, target_path, operation, model):
+    """Run one operation on one file; executed inside a pool worker"""
+    started = time.time()
+    with open(source_path, 'r', encoding='utf-8') as f:
+        original = f.read()
+
+    result = run_operation(operation, original.strip(), model)
+    if "error" in result:
+        return {"error": result["error"]}
+
+    output = next(result[field] for field in RESULT_FIELDS if field in result)
+    output = strip_code_fence(output)
+    if original.endswith('\n') and not output.endswith('\n'):
+        output += '\n'
+
+    atomic_write(target_path, output)
+    return {
+        "input_hash": content_hash(original),
+        "output_hash": content_hash(output),
+        "elapsed": time.time() - started
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process Swift psalm sources in parallel")
+    parser.add_argument('root', help="Directory to walk")
+    parser.add_argument('--operation', '-op', choices=sorted(CLI_OPERATIONS), required=True)
+    parser.add_argument('--model', default=os.getenv('DEFAULT_MODEL', 'deepseek-coder:6.7b'))
+    parser.add_argument('--local', action='store_true',
+                        help="Use the deterministic transform instead of a model")
+    parser.add_argument('--output', '-o', help="Write results to this tree instead of in place")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--ext', default='.swift', help="Comma-separated file extensions")
+    parser.add_argument('--manifest', help=f"Manifest path (default: {MANIFEST_NAME} in the output tree or root)")
+    parser.add_argument('--force', action='store_true', help="Ignore the manifest and reprocess everything")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    root = os.path.abspath(args.root)
+    model_operation, local_operation = CLI_OPERATIONS[args.operation]
+    operation = local_operation if args.local else model_operation
+    model = None if args.local else args.model
+    manifest_path = args.manifest or os.path.join(args.output or root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    extensions = tuple(e.strip() for e in args.ext.split(',') if e.strip())
+
+    # Work out which files changed since the last run
+    pending = []
+    skipped = 0
+    for source_path in find_sources(root, extensions):
+        rel_path = os.path.relpath(source_path, root)
+        target_path = os.path.join(args.output, rel_path) if args.output else source_path
+        with open(source_path, 'rb') as f:
+            current_hash = hashlib.sha256(f.read()).hexdigest()
+
+        entry = manifest["files"].get(rel_path)
+        if (not args.force and entry
+                and entry.get("operation") == operation and entry.get("model") == model
+                and current_hash in (entry.get("input_hash"), entry.get("output_hash"))
+                and os.path.exists(target_path)):
+            skipped += 1
+            continue
+        pending.append((rel_path, source_path, target_path))
+
+    print(f"[CLI] {len(pending)} to process, {skipped} unchanged, operation {operation}"
+          f"{'' if args.local else f' with {model}'}, {args.jobs} jobs")
+
+    started = time.time()
+    processed = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(process_file, source_path, target_path, operation, model): rel_path
+            for rel_path, source_path, target_path in pending
+        }
+        for future in as_completed(futures):
+            rel_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+
+            if "error" in result:
+                failed += 1
+                print(f"[ERROR] {rel_path}: {result['error']}")
+                continue
+
+            processed += 1
+            manifest["files"][rel_path] = {
+                "operation": operation,
+                "model": model,
+                "input_hash": result["input_hash"],
+                "output_hash": result["output_hash"],
+                "processed_at": time.time()
+            }
+            print(f"[OK] {rel_path} ({result['elapsed']:.2f}s)")
+
+    if processed:
+        atomic_write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+
+    elapsed = time.time() - started
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"[DONE] {processed} processed, {skipped} skipped, {failed} failed "
+          f"in {elapsed:.2f}s ({rate:.1f} files/sec)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
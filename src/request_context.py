@@ -0,0 +1,169 @@
+import time
+import select
+import socket
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Per-request state that has to reach the Ollama client without being
+# threaded through every function signature. Values live in context
+# variables; the scheduler copies the context into its worker threads.
+
+class GenerationCancelled(Exception):
+    """Raised when work is abandoned because its cancel token fired"""
+
+
+class ClientDisconnected(Exception):
+    """Raised in the request thread when the HTTP client went away"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before its work can finish"""
+
+
+class CancelToken:
+    """Cancellation flag with callbacks that tear down in-flight upstream work"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.debug(f"[CANCEL] Callback failed: {e}")
+
+    def on_cancel(self, callback):
+        """Register callback; returns a function that unregisters it"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+_cancel_token = contextvars.ContextVar('cancel_token', default=None)
+
+
+def current_token():
+    return _cancel_token.get()
+
+
+def is_cancelled():
+    token = _cancel_token.get()
+    return token is not None and token.cancelled
+
+
+@contextmanager
+def token_scope(token):
+    """Make token the current cancel token for the duration of the block"""
+    reset = _cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        _cancel_token.reset(reset)
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+def current_deadline():
+    """Absolute time (time.time()) the current request must finish by, or None"""
+    return _deadline.get()
+
+
+def time_left():
+    """Seconds until the current deadline, None when there is none"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+def set_deadline(deadline):
+    """Make deadline current, keeping an earlier one already set; returns the reset token"""
+    outer = _deadline.get()
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    return _deadline.set(deadline)
+
+
+def reset_deadline(reset):
+    try:
+        _deadline.reset(reset)
+    except ValueError:
+        _deadline.set(None)   # reset from another context
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Make deadline current for the duration of the block (an earlier one wins)"""
+    reset = set_deadline(deadline)
+    try:
+        yield _deadline.get()
+    finally:
+        reset_deadline(reset)
+
+
+def client_disconnected(environ):
+    """True if the client closed its side of the connection
+
+    Peeks at the request socket (exposed by the werkzeug dev server and
+    gunicorn): a readable socket that returns no bytes has hit EOF.
+    """
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+
+_usage = contextvars.ContextVar('usage', default=None)
+
+
+def new_usage():
+    return {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+
+
+@contextmanager
+def usage_scope(usage=None):
+    """Collect token usage reported by Ollama for every call made in the block"""
+    usage = usage if usage is not None else new_usage()
+    reset = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(reset)
+
+
+def record_usage(prompt_tokens, completion_tokens):
+    usage = _usage.get()
+    if usage is None:
+        return
+    usage["prompt_tokens"] += prompt_tokens or 0
+    usage["completion_tokens"] += completion_tokens or 0
+    usage["calls"] += 1
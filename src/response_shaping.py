@@ -0,0 +1,104 @@
+import os
+import gzip
+import difflib
+import hashlib
+
+from flask import request
+
+from metrics import increment
+
+try:
+    import brotli
+except ImportError:  # optional, gzip covers every client
+    brotli = None
+
+# Response size controls for the code transform endpoints. By default they
+# echo original_code next to the full result; "response_shape" trims that:
+#   full   - original_code and the result (default, unchanged behaviour)
+#   slim   - the result only
+#   diff   - a unified diff from original_code to the result
+#   edits  - line edits against original_code, in the incremental "edits" format
+# JSON bodies above RESPONSE_COMPRESSION_MIN_BYTES are compressed when the
+# client accepts br or gzip.
+
+RESPONSE_SHAPES = ('full', 'slim', 'diff', 'edits')
+DEFAULT_RESPONSE_SHAPE = os.getenv('DEFAULT_RESPONSE_SHAPE', 'full')
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+
+def requested_shape(data):
+    return (data or {}).get('response_shape') or DEFAULT_RESPONSE_SHAPE
+
+
+def check_shape(data):
+    """Error message for an unknown response_shape, else None"""
+    shape = requested_shape(data)
+    if shape not in RESPONSE_SHAPES:
+        return f"Unknown response_shape: {shape} (expected one of {', '.join(RESPONSE_SHAPES)})"
+    return None
+
+
+def unified_diff(old, new, name='code'):
+    """Unified diff that also marks a missing final newline, so patch applies it"""
+    def lines(text):
+        result = text.splitlines(True)
+        if result and not result[-1].endswith('\n'):
+            result[-1] += '\n\\ No newline at end of file\n'
+        return result
+    return ''.join(difflib.unified_diff(lines(old), lines(new), f'a/{name}', f'b/{name}'))
+
+
+def shape_response(data, original, response, field):
+    """Apply the requested response_shape to an endpoint's response dict
+
+    field names the transformed code in response (corrected_code, ...).
+    """
+    from incremental import line_edits
+
+    shape = requested_shape(data)
+    if shape == 'full':
+        return response
+    response = dict(response)
+    response.pop('original_code', None)
+    response['response_shape'] = shape
+    if shape == 'slim' or field not in response:
+        return response
+
+    output = response.pop(field)
+    response['original_hash'] = hashlib.sha256(original.encode('utf-8')).hexdigest()
+    response['result_hash'] = hashlib.sha256(output.encode('utf-8')).hexdigest()
+    if shape == 'diff':
+        response['diff'] = unified_diff(original, output, field)
+    else:
+        response['patch'] = line_edits(original, output)
+    return response
+
+
+def compress_response(response):
+    """after_request hook: br or gzip for large JSON bodies"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        encoding, compressed = 'br', brotli.compress(body, quality=BROTLI_QUALITY)
+    elif accepted.quality('gzip') > 0:
+        encoding, compressed = 'gzip', gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    increment('compressed_responses', encoding=encoding)
+    increment('compression_saved_bytes', len(body) - len(compressed))
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
@@ -0,0 +1,178 @@
+import os
+import math
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from request_context import (
+    CancelToken, GenerationCancelled, ClientDisconnected, DeadlineExceeded,
+    token_scope, is_cancelled, client_disconnected, time_left
+)
+from metrics import increment, observe, percentile, sample_count
+from profiling import attached
+from ollama_client import CANCELLED_PREFIX, DEADLINE_PREFIX
+
+# Model calls are bounded by what the GPU(s) behind Ollama can serve at
+# once; deterministic work only needs a CPU and runs on its own pool so
+# it never waits behind a generation.
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', 2))
+FAST_CONCURRENCY = int(os.getenv('FAST_CONCURRENCY', min(8, (os.cpu_count() or 1) + 2)))
+DISCONNECT_POLL_INTERVAL = float(os.getenv('DISCONNECT_POLL_INTERVAL', 0.25))
+# Model task durations needed before admission trusts its wait estimate
+ADMISSION_MIN_SAMPLES = 10
+
+_model_executor = ThreadPoolExecutor(max_workers=MODEL_CONCURRENCY, thread_name_prefix='model')
+_fast_executor = ThreadPoolExecutor(max_workers=FAST_CONCURRENCY, thread_name_prefix='fast')
+
+_queue_lock = threading.Lock()
+_queued = 0
+_running = 0
+
+
+def _cut_short(result):
+    """True for a model result that was cancelled or stopped by its deadline"""
+    # Model calls return "Error: ..." strings, (text, model) pairs or error dicts
+    error = result
+    if isinstance(result, tuple) and result:
+        error = result[0]
+    elif isinstance(result, dict):
+        error = result.get("error")
+    return isinstance(error, str) and error.startswith((CANCELLED_PREFIX, DEADLINE_PREFIX))
+
+
+def _track(fn):
+    def run(*args, **kwargs):
+        global _queued, _running
+        with _queue_lock:
+            _queued -= 1
+            _running += 1
+        started = time.time()
+        try:
+            if is_cancelled():
+                # Abandoned while queued, don't start a generation nobody reads
+                raise GenerationCancelled("cancelled before start")
+            left = time_left()
+            if left is not None and left <= 0:
+                increment('deadline_shed', stage='queue')
+                raise DeadlineExceeded("deadline passed while queued")
+            with attached():
+                result = fn(*args, **kwargs)
+            # Only complete tasks tell how long one takes; cut-short ones
+            # would pull expected_completion down
+            if not is_cancelled() and not _cut_short(result):
+                observe('model_task_s', time.time() - started)
+            return result
+        finally:
+            with _queue_lock:
+                _running -= 1
+    return run
+
+
+def expected_completion():
+    """Seconds a model task queued now is expected to take, wait included; None until known"""
+    if sample_count('model_task_s') < ADMISSION_MIN_SAMPLES:
+        return None
+    typical = percentile('model_task_s', 50)
+    with _queue_lock:
+        ahead = _queued + _running
+    # Tasks ahead drain MODEL_CONCURRENCY at a time
+    waves = math.floor(ahead / MODEL_CONCURRENCY)
+    return (waves + 1) * typical
+
+
+def admit():
+    """Raise DeadlineExceeded if a new model task cannot finish before the deadline"""
+    left = time_left()
+    if left is None:
+        return
+    if left <= 0:
+        increment('deadline_shed', stage='admission')
+        raise DeadlineExceeded("deadline passed before the request was queued")
+    expected = expected_completion()
+    if expected is not None and expected > left:
+        increment('deadline_shed', stage='admission')
+        raise DeadlineExceeded(f"expected to take {expected:.1f}s, {left:.1f}s left")
+
+
+def submit_model_task(fn, *args, **kwargs):
+    """Queue a task that calls a model; at most MODEL_CONCURRENCY run at once"""
+    global _queued
+    with _queue_lock:
+        _queued += 1
+    future = _model_executor.submit(contextvars.copy_context().run, _track(fn), *args, **kwargs)
+
+    def forget_if_cancelled(f):
+        global _queued
+        if f.cancelled():
+            with _queue_lock:
+                _queued -= 1
+    future.add_done_callback(forget_if_cancelled)
+    return future
+
+
+def submit_fast_task(fn, *args, **kwargs):
+    """Run a deterministic task on the fast path"""
+    def run(*args, **kwargs):
+        with attached():
+            return fn(*args, **kwargs)
+    return _fast_executor.submit(contextvars.copy_context().run, run, *args, **kwargs)
+
+
+def run_until_disconnect(environ, fn, *args, **kwargs):
+    """Run a model task on behalf of an HTTP request, cancelling it if the client leaves
+
+    The request thread waits on the task and checks the client socket every
+    DISCONNECT_POLL_INTERVAL seconds. On disconnect the task's cancel token
+    fires (closing the upstream stream or killing the CLI process) and
+    ClientDisconnected is raised. Work that cannot finish by the request's
+    deadline is refused up front or cancelled, with DeadlineExceeded.
+    """
+    return run_all_until_disconnect(environ, fn, [args], **kwargs)[0]
+
+
+def run_all_until_disconnect(environ, fn, arg_lists, **kwargs):
+    """run_until_disconnect for several independent calls of fn; results in order
+
+    The calls share one cancel token, so a disconnect or a missed deadline
+    stops all of them.
+    """
+    admit()
+    token = CancelToken()
+    with token_scope(token):
+        futures = [submit_model_task(fn, *args, **kwargs) for args in arg_lists]
+
+    def cancel(reason):
+        for future in futures:
+            future.cancel()
+        token.cancel(reason)
+
+    for future in futures:
+        while True:
+            try:
+                future.result(timeout=DISCONNECT_POLL_INTERVAL)
+                break
+            except FutureTimeout:
+                if client_disconnected(environ):
+                    cancel("client disconnected")
+                    raise ClientDisconnected()
+                left = time_left()
+                if left is not None and left <= 0:
+                    cancel("deadline exceeded")
+                    increment('deadline_shed', stage='running')
+                    raise DeadlineExceeded("deadline passed while the model was working")
+    return [future.result() for future in futures]
+
+
+def queue_stats():
+    """Current depth of the model queue"""
+    with _queue_lock:
+        return {
+            "queued": _queued,
+            "running": _running,
+            "concurrency": MODEL_CONCURRENCY
+        }
+
+
+logging.info(f"[SCHEDULER] Model concurrency {MODEL_CONCURRENCY}, fast concurrency {FAST_CONCURRENCY}")
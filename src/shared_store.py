@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+# Key/value store for state that every server process should see: the
+# Ollama health snapshot, response and lexicon caches, incremental document
+# states and chat windows. With SHARED_STORE_PATH set (gunicorn.conf.py does
+# this) it is a WAL-mode SQLite file shared by all workers; otherwise a
+# per-process dict with the same interface. Values must be JSON-serializable.
+
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH')
+TRIM_EVERY = 64
+
+
+class MemoryStore:
+    """Single-process store; values round-trip through JSON like SQLiteStore's"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}       # namespace -> OrderedDict key -> (json value, expires_at), oldest write first
+        self.leases = {}
+
+    def get(self, namespace, key):
+        with self.lock:
+            entries = self.data.get(namespace)
+            item = entries.get(key) if entries else None
+            if item is None:
+                return None
+            if item[1] is not None and item[1] < time.time():
+                del entries[key]
+                return None
+            return json.loads(item[0])
+
+    def set(self, namespace, key, value, ttl=None, max_entries=None):
+        item = (json.dumps(value), time.time() + ttl if ttl else None)
+        with self.lock:
+            entries = self.data.setdefault(namespace, OrderedDict())
+            entries.pop(key, None)
+            entries[key] = item
+            if max_entries:
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            entries = self.data.get(namespace)
+            if entries:
+                entries.pop(key, None)
+
+    def try_lease(self, name, owner, ttl):
+        """Hold the named lease for ttl seconds unless another owner has it"""
+        now = time.time()
+        with self.lock:
+            holder = self.leases.get(name)
+            if holder is None or holder[0] == owner or holder[1] < now:
+                self.leases[name] = (owner, now + ttl)
+                return True
+            return False
+
+    def describe(self):
+        with self.lock:
+            return {"backend": "memory", "entries": sum(len(entries) for entries in self.data.values())}
+
+
+class SQLiteStore:
+    """Store shared between processes through one WAL-mode SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()   # guards writes
+        self.writes = Counter()        # per namespace, so every capped namespace gets trimmed
+        db = self._db()
+        db.execute("""CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+            expires_at REAL, updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)) WITHOUT ROWID""")
+        db.execute("CREATE INDEX IF NOT EXISTS kv_age ON kv (namespace, updated_at)")
+        db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+        db.commit()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def get(self, namespace, key):
+        row = self._db().execute(
+            "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None, max_entries=None):
+        now = time.time()
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now)
+        )
+        with self.lock:
+            self.writes[namespace] += 1
+            trim = self.writes[namespace] % TRIM_EVERY == 0
+        if trim:
+            db.execute("DELETE FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+                       (namespace, now))
+            if max_entries:
+                db.execute(
+                    "DELETE FROM kv WHERE namespace = ? AND key IN (SELECT key FROM kv WHERE namespace = ? "
+                    "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (namespace, namespace, max_entries)
+                )
+
+    def delete(self, namespace, key):
+        self._db().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def try_lease(self, name, owner, ttl):
+        """Hold the named lease for ttl seconds unless another owner has it"""
+        now = time.time()
+        db = self._db()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            acquired = row is None or row[0] == owner or row[1] < now
+            if acquired:
+                db.execute("INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                           (name, owner, now + ttl))
+            db.execute("COMMIT")
+            return acquired
+        except sqlite3.OperationalError as e:
+            logging.warning(f"[STORE] Lease {name} unavailable: {e}")
+            try:
+                db.execute("ROLLBACK")
+            except sqlite3.OperationalError:
+                pass
+            return False
+
+    def describe(self):
+        count = self._db().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "entries": count}
+
+
+def open_store(path=None):
+    if path:
+        logging.info(f"[STORE] Shared store at {path}")
+        return SQLiteStore(path)
+    return MemoryStore()
+
+
+STORE = open_store(SHARED_STORE_PATH)
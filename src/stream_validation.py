@@ -0,0 +1,147 @@
+import re
+import os
+
+from swift_array import tokenize, string_value, NUMBER_COMMENT_RE, parse_array_elements
+
+# Validators that watch a code-transform generation line by line while it
+# streams from Ollama. feed() returns None to keep going or a reason string
+# when the output can no longer turn into something we would accept; the
+# caller then cancels the generation. `done` is set once the code is
+# complete and anything after it can be dropped.
+
+RUNAWAY_PREAMBLE_CHARS = int(os.getenv('STREAM_RUNAWAY_PREAMBLE_CHARS', 600))
+RUNAWAY_TRAILER_CHARS = int(os.getenv('STREAM_RUNAWAY_TRAILER_CHARS', 200))
+
+# Outside a code fence, code starts at a declaration or a bare array opener;
+# brackets in a prose preamble ("Fix items [1] and [2]:") are not code
+CODE_START_RE = re.compile(
+    r'^\s*(?:\[|(?:(?:private|fileprivate|public|internal|open|static|final)\s+)*(?:let|var)\s+\w+)'
+)
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class CodeStreamValidator:
+    """Checks numbering and string literals of a streamed Swift array
+
+    expect_numbering - /* N */ comments must run 1, 2, 3, ... without skips
+    literals         - string contents allowed in the output (the input's),
+                       each at most as often as it appears in the input
+    """
+
+    def __init__(self, literals=None, expect_numbering=False):
+        self.expect_numbering = expect_numbering
+        self.allowed = None
+        if literals is not None:
+            self.allowed = {}
+            for literal in literals:
+                key = _normalize(literal)
+                self.allowed[key] = self.allowed.get(key, 0) + 1
+        self.expected_count = len(literals) if literals is not None else None
+
+        self.buffer = ""
+        self.next_number = 1
+        self.literal_count = 0
+        self.depth = 0
+        self.in_fence = False
+        self.code_started = False
+        self.code_finished = False
+        self.preamble_chars = 0
+        self.trailer_chars = 0
+        self.done = False
+
+    def feed(self, piece):
+        self.buffer += piece
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            reason = self._check_line(line)
+            if reason:
+                return reason
+            if self.done:
+                return None
+
+        # Prose without line breaks never completes a line; bound it too
+        if self.code_finished and self.trailer_chars + len(self.buffer) > RUNAWAY_TRAILER_CHARS:
+            self.done = True
+        elif not self.code_started and self.preamble_chars + len(self.buffer) > RUNAWAY_PREAMBLE_CHARS:
+            return f"runaway explanation: {self.preamble_chars + len(self.buffer)} chars before any code"
+        return None
+
+    def finish(self):
+        """Validate the last, unterminated line"""
+        if self.buffer:
+            line, self.buffer = self.buffer, ""
+            return self._check_line(line)
+        return None
+
+    def _check_line(self, line):
+        stripped = line.strip()
+
+        if stripped.startswith('```'):
+            if self.in_fence:
+                self.in_fence = False
+                if self.code_started:
+                    self.code_finished = True
+            else:
+                self.in_fence = True
+            return None
+
+        if self.code_finished:
+            self.trailer_chars += len(stripped)
+            if self.trailer_chars > RUNAWAY_TRAILER_CHARS:
+                # Explanation after complete code: keep the code, stop paying for prose
+                self.done = True
+            return None
+
+        tokens = tokenize(line)
+        starts_code = self.in_fence or CODE_START_RE.match(line)
+        if not self.code_started and not (starts_code and any(t.kind == 'lbracket' for t in tokens)):
+            self.preamble_chars += len(stripped)
+            if self.preamble_chars > RUNAWAY_PREAMBLE_CHARS:
+                return f"runaway explanation: {self.preamble_chars} chars before any code"
+            return None
+
+        for token in tokens:
+            if token.kind == 'lbracket':
+                self.depth += 1
+                self.code_started = True
+            elif token.kind == 'rbracket':
+                self.depth = max(self.depth - 1, 0)
+            elif token.kind == 'block_comment' and self.expect_numbering and self.depth > 0:
+                match = NUMBER_COMMENT_RE.fullmatch(token.text)
+                if match:
+                    number = int(match.group(1))
+                    if number != self.next_number:
+                        return f"numbering skipped: expected /* {self.next_number} */, got /* {number} */"
+                    self.next_number += 1
+            elif token.kind == 'string' and self.depth > 0 and self.allowed is not None:
+                if not token.text.endswith('"') or len(token.text) < 2:
+                    continue  # literal continues past the line, judged by the final check
+                key = _normalize(string_value(token.text))
+                if self.allowed.get(key, 0) <= 0:
+                    return f"unknown string content: {key[:60]!r}"
+                self.allowed[key] -= 1
+                self.literal_count += 1
+
+        # Judged at the end of the line: `let a: [String] = [` closes a bracket but
+        # leaves the array open
+        if self.depth == 0 and self.code_started and not self.in_fence:
+            self.code_finished = True
+
+        if self.expected_count is not None and self.literal_count > self.expected_count:
+            return f"more elements than the input ({self.literal_count} > {self.expected_count})"
+        return None
+
+
+def numbering_validator(code):
+    """Stream validator for fix-array-comments and renumber-verses"""
+    literals = [e.text for e in parse_array_elements(code)]
+    return CodeStreamValidator(literals or None, expect_numbering=True)
+
+
+def literal_validator(code):
+    """Stream validator for remove-all-comments"""
+    literals = [e.text for e in parse_array_elements(code)]
+    return CodeStreamValidator(literals or None, expect_numbering=False)
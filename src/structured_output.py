@@ -0,0 +1,175 @@
+import os
+import json
+import logging
+
+from metrics import increment
+from token_budget import estimate_tokens
+
+# JSON answers from the model. The schema is passed to Ollama as "format",
+# so decoding is constrained to it; the reply is parsed with raw_decode
+# (first complete value, no greedy regex) and checked against the same
+# schema. When only some top-level fields are invalid, the model is asked
+# for just those fields instead of the whole answer again.
+#
+# STRUCTURED_OUTPUT: "schema" (default, Ollama >= 0.5), "json" (format:
+# json for older servers) or "off" (free text, parsed the same way).
+
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', 'schema').lower()
+STRUCTURED_RETRIES = int(os.getenv('STRUCTURED_RETRIES', 1))
+MAX_DECODE_STARTS = 8
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def output_format(schema):
+    """Ollama "format" value for schema under the STRUCTURED_OUTPUT setting"""
+    if STRUCTURED_OUTPUT == 'off':
+        return None
+    if STRUCTURED_OUTPUT == 'json':
+        return 'json'
+    return schema
+
+
+def parse_json(text):
+    """(value, None) for the first JSON object or array in text, else (None, reason)"""
+    decoder = json.JSONDecoder()
+    error = "no JSON object in response"
+    position = 0
+    for _ in range(MAX_DECODE_STARTS):
+        starts = [i for i in (text.find('{', position), text.find('[', position)) if i >= 0]
+        if not starts:
+            break
+        start = min(starts)
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            return value, None
+        except json.JSONDecodeError as e:
+            error = f"invalid JSON at char {e.pos}: {e.msg}"
+            position = start + 1
+    return None, error
+
+
+def _type_matches(value, expected):
+    names = expected if isinstance(expected, list) else [expected]
+    for name in names:
+        if isinstance(value, bool) and name in ("integer", "number"):
+            continue
+        if isinstance(value, _TYPES[name]):
+            return True
+    return False
+
+
+def validate(value, schema, path=""):
+    """(path, message) pairs where value breaks schema; [] when it conforms
+
+    Covers the subset the schemas here use: type, properties, required,
+    items, enum, minItems, maxItems and minLength.
+    """
+    if "type" in schema and not _type_matches(value, schema["type"]):
+        return [(path, f"expected {schema['type']}, got {type(value).__name__}")]
+    if "enum" in schema and value not in schema["enum"]:
+        return [(path, f"expected one of {schema['enum']}")]
+
+    errors = []
+    if isinstance(value, dict):
+        for name in schema.get("required", ()):
+            if name not in value or value[name] is None:
+                errors.append((f"{path}.{name}" if path else name, "missing"))
+        for name, subschema in schema.get("properties", {}).items():
+            if value.get(name) is not None:
+                errors += validate(value[name], subschema, f"{path}.{name}" if path else name)
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append((path, f"expected at least {schema['minItems']} items"))
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append((path, f"expected at most {schema['maxItems']} items"))
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors += validate(item, schema["items"], f"{path}[{i}]")
+    elif isinstance(value, str) and len(value) < schema.get("minLength", 0):
+        errors.append((path, "too short"))
+    return errors
+
+
+def _top_level(path):
+    return path.split('.')[0].split('[')[0]
+
+
+def _describe(errors):
+    return '; '.join(f"{path or 'answer'}: {message}" for path, message in errors[:10])
+
+
+def _generate(model, prompt, schema, operation, timeout):
+    from ollama_client import call_ollama_smart
+
+    raw = call_ollama_smart(model, prompt, timeout, operation=operation,
+                            output_format=output_format(schema))
+    if raw.startswith("Error:"):
+        return None, raw
+    value, error = parse_json(raw)
+    if value is None:
+        increment('structured_parse_failures', operation=operation)
+    return value, error
+
+
+def generate_json(model, prompt, schema, operation, check=None, timeout=None):
+    """Generate a value conforming to schema; returns (value, None) or (value or None, error)
+
+    check(value), when given, adds semantic (path, message) errors such as a
+    wrong verse count. Invalid top-level fields are regenerated on their own.
+    """
+    def problems(value):
+        errors = validate(value, schema)
+        if not errors and check is not None:
+            errors = check(value)
+        return errors
+
+    increment('structured_calls', operation=operation)
+    value, error = _generate(model, prompt, schema, operation, timeout)
+    if value is None and not error.startswith("Error:") and STRUCTURED_RETRIES > 0:
+        logging.info(f"[STRUCTURED] {operation}: {error}, regenerating")
+        value, error = _generate(model, prompt, schema, operation, timeout)
+    if value is None:
+        return None, error
+
+    errors = problems(value)
+    if errors:
+        increment('structured_schema_failures', operation=operation)
+    repairs = 0
+    while errors and repairs < STRUCTURED_RETRIES and isinstance(value, dict):
+        fields = sorted({_top_level(path) for path, _ in errors} & set(schema.get("properties", {})))
+        if not fields:
+            break
+        logging.info(f"[STRUCTURED] {operation}: repairing {', '.join(fields)} ({_describe(errors)})")
+        increment('structured_repairs', operation=operation)
+        repairs += 1
+        part_schema = {
+            "type": "object",
+            "properties": {name: schema["properties"][name] for name in fields},
+            "required": fields
+        }
+        repair_prompt = (f"{prompt}\n\nYour previous answer was:\n{json.dumps(value, ensure_ascii=False)}\n\n"
+                         f"These parts are invalid: {_describe(errors)}.\n"
+                         f"Return ONLY a JSON object with corrected values for: {', '.join(fields)}.")
+        patch, _ = _generate(model, repair_prompt, part_schema, operation, timeout)
+        if not isinstance(patch, dict):
+            break
+        value = dict(value, **{name: patch[name] for name in fields if name in patch})
+        # Output tokens a full regeneration would have cost beyond the repair
+        saved = estimate_tokens(json.dumps(value), model) - estimate_tokens(json.dumps(patch), model)
+        increment('structured_tokens_saved', max(0, saved), operation=operation)
+        errors = problems(value)
+        if not errors:
+            increment('structured_repaired', operation=operation)
+
+    if errors:
+        return value, _describe(errors)
+    return value, None
@@ -0,0 +1,230 @@
+import re
+from collections import namedtuple
+
+# Lexical pieces of Swift source that matter for array processing.
+# Everything that is not a string, comment, bracket or comma is skipped.
+Token = namedtuple('Token', ['kind', 'text', 'start', 'end'])
+
+# One string literal element of an array literal.
+#   text         - literal contents without the quotes
+#   start, end   - span of the literal including quotes
+#   number       - value of a directly preceding /* N */ comment, or None
+#   number_span  - (start, end) of that comment, or None
+ArrayElement = namedtuple('ArrayElement', ['index', 'text', 'start', 'end', 'number', 'number_span'])
+
+NUMBER_COMMENT_RE = re.compile(r'/\*\s*(\d+)\s*\*/')
+
+# One top-level array literal and its declaration, e.g. `private let text = [...]`.
+#   name         - declared name, or None for a bare literal
+#   start, end   - span from the declaration (or the '[') to just past the ']'
+#   open         - offset of the '['
+ArrayLiteral = namedtuple('ArrayLiteral', ['name', 'start', 'end', 'open'])
+
+# Declaration text that must end right before the '[' of a declared array
+DECLARATION_LOOKBACK = 512
+DECLARATION_RE = re.compile(
+    r'\b(?:(?:private|fileprivate|public|internal|open|static|final)\s+)*'
+    r'(?:let|var)\s+(\w+)\s*(?::\s*\[[^\[\]=]*\]\s*)?=\s*$'
+)
+
+
+def tokenize(code):
+    """Split Swift code into string, comment, bracket and comma tokens"""
+    tokens = []
+    i = 0
+    n = len(code)
+
+    while i < n:
+        ch = code[i]
+
+        if code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            end = n if end == -1 else end + 3
+            tokens.append(Token('string', code[i:end], i, end))
+            i = end
+        elif ch == '"':
+            j = i + 1
+            while j < n and code[j] != '"' and code[j] != '\n':
+                j += 2 if code[j] == '\\' else 1
+            end = min(j + 1, n)
+            tokens.append(Token('string', code[i:end], i, end))
+            i = end
+        elif code.startswith('/*', i):
+            # Swift block comments nest
+            depth = 0
+            j = i
+            while j < n:
+                if code.startswith('/*', j):
+                    depth += 1
+                    j += 2
+                elif code.startswith('*/', j):
+                    depth -= 1
+                    j += 2
+                    if depth == 0:
+                        break
+                else:
+                    j += 1
+            tokens.append(Token('block_comment', code[i:j], i, j))
+            i = j
+        elif code.startswith('//', i):
+            end = code.find('\n', i)
+            end = n if end == -1 else end
+            tokens.append(Token('line_comment', code[i:end], i, end))
+            i = end
+        elif ch == '[':
+            tokens.append(Token('lbracket', ch, i, i + 1))
+            i += 1
+        elif ch == ']':
+            tokens.append(Token('rbracket', ch, i, i + 1))
+            i += 1
+        elif ch == ',':
+            tokens.append(Token('comma', ch, i, i + 1))
+            i += 1
+        else:
+            i += 1
+
+    return tokens
+
+
+def string_value(literal):
+    """Strip the quotes from a string literal token"""
+    if literal.startswith('"""'):
+        return literal[3:-3] if literal.endswith('"""') and len(literal) >= 6 else literal[3:]
+    if literal.endswith('"') and len(literal) >= 2:
+        return literal[1:-1]
+    return literal[1:]
+
+
+def parse_array_elements(code, tokens=None):
+    """Return the string literal elements found inside array brackets"""
+    if tokens is None:
+        tokens = tokenize(code)
+
+    elements = []
+    depth = 0
+    pending_number = None
+
+    for token in tokens:
+        if token.kind == 'lbracket':
+            depth += 1
+            pending_number = None
+        elif token.kind == 'rbracket':
+            depth = max(depth - 1, 0)
+            pending_number = None
+        elif token.kind == 'block_comment':
+            match = NUMBER_COMMENT_RE.fullmatch(token.text)
+            # Only a number comment directly in front of a literal counts
+            pending_number = token if match else None
+        elif token.kind == 'string' and depth > 0:
+            number = None
+            number_span = None
+            if pending_number is not None and not code[pending_number.end:token.start].strip():
+                number = int(NUMBER_COMMENT_RE.fullmatch(pending_number.text).group(1))
+                number_span = (pending_number.start, pending_number.end)
+            elements.append(ArrayElement(
+                len(elements), string_value(token.text), token.start, token.end, number, number_span
+            ))
+            pending_number = None
+        else:
+            pending_number = None
+
+    return elements
+
+
+def number_elements(code, start=1):
+    """Put a sequential /* N */ comment before every array element"""
+    elements = parse_array_elements(code)
+    pieces = []
+    cursor = len(code)
+
+    for offset, element in reversed(list(enumerate(elements))):
+        label = f"/* {start + offset} */"
+        if element.number_span:
+            comment_start, comment_end = element.number_span
+            pieces.append(code[comment_end:cursor])
+            pieces.append(label)
+            cursor = comment_start
+        else:
+            pieces.append(code[element.start:cursor])
+            pieces.append(label + " ")
+            cursor = element.start
+
+    pieces.append(code[:cursor])
+    return ''.join(reversed(pieces))
+
+
+def strip_comments(code):
+    """Remove every comment outside string literals"""
+    comments = [t for t in tokenize(code) if t.kind in ('block_comment', 'line_comment')]
+    if not comments:
+        return code
+
+    pieces = []
+    cursor = 0
+    for comment in comments:
+        start, end = comment.start, comment.end
+        line_start = code.rfind('\n', 0, start) + 1
+        if start >= cursor and not code[line_start:start].strip():
+            # Leading comment: swallow the gap to the following code
+            while end < len(code) and code[end] in ' \t':
+                end += 1
+            if end == len(code) or code[end] == '\n':
+                # Comment-only line: drop the whole line
+                start = max(line_start, cursor)
+                end = min(end + 1, len(code))
+        else:
+            # Trailing comment: swallow the gap from the preceding code,
+            # or the gap after it when it sits flush against the code
+            while start > cursor and code[start - 1] in ' \t':
+                start -= 1
+            if start == comment.start:
+                while end < len(code) and code[end] in ' \t':
+                    end += 1
+        start = max(start, cursor)
+        pieces.append(code[cursor:start])
+        cursor = max(end, cursor)
+    pieces.append(code[cursor:])
+
+    stripped = ''.join(pieces)
+    return '\n'.join(line.rstrip() for line in stripped.split('\n'))
+
+
+def has_comments(code):
+    """True if any comment remains outside string literals"""
+    return any(t.kind in ('block_comment', 'line_comment') for t in tokenize(code))
+
+
+def find_array_literals(code, bare=False):
+    """Every top-level array literal declared with let/var, in source order
+
+    One pass over the tokens: brackets inside strings and comments are
+    ignored and each literal ends at its own matching ']'. With bare=True,
+    undeclared top-level literals are returned too (name None).
+    """
+    literals = []
+    depth = 0
+    open_token = None
+    previous_end = 0   # end of the last token outside any literal
+
+    for token in tokenize(code):
+        if token.kind == 'lbracket':
+            if depth == 0:
+                open_token = token
+            depth += 1
+        elif token.kind == 'rbracket' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                # A type annotation's brackets ([String]) are not a literal and
+                # stay part of the text the next declaration is matched in
+                window = max(previous_end, open_token.start - DECLARATION_LOOKBACK)
+                match = DECLARATION_RE.search(code, window, open_token.start)
+                if match:
+                    literals.append(ArrayLiteral(match.group(1), match.start(), token.end, open_token.start))
+                    previous_end = token.end
+                elif bare:
+                    literals.append(ArrayLiteral(None, open_token.start, token.end, open_token.start))
+                    previous_end = token.end
+        elif depth == 0:
+            previous_end = token.end
+
+    return literals
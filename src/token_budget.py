@@ -0,0 +1,137 @@
+import os
+import threading
+from collections import namedtuple
+
+# Per-request sizing of num_ctx / num_predict. Prompt size comes from a
+# chars-per-token estimate that is recalibrated per model from the
+# prompt_eval_count Ollama reports; the output allowance comes from the
+# operation's profile.
+
+MAX_CONTEXT = int(os.getenv('MAX_CONTEXT_TOKENS', 32768))
+MIN_CONTEXT = int(os.getenv('MIN_CONTEXT_TOKENS', 2048))
+DEFAULT_NUM_PREDICT = int(os.getenv('DEFAULT_NUM_PREDICT', 4096))
+DEFAULT_CHARS_PER_TOKEN = float(os.getenv('CHARS_PER_TOKEN', 3.5))
+
+# Output allowance: ratio * prompt tokens + extra, at least minimum.
+# stop ends the generation at the closing JSON brace; restore is appended
+# back when the stop cut off a still-open object. Code has no stop: a bare
+# fence matches the opening fence as well as the closing one, so a reply
+# with a preamble would stop before any code. The stream validators cut
+# off runaway prose after the code instead, and num_predict bounds the rest.
+OutputProfile = namedtuple('OutputProfile', ['ratio', 'extra', 'minimum', 'stop', 'restore'])
+
+CODE_PROFILE = OutputProfile(1.3, 128, 256, (), "")
+JSON_PROFILE = OutputProfile(0, 400, 400, ("\n}",), "\n}")
+DEFAULT_PROFILE = OutputProfile(0, DEFAULT_NUM_PREDICT, DEFAULT_NUM_PREDICT, (), "")
+
+PROFILES = {
+    'fix-array-comments': CODE_PROFILE,
+    'remove-all-comments': CODE_PROFILE,
+    'renumber-verses': CODE_PROFILE,
+    'chat-fix-array-comments': CODE_PROFILE,
+    'chat-remove-all-comments': CODE_PROFILE,
+    'analyze-latin-word': JSON_PROFILE,
+}
+
+# Prompt text wrapped around the user's code by the operation templates
+TEMPLATE_OVERHEAD_TOKENS = 400
+
+INPUT_TOO_LARGE_PREFIX = "Error: Input too large:"
+
+# output_format is Ollama's "format": "json" or a JSON schema, None for free text
+Budget = namedtuple('Budget', ['prompt_tokens', 'num_ctx', 'num_predict', 'stop', 'restore', 'error', 'output_format'])
+
+_calibration_lock = threading.Lock()
+_chars_per_token = {}
+
+
+def estimate_tokens(text, model=None):
+    """Approximate token count of text for model"""
+    with _calibration_lock:
+        ratio = _chars_per_token.get(model, DEFAULT_CHARS_PER_TOKEN)
+    return int(len(text) / ratio) + 1
+
+
+def calibrate(model, prompt, prompt_eval_count):
+    """Fold an observed prompt_eval_count into the model's chars-per-token ratio"""
+    if not prompt_eval_count or not prompt:
+        return
+    observed = len(prompt) / prompt_eval_count
+    # A cached prefix makes Ollama report fewer evaluated tokens; skip those
+    if not 1.0 <= observed <= 8.0:
+        return
+    with _calibration_lock:
+        current = _chars_per_token.get(model, DEFAULT_CHARS_PER_TOKEN)
+        _chars_per_token[model] = 0.8 * current + 0.2 * observed
+
+
+def _context_size(tokens):
+    """Round up to a power of two so changing inputs don't each reload the model"""
+    size = MIN_CONTEXT
+    while size < tokens and size < MAX_CONTEXT:
+        size *= 2
+    return min(size, MAX_CONTEXT)
+
+
+def plan_budget(operation, prompt, model=None, output_format=None):
+    """Size num_ctx and num_predict for one generation"""
+    profile = PROFILES.get(operation, DEFAULT_PROFILE)
+    if output_format is not None:
+        # Constrained decoding ends at the closing brace; a stop sequence could cut it short
+        profile = profile._replace(stop=(), restore="")
+    prompt_tokens = estimate_tokens(prompt, model)
+    wanted = max(profile.minimum, int(profile.ratio * prompt_tokens) + profile.extra)
+
+    if prompt_tokens + profile.minimum > MAX_CONTEXT:
+        return Budget(prompt_tokens, MAX_CONTEXT, 0, profile.stop, profile.restore,
+                      f"{INPUT_TOO_LARGE_PREFIX} about {prompt_tokens} tokens "
+                      f"(limit {MAX_CONTEXT - profile.minimum} for {operation or 'this request'})",
+                      output_format)
+
+    num_predict = min(wanted, MAX_CONTEXT - prompt_tokens)
+    num_ctx = _context_size(prompt_tokens + num_predict)
+    return Budget(prompt_tokens, num_ctx, num_predict, profile.stop, profile.restore, None, output_format)
+
+
+def check_input(operation, text, model=None):
+    """Error message when text can't fit the context for operation, else None
+
+    Called by endpoints before queueing, on the raw input; the template
+    around it is accounted for with TEMPLATE_OVERHEAD_TOKENS.
+    """
+    profile = PROFILES.get(operation, DEFAULT_PROFILE)
+    tokens = estimate_tokens(text, model) + TEMPLATE_OVERHEAD_TOKENS
+    if tokens + profile.minimum > MAX_CONTEXT:
+        return f"Input too large: about {tokens} tokens (limit {MAX_CONTEXT - profile.minimum})"
+    return None
+
+
+def request_body(model, prompt, stream, base_options, budget):
+    """JSON body of an /api/generate request"""
+    body = {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "options": generation_options(base_options, budget)
+    }
+    if budget.output_format is not None:
+        body["format"] = budget.output_format
+    return body
+
+
+def generation_options(base, budget):
+    """Ollama options for a request: base sampling options plus the budget"""
+    options = dict(base)
+    options["num_ctx"] = budget.num_ctx
+    options["num_predict"] = budget.num_predict
+    if budget.stop:
+        options["stop"] = list(budget.stop)
+    return options
+
+
+def restore_stop(text, budget):
+    """Close a JSON object that a stop sequence cut off"""
+    if not budget.restore:
+        return text
+    unclosed = text.count('{') > text.count('}')
+    return text + budget.restore if unclosed else text
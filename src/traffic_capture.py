@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from flask import request, g
+
+# Opt-in capture of API traffic for load testing with traffic_replay.py.
+# With TRAFFIC_CAPTURE_PATH set, every /api/* and /v1/chat/completions
+# request is appended to that JSONL file: arrival time, route, the headers
+# that change how a request is served, sanitized body, model, status, bytes
+# and duration (to the end of a streamed body).
+# Secrets are always masked; TRAFFIC_CAPTURE_REDACT_TEXT=1 also replaces
+# long strings with filler of the same length, keeping the token load.
+
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')
+TRAFFIC_CAPTURE_REDACT_TEXT = os.getenv('TRAFFIC_CAPTURE_REDACT_TEXT', '').lower() in ('1', 'true', 'yes')
+CAPTURED_PREFIXES = ('/api/', '/v1/chat/completions')
+# Reads of server state would only add noise to a replay
+SKIPPED_PATHS = ('/api/metrics', '/api/models')
+# Headers that change how a request is served; nothing that can carry credentials
+CAPTURED_HEADERS = ('X-Conversation-Id', 'X-Request-Timeout', 'Accept')
+SECRET_KEYS = ('password', 'token', 'secret', 'api_key', 'apikey', 'authorization')
+REDACT_MIN_LENGTH = 32
+
+_write_lock = threading.Lock()
+
+
+def sanitize(value, redact_text=False):
+    """Copy of a request body with secrets masked and, optionally, text replaced"""
+    if isinstance(value, dict):
+        return {k: '***' if any(s in k.lower() for s in SECRET_KEYS) else sanitize(v, redact_text)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v, redact_text) for v in value]
+    if redact_text and isinstance(value, str) and len(value) >= REDACT_MIN_LENGTH:
+        # Same length and line structure, so token budgets replay unchanged
+        return '\n'.join('x' * len(line) for line in value.split('\n'))
+    return value
+
+
+def _captured(path):
+    return path.startswith(CAPTURED_PREFIXES) and path not in SKIPPED_PATHS
+
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+    with _write_lock:
+        with open(TRAFFIC_CAPTURE_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def start_capture():
+    """before_request hook"""
+    if _captured(request.path):
+        g.capture_started = time.time()
+
+
+def finish_capture(response):
+    """after_request hook; the record is written when the body has been sent"""
+    started = g.get('capture_started')
+    if started is None:
+        return response
+
+    body = request.get_json(silent=True)
+    record = {
+        "t": round(started, 3),
+        "method": request.method,
+        "path": request.path,
+        "query": request.query_string.decode('utf-8', 'replace') or None,
+        "headers": {h: request.headers[h] for h in CAPTURED_HEADERS if h in request.headers},
+        "model": body.get('model') if isinstance(body, dict) else None,
+        "stream": bool(body.get('stream')) if isinstance(body, dict) else False,
+        "body": sanitize(body, TRAFFIC_CAPTURE_REDACT_TEXT),
+        "status": response.status_code,
+    }
+    if not response.is_streamed:
+        record["response_bytes"] = response.calculate_content_length()
+
+    def on_close():
+        record["duration_s"] = round(time.time() - started, 4)
+        try:
+            _write(record)
+        except OSError as e:
+            logging.warning(f"[CAPTURE] Cannot write {TRAFFIC_CAPTURE_PATH}: {e}")
+
+    response.call_on_close(on_close)
+    return response
+
+
+def install(app):
+    """Register the capture hooks when TRAFFIC_CAPTURE_PATH is set"""
+    if not TRAFFIC_CAPTURE_PATH:
+        return
+    app.before_request(start_capture)
+    app.after_request(finish_capture)
+    logging.info(f"[CAPTURE] Recording API traffic to {TRAFFIC_CAPTURE_PATH}")
@@ -0,0 +1,193 @@
+"""Replay traffic recorded with TRAFFIC_CAPTURE_PATH against a server.
+
+Usage:
+    python src/traffic_replay.py capture.jsonl --target http://localhost:5000
+    python src/traffic_replay.py capture.jsonl --speed 4
+    python src/traffic_replay.py capture.jsonl --speed 0 --concurrency 16 --json
+
+--speed 1 keeps the original inter-arrival times, N compresses them N
+times, 0 sends as fast as --concurrency allows. The report gives latency
+percentiles per route, status counts, how late requests were sent (client
+side lag) and the server's model queue depth sampled from /api/metrics.
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_capture(path):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None
+    }
+
+
+def send(session, target, record, timeout):
+    """Issue one recorded request; returns (status, seconds), status 0 on failure"""
+    url = target + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    started = time.time()
+    try:
+        response = session.request(record["method"], url, json=record.get("body"),
+                                   headers=record.get("headers"),
+                                   timeout=timeout, stream=record.get("stream", False))
+        for _ in response.iter_content(chunk_size=8192):
+            pass   # a streamed answer is only done when its body is
+        status = response.status_code
+    except requests.exceptions.RequestException:
+        status = 0
+    return status, time.time() - started
+
+
+class QueueSampler(threading.Thread):
+    """Polls the server's /api/metrics for model queue depth while the replay runs"""
+
+    def __init__(self, target, interval):
+        super().__init__(daemon=True)
+        self.url = target + '/api/metrics'
+        self.interval = interval
+        self.samples = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                queue = requests.get(self.url, timeout=2).json()["queue"]
+                self.samples.append((queue["queued"], queue["running"]))
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                continue
+
+
+def replay(records, target, speed=1.0, concurrency=64, timeout=600, sample_interval=0.5):
+    target = target.rstrip('/')
+    results = []
+    results_lock = threading.Lock()
+    local = threading.local()
+
+    def run(record, due):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        lag = max(0.0, time.time() - due) if due else 0.0
+        status, seconds = send(local.session, target, record, timeout)
+        with results_lock:
+            results.append({"path": record["path"], "status": status, "seconds": seconds,
+                            "lag": lag, "recorded_seconds": record.get("duration_s")})
+
+    sampler = QueueSampler(target, sample_interval)
+    sampler.start()
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        origin = records[0]["t"] if records else 0
+        for record in records:
+            due = None
+            if speed > 0:
+                due = started + (record["t"] - origin) / speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, record, due)
+    wall = time.time() - started
+    sampler.stop.set()
+    return build_report(results, wall, sampler.samples)
+
+
+def build_report(results, wall, queue_samples):
+    by_path = defaultdict(list)
+    statuses = defaultdict(int)
+    for result in results:
+        by_path[result["path"]].append(result["seconds"])
+        statuses[str(result["status"])] += 1
+    recorded = [r["recorded_seconds"] for r in results if r["recorded_seconds"] is not None]
+    return {
+        "requests": len(results),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 3) if wall else None,
+        "statuses": dict(statuses),
+        "latency": summarize([r["seconds"] for r in results]),
+        "recorded_latency": summarize(recorded),
+        "by_path": {path: summarize(values) for path, values in sorted(by_path.items())},
+        "send_lag": summarize([r["lag"] for r in results]),
+        "queue": {
+            "samples": len(queue_samples),
+            "max_queued": max((q for q, _ in queue_samples), default=None),
+            "mean_queued": round(sum(q for q, _ in queue_samples) / len(queue_samples), 2) if queue_samples else None,
+            "max_running": max((r for _, r in queue_samples), default=None)
+        }
+    }
+
+
+def print_report(report):
+    def row(name, stats):
+        if not stats["count"]:
+            return f"  {name:<34} {0:>6}"
+        return (f"  {name:<34} {stats['count']:>6}  p50 {stats['p50']:7.3f}s  p95 {stats['p95']:7.3f}s"
+                f"  p99 {stats['p99']:7.3f}s  max {stats['max']:7.3f}s")
+
+    print(f"{report['requests']} requests in {report['wall_seconds']}s ({report['throughput_rps']} req/s)")
+    print("Statuses: " + ", ".join(f"{k}: {v}" for k, v in sorted(report["statuses"].items())))
+    print(row("all (replay)", report["latency"]))
+    print(row("all (as recorded)", report["recorded_latency"]))
+    for path, stats in report["by_path"].items():
+        print(row(path, stats))
+    print(row("send lag", report["send_lag"]))
+    queue = report["queue"]
+    print(f"Model queue: max queued {queue['max_queued']}, mean queued {queue['mean_queued']}, "
+          f"max running {queue['max_running']} ({queue['samples']} samples)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured API traffic")
+    parser.add_argument('capture', help="JSONL file written with TRAFFIC_CAPTURE_PATH")
+    parser.add_argument('--target', default='http://localhost:5000')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Time compression factor; 0 sends as fast as possible")
+    parser.add_argument('--concurrency', type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--path', action='append', help="Only replay these routes (repeatable)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    records = load_capture(args.capture)
+    if args.path:
+        records = [r for r in records if r["path"] in args.path]
+    if not records:
+        print("No requests to replay", file=sys.stderr)
+        return 1
+
+    report = replay(records, args.target, args.speed, args.concurrency, args.timeout)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
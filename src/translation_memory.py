@@ -0,0 +1,224 @@
+# src/translation_memory.py
+import os
+import re
+import time
+import zlib
+import random
+import hashlib
+import threading
+
+from metrics import increment, counter
+from latin_normalize import fold_spelling
+from shared_store import STORE
+
+# Verse-level translation memory for /api/translate-classical. Verses are
+# normalized (case, diacritics, punctuation, i/j and u/v spelling) for an
+# exact index; only exact matches are answered from memory. A MinHash index
+# over character trigrams finds near-identical verses (doublets, Gallican
+# vs. Hebrew psalter), which are given to the model as a worked example:
+# a verse that differs in person, number or a negation needs its own
+# translation. Entries and MinHash bands live in the shared store, so every
+# server process uses the same memory, bounded by TM_MAX_ENTRIES.
+
+TM_MAX_ENTRIES = int(os.getenv('TM_MAX_ENTRIES', 20000))
+TM_HINT_SIMILARITY = float(os.getenv('TM_HINT_SIMILARITY', 0.6))
+TM_BUCKET_SIZE = 8      # entries remembered per MinHash band value
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_verse(text):
+    """Spelling-insensitive form of a verse used as the exact-match key"""
+    text = fold_spelling(text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def shingles(normalized):
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TranslationMemory:
+    """Exact and fuzzy lookup of previously translated verses"""
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()   # band updates are read-modify-write
+
+    @staticmethod
+    def _entry_key(normalized, source_language, target_language, model):
+        key = '\0'.join((source_language, target_language, model or '', normalized))
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _band_keys(normalized, source_language, target_language):
+        shingle_set = shingles(normalized) if normalized else set()
+        if not shingle_set:
+            return []
+        signature = minhash(shingle_set)
+        return [f"{source_language}:{target_language}:{band}:"
+                + ','.join(map(str, signature[band * ROWS:(band + 1) * ROWS]))
+                for band in range(BANDS)]
+
+    def add(self, source, translation, source_language, target_language, model):
+        normalized = normalize_verse(source)
+        entry_key = self._entry_key(normalized, source_language, target_language, model)
+        self.store.set('translations', entry_key, {
+            "source": source,
+            "translation": translation,
+            "model": model,
+            "created": time.time()
+        }, max_entries=TM_MAX_ENTRIES)
+        # Another process may update the same band at once; losing an entry
+        # there only costs a hint
+        with self.lock:
+            for band_key in self._band_keys(normalized, source_language, target_language):
+                members = self.store.get('translation_bands', band_key) or []
+                if entry_key not in members:
+                    members = (members + [entry_key])[-TM_BUCKET_SIZE:]
+                    self.store.set('translation_bands', band_key, members,
+                                   max_entries=TM_MAX_ENTRIES * BANDS)
+
+    def lookup(self, source, source_language, target_language, model):
+        """Best match as (entry, similarity, kind) with kind 'exact' or 'fuzzy', or None
+
+        Exact matches are model's own translations; a fuzzy match may come
+        from any model, since it is only shown to the model as an example.
+        """
+        normalized = normalize_verse(source)
+        entry = self.store.get('translations', self._entry_key(normalized, source_language, target_language, model))
+        if entry is not None:
+            return entry, 1.0, "exact"
+
+        candidates = set()
+        for band_key in self._band_keys(normalized, source_language, target_language):
+            candidates.update(self.store.get('translation_bands', band_key) or ())
+        query = shingles(normalized)
+        best, best_similarity = None, 0.0
+        for entry_key in candidates:
+            entry = self.store.get('translations', entry_key)
+            if entry is None:
+                continue   # evicted
+            similarity = jaccard(query, shingles(normalize_verse(entry["source"])))
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+        if best is None:
+            return None
+        return best, best_similarity, "fuzzy"
+
+    def stats(self):
+        lookups = counter('tm_lookups')
+        rates = {}
+        for kind in ('exact', 'hint', 'miss'):
+            count = counter(f'tm_{kind}')
+            rates[kind] = {"count": count, "rate": round(count / lookups, 3) if lookups else None}
+        return {"lookups": lookups, "results": rates}
+
+
+MEMORY = TranslationMemory(STORE)
+
+
+def split_verses(text):
+    """One verse per line with words; separator lines (†, *, —) are dropped"""
+    return [line.strip() for line in text.split('\n') if normalize_verse(line)]
+
+
+def format_translation_prompt(text, source_lang, target_lang, hint=None):
+    """Translation prompt, optionally with a similar verse as a worked example"""
+    example = ""
+    if hint:
+        example = f"""A very similar verse was translated before. Follow it where the texts agree:
+
+Text: "{hint['source']}"
+{hint['translation']}
+
+"""
+    return f"""{example}Translate this {source_lang} text to {target_lang} and provide grammatical analysis:
+
+Text: "{text}"
+
+Provide:
+1. Literal translation
+2. Fluent translation
+3. Word-by-word analysis (lemma, form, grammar)
+4. Overall grammatical structure
+
+Translation and Analysis:"""
+
+
+def translate_verse(verse, source_lang, target_lang, model, hint=None):
+    """Translate one verse with the model and remember it
+
+    hint is a (entry, similarity) pair for a similar verse, shown to the
+    model as an example. Returns a verse result dict.
+    """
+    from ollama_client import call_ollama_smart
+
+    prompt = format_translation_prompt(verse, source_lang, target_lang, hint[0] if hint else None)
+    result = call_ollama_smart(model, prompt)
+    if result.startswith("Error:"):
+        return {"text": verse, "error": result}
+
+    MEMORY.add(verse, result, source_lang, target_lang, model)
+    response = {"text": verse, "translation": result, "source": "model", "model_used": model}
+    if hint:
+        response["hint"] = {"matched_text": hint[0]["source"], "similarity": round(hint[1], 3)}
+    return response
+
+
+def translate_with_memory(text, source_lang, target_lang, model, run_all):
+    """Translate text verse by verse; only verses new to the memory reach the model
+
+    run_all(fn, arg_lists) runs the model calls for the new verses, possibly
+    concurrently, and returns their results in order. A verse repeated in
+    the text is translated once.
+    """
+    verses = split_verses(text)
+    results = [None] * len(verses)
+    pending = {}   # normalized verse -> (indexes, hint)
+    for i, verse in enumerate(verses):
+        normalized = normalize_verse(verse)
+        if normalized in pending:
+            pending[normalized][0].append(i)
+            continue
+
+        increment('tm_lookups')
+        match = MEMORY.lookup(verse, source_lang, target_lang, model)
+        if match and match[2] == "exact":
+            increment('tm_exact')
+            entry = match[0]
+            results[i] = {
+                "text": verse,
+                "translation": entry["translation"],
+                "source": "exact",
+                "matched_text": entry["source"],
+                "model_used": entry.get("model")
+            }
+            continue
+        hint = match[:2] if match and match[1] >= TM_HINT_SIMILARITY else None
+        increment('tm_hint' if hint else 'tm_miss')
+        pending[normalized] = ([i], hint)
+
+    translated = run_all(translate_verse, [(verses[indexes[0]], source_lang, target_lang, model, hint)
+                                           for indexes, hint in pending.values()])
+    for (indexes, _), result in zip(pending.values(), translated):
+        for i in indexes:
+            results[i] = dict(result, text=verses[i])
+    return results
@@ -0,0 +1,62 @@
+from operations import run_operation
+from code_processor import strip_code_fence
+from incremental import RESULT_FIELDS
+from swift_array import find_array_literals, parse_array_elements
+
+# Whole-file processing: every declared array literal in a file (verses,
+# antiphons, titles, ...) is transformed on its own and the results are
+# spliced back, so everything outside the arrays stays byte-for-byte the
+# same. The arrays are independent model calls and run concurrently.
+
+
+def has_several_arrays(code):
+    return len(find_array_literals(code)) > 1
+
+
+def process_whole_file(operation, code, model, language, run_all):
+    """Run operation on each array literal of code and splice the outputs back
+
+    run_all(fn, arg_lists) calls fn once per argument tuple, possibly
+    concurrently, and returns the results in order. Returns a dict with the
+    spliced code under the operation's result field plus a per-array
+    report, or {"error": ..., "arrays": [...]} if any array failed.
+    """
+    arrays = find_array_literals(code)
+    results = run_all(run_operation, [(operation, code[a.start:a.end], model, language) for a in arrays])
+
+    field = RESULT_FIELDS[operation]
+    pieces = []
+    report = []
+    failed = 0
+    cursor = 0
+    for array, result in zip(arrays, results):
+        entry = {
+            "name": array.name,
+            "line": code.count('\n', 0, array.start) + 1,
+            "input_elements": len(parse_array_elements(code[array.start:array.end]))
+        }
+        pieces.append(code[cursor:array.start])
+        if "error" in result:
+            failed += 1
+            entry["error"] = result["error"]
+            pieces.append(code[array.start:array.end])
+        else:
+            output = strip_code_fence(result[field]).strip()
+            entry["elements_count"] = len(parse_array_elements(output))
+            if result.get("model_used"):
+                entry["model_used"] = result["model_used"]
+            if result.get("repaired"):
+                entry["repaired"] = result["repaired"]
+            pieces.append(output)
+        cursor = array.end
+        report.append(entry)
+    pieces.append(code[cursor:])
+
+    if failed:
+        return {"error": f"{failed} of {len(arrays)} arrays failed", "arrays": report}
+    return {
+        field: ''.join(pieces),
+        "arrays": report,
+        "arrays_count": len(arrays),
+        "elements_count": sum(entry["elements_count"] for entry in report)
+    }
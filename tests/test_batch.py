@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+def test_batch_code_file_stays_under_root(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)   # the server logs to server_debug.log in the working directory
+    import coding_server
+
+    root = tmp_path / 'psalms'
+    root.mkdir()
+    (root / 'psalm22.swift').write_text('let text = [\n    "Dominus regit me"\n]\n')
+    (tmp_path / 'secret.txt').write_text('let text = [\n    "secret"\n]\n')
+    os.symlink(tmp_path / 'secret.txt', root / 'link.swift')
+    monkeypatch.setattr(coding_server, 'BATCH_CODE_ROOT', str(root))
+
+    run = coding_server.run_batch_item
+    assert '/* 1 */' in run(0, {"operation": "number-elements", "code_file": "psalm22.swift"}, 'm')["corrected_code"]
+    for path in ('../secret.txt', str(tmp_path / 'secret.txt'), 'link.swift'):
+        result = run(0, {"operation": "number-elements", "code_file": path}, 'm')
+        assert result == {"error": f"Code file not allowed: {path}"}, path
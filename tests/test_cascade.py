@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import ollama_client
+from metrics import counter
+from ollama_client import call_ollama_cascade, DEADLINE_PREFIX, STREAM_ABORT_PREFIX
+
+
+def _models(monkeypatch, answers):
+    """Fake call_ollama_smart answering from answers[model] in order; returns the calls"""
+    calls = []
+
+    def fake(model, prompt, timeout=None, stream_validator=None, operation=None, output_format=None):
+        calls.append(model)
+        return answers[model].pop(0)
+
+    monkeypatch.setattr(ollama_client, 'CASCADE_MODELS', ['small'])
+    monkeypatch.setattr(ollama_client, 'call_ollama_smart', fake)
+    return calls
+
+
+def valid(result):
+    return None if result.startswith("ok") else "not ok"
+
+
+def test_small_model_answer_is_accepted(monkeypatch):
+    calls = _models(monkeypatch, {'small': ["ok small"], 'big': ["ok big"]})
+    accepted = counter('cascade_accepted', endpoint='cascade-test', model='small')
+    assert call_ollama_cascade('big', 'prompt', valid, endpoint='cascade-test') == ("ok small", 'small')
+    assert calls == ['small']
+    assert counter('cascade_accepted', endpoint='cascade-test', model='small') == accepted + 1
+
+
+def test_rejected_answer_escalates(monkeypatch):
+    calls = _models(monkeypatch, {'small': ["bad", "Error: timed out"], 'big': ["ok big", "ok big"]})
+    escalations = counter('cascade_escalations', endpoint='cascade-test', model='small')
+    assert call_ollama_cascade('big', 'prompt', valid, endpoint='cascade-test') == ("ok big", 'big')
+    # A model error escalates like a rejected answer
+    assert call_ollama_cascade('big', 'prompt', valid, endpoint='cascade-test') == ("ok big", 'big')
+    assert calls == ['small', 'big', 'small', 'big']
+    assert counter('cascade_escalations', endpoint='cascade-test', model='small') == escalations + 2
+
+
+def test_final_model_is_retried_only_after_a_stream_abort(monkeypatch):
+    monkeypatch.setattr(ollama_client, 'STREAM_RETRIES', 1)
+    calls = _models(monkeypatch, {'small': ["bad", "bad"],
+                                  'big': [f"{STREAM_ABORT_PREFIX} unbalanced", "ok big", "bad big"]})
+    assert call_ollama_cascade('big', 'prompt', valid, stream_validator_factory=lambda: None) == ("ok big", 'big')
+    # The final model's answer is returned as it is, never validated again
+    assert call_ollama_cascade('big', 'prompt', valid, stream_validator_factory=lambda: None) == ("bad big", 'big')
+    assert calls == ['small', 'big', 'big', 'small', 'big']
+
+
+def test_deadline_stops_the_cascade(monkeypatch):
+    calls = _models(monkeypatch, {'small': [f"{DEADLINE_PREFIX} 0.0s left"], 'big': ["ok big"]})
+    result, model = call_ollama_cascade('big', 'prompt', valid)
+    assert result.startswith(DEADLINE_PREFIX) and model == 'small'
+    assert calls == ['small']
+
+
+def test_final_model_error_counts_as_failed(monkeypatch):
+    _models(monkeypatch, {'small': ["bad"], 'big': ["Error: timed out"]})
+    accepted = counter('cascade_accepted', endpoint='cascade-fail', model='big')
+    failed = counter('cascade_failed', endpoint='cascade-fail', model='big')
+    assert call_ollama_cascade('big', 'prompt', valid, endpoint='cascade-fail') == ("Error: timed out", 'big')
+    assert counter('cascade_accepted', endpoint='cascade-fail', model='big') == accepted
+    assert counter('cascade_failed', endpoint='cascade-fail', model='big') == failed + 1
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import chat_sessions
+from chat_sessions import ChatSession, build_window, conversation_id
+
+
+def conversation(turns):
+    messages = [{"role": "system", "content": "You are helpful."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "lorem ipsum " * 10})
+        messages.append({"role": "assistant", "content": "answer"})
+    return messages
+
+
+def test_window_keeps_prefix_between_moves():
+    chat_sessions.CHAT_HISTORY_TOKENS = 200
+    session = ChatSession("c1", "http://localhost:11434")
+    windows = [build_window(session, conversation(n)[:-1], "m") for n in range(1, 10)]
+
+    moves = [i for i in range(1, len(windows)) if windows[i][1] != windows[i - 1][1]]
+    assert moves, "window never moved"
+    for i in range(1, len(windows)):
+        if i not in moves:
+            # Same prefix as last turn, only new messages appended
+            assert windows[i][:len(windows[i - 1])] == windows[i - 1]
+    for window in windows:
+        assert window[0]["role"] == "system"
+        assert window[1]["role"] == "user"
+
+
+def test_restarted_conversation_resets_window():
+    chat_sessions.CHAT_HISTORY_TOKENS = 200
+    session = ChatSession("c2", "http://localhost:11434")
+    build_window(session, conversation(9)[:-1], "m")
+    assert session.dropped > 0
+    window = build_window(session, conversation(1)[:-1], "m")
+    assert session.dropped == 0
+    assert len(window) == 2
+
+
+def test_conversation_id_stable_across_turns():
+    first = conversation_id({"model": "m", "messages": conversation(1)}, {})
+    later = conversation_id({"model": "m", "messages": conversation(5)}, {})
+    assert first == later
+    assert conversation_id({"messages": []}, {"X-Conversation-Id": "abc"}) == "abc"
+
+
+def test_same_user_keeps_conversations_apart():
+    first = [{"role": "user", "content": "Translate Psalm 22"}]
+    second = [{"role": "user", "content": "Number this array"}]
+    a = conversation_id({"model": "m", "user": "alice", "messages": first}, {})
+    b = conversation_id({"model": "m", "user": "alice", "messages": second}, {})
+    assert a != b
+    assert a != "alice" and b != "alice"
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from metrics import observe
+from request_context import deadline_scope, time_left, DeadlineExceeded
+from ollama_client import adaptive_timeout, call_timeout, OLLAMA_TIMEOUT, OLLAMA_MIN_TIMEOUT
+import scheduler
+
+
+def test_earlier_deadline_wins():
+    now = time.time()
+    assert time_left() is None
+    with deadline_scope(now + 5):
+        with deadline_scope(now + 60):
+            assert time_left() <= 5
+        with deadline_scope(now + 1):
+            assert time_left() <= 1
+    assert time_left() is None
+
+
+def test_timeout_adapts_to_latency_and_deadline():
+    assert adaptive_timeout('deadline-test-model') == OLLAMA_TIMEOUT
+    for _ in range(30):
+        observe('model_latency_s', 2.0, model='deadline-test-model')
+    assert adaptive_timeout('deadline-test-model') == max(OLLAMA_MIN_TIMEOUT, 6.0)
+    with deadline_scope(time.time() + 3):
+        assert call_timeout('deadline-test-model') <= 3
+        assert call_timeout('other-model', 100) <= 3
+
+
+def test_admission_sheds_work_that_cannot_finish():
+    for _ in range(scheduler.ADMISSION_MIN_SAMPLES):
+        observe('model_task_s', 4.0)
+    with deadline_scope(time.time() + 60):
+        scheduler.admit()
+    with deadline_scope(time.time() + 1):
+        try:
+            scheduler.admit()
+            assert False, "expected DeadlineExceeded"
+        except DeadlineExceeded as e:
+            assert "left" in str(e)
+
+
+def test_only_completed_tasks_are_timed():
+    from metrics import sample_count
+    from ollama_client import DEADLINE_PREFIX, CANCELLED_PREFIX
+
+    before = sample_count('model_task_s')
+    for result in (f"{DEADLINE_PREFIX} 0.0s left", (f"{CANCELLED_PREFIX} client gone", 'm'), "verse"):
+        scheduler.submit_model_task(lambda r: r, result).result()
+    try:
+        with deadline_scope(time.time() - 1):
+            scheduler.submit_model_task(lambda: "never runs").result()
+        assert False, "expected DeadlineExceeded"
+    except DeadlineExceeded:
+        pass
+    assert sample_count('model_task_s') == before + 1
+
+
+def test_deadline_in_model_text_is_a_504(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)   # the server logs to server_debug.log in the working directory
+    import coding_server
+    from ollama_client import DEADLINE_PREFIX
+
+    monkeypatch.setattr(coding_server, 'call_ollama_smart',
+                        lambda *args, **kwargs: f"{DEADLINE_PREFIX} 0.0s left")
+    response = coding_server.app.test_client().post('/api/analyze-latin', json={"text": "Dominus regit me"})
+    assert response.status_code == 504
+
+
+def test_ai_verse_adjustment_runs_in_a_scheduler_slot(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)   # the server logs to server_debug.log in the working directory
+    import coding_server
+    from request_context import current_token
+
+    slots = []
+
+    def analyze(verses):
+        slots.append(current_token() is not None)
+        return {"verse_boundaries": verses}
+
+    def adjust(verses, analysis, target_count):
+        slots.append(current_token() is not None)
+        return {"new_verses": [{"content": " ".join(verses)}], "explanation": "joined"}
+
+    monkeypatch.setattr(coding_server, 'analyze_verse_structure_with_ai', analyze)
+    monkeypatch.setattr(coding_server, 'adjust_verses_to_count', adjust)
+    response = coding_server.app.test_client().post('/api/adjust-liturgical-verses', json={
+        "code": 'let text = [\n    "Dominus regit me",\n    "et nihil mihi deerit"\n]',
+        "target_verse_count": 1, "method": "ai"})
+    assert response.status_code == 200
+    assert response.get_json()["new_verse_count"] == 1
+    assert slots == [True, True]
@@ -0,0 +1,34 @@
+import os
+import importlib.util
+
+
+def _config(monkeypatch, tmp_path):
+    monkeypatch.setenv('SHARED_STORE_PATH', str(tmp_path / 'shared.sqlite3'))
+    monkeypatch.setenv('LOCAL_WORKER_BASE_PORT', '11500')
+    path = os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+
+class Worker:
+    pass
+
+
+def test_replacement_worker_reuses_only_a_freed_port_slot(monkeypatch, tmp_path):
+    config = _config(monkeypatch, tmp_path)
+    workers = [Worker() for _ in range(3)]
+    for worker in workers:
+        config.pre_fork(None, worker)
+    assert [w.local_port_slot for w in workers] == [0, 1, 2]
+
+    # Worker 1 exits; its replacement takes slot 1, the next one slot 3
+    config.child_exit(None, workers[1])
+    replacement, extra = Worker(), Worker()
+    config.pre_fork(None, replacement)
+    config.pre_fork(None, extra)
+    assert (replacement.local_port_slot, extra.local_port_slot) == (1, 3)
+
+    config.post_fork(None, replacement)
+    assert os.environ['LOCAL_WORKER_BASE_PORT'] == str(11500 + config._LOCAL_WORKERS)
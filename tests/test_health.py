@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ollama_client import OllamaSnapshot
+
+
+def _server(monkeypatch, tmp_path, snapshot):
+    monkeypatch.chdir(tmp_path)   # the server logs to server_debug.log in the working directory
+    import coding_server
+    monkeypatch.setattr(coding_server, 'get_ollama_snapshot', lambda: snapshot)
+    return coding_server.app.test_client(), coding_server
+
+
+def test_endpoints_serve_the_cached_snapshot(monkeypatch, tmp_path):
+    snapshot = OllamaSnapshot(True, False, "http", 3.2, ("mistral:7b", "qwen:0.5b"),
+                              {"mistral:7b": {"size": 1}}, time.time(), None)
+    client, _ = _server(monkeypatch, tmp_path, snapshot)
+
+    assert client.get('/health/ready').status_code == 200
+    health = client.get('/health').get_json()["ollama"]
+    assert health["latency_ms"] == 3.2 and health["running_models"] == ["mistral:7b"]
+
+    models = client.get('/api/models').get_json()
+    assert models["available_models"] == ["mistral:7b", "qwen:0.5b"]
+    assert [m["resident"] for m in models["models"]] == [True, False]
+    assert [m["id"] for m in client.get('/v1/models').get_json()["data"]] == ["mistral:7b", "qwen:0.5b"]
+
+
+def test_stale_or_unreachable_snapshot_is_not_ready(monkeypatch, tmp_path):
+    unreachable = OllamaSnapshot(False, False, "none", None, (), {}, time.time(), "connection refused")
+    client, coding_server = _server(monkeypatch, tmp_path, unreachable)
+    response = client.get('/health/ready')
+    assert response.status_code == 503 and response.get_json()["error"] == "connection refused"
+
+    stale = unreachable._replace(available=True, method="http",
+                                 checked_at=time.time() - coding_server.OLLAMA_PROBE_INTERVAL * 4)
+    monkeypatch.setattr(coding_server, 'get_ollama_snapshot', lambda: stale)
+    response = client.get('/health/ready')
+    assert response.status_code == 503 and response.get_json()["error"] == "health snapshot is stale"
+    assert client.get('/health/live').status_code == 200
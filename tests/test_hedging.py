@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import ollama_client
+from metrics import counter
+from request_context import current_token
+from ollama_client import HedgeBudget
+
+
+def test_budget_caps_hedges():
+    budget = HedgeBudget(0.25, 2)
+    assert budget.spend()
+    assert not budget.spend()
+    for _ in range(4):
+        budget.earn()
+    assert budget.spend()
+    assert not budget.spend()
+
+
+def test_late_primary_is_hedged_and_cancelled(monkeypatch):
+    def fake_chat(model_name, messages, base_url, timeout=None, on_first_token=None):
+        if base_url == 'http://slow':
+            token = current_token()
+            for _ in range(50):
+                if token.cancelled:
+                    return "Error: Cancelled: " + token.reason
+                time.sleep(0.01)
+            return "slow answer"
+        on_first_token()
+        return "fast answer"
+
+    monkeypatch.setattr(ollama_client, "_call_ollama_chat", fake_chat)
+    monkeypatch.setattr(ollama_client, "HEDGES", HedgeBudget(0.05, 1))
+    started = time.time()
+    result = ollama_client._hedged_chat('hedge-test', [], 'http://slow', ['http://fast'], None, 0.05)
+    assert result == "fast answer"
+    assert time.time() - started < 1
+    assert counter('hedge_wins', model='hedge-test') == 1
+
+    # Budget spent: the next late request waits for its primary
+    result = ollama_client._hedged_chat('hedge-test', [], 'http://slow', ['http://fast'], None, 0.05)
+    assert result == "slow answer"
+    assert counter('hedge_budget_exhausted', model='hedge-test') == 1
+
+
+def test_saving_is_measured_against_the_primary_first_token(monkeypatch):
+    cancelled = []
+
+    def fake_chat(model_name, messages, base_url, timeout=None, on_first_token=None):
+        if base_url == 'http://slow':
+            time.sleep(0.3)
+            on_first_token()
+            token = current_token()
+            for _ in range(50):
+                if token.cancelled:
+                    cancelled.append(token.reason)
+                    return "Error: Cancelled: " + token.reason
+                time.sleep(0.01)
+            return "slow answer"
+        on_first_token()
+        return "fast answer"
+
+    monkeypatch.setattr(ollama_client, "_call_ollama_chat", fake_chat)
+    monkeypatch.setattr(ollama_client, "HEDGES", HedgeBudget(0.05, 1))
+    saved = counter('hedge_latency_saved_s', model='hedge-measure')
+    assert ollama_client._hedged_chat('hedge-measure', [], 'http://slow', ['http://fast'], None, 0.05) == "fast answer"
+    deadline = time.time() + 2
+    while not cancelled and time.time() < deadline:
+        time.sleep(0.01)
+
+    # The primary is cancelled at its first token, about 0.25s after the hedge's
+    assert cancelled == ["hedge lost"]
+    assert 0.15 < counter('hedge_latency_saved_s', model='hedge-measure') - saved < 0.5
+
+
+def test_earliest_answer_wins():
+    class Attempt:
+        def __init__(self, at):
+            self.at = at
+
+        def answered(self):
+            return self.at is not None
+
+        def answered_at(self):
+            return self.at
+
+    primary, hedge = Attempt(10.2), Attempt(10.1)
+    assert ollama_client._first_answered([primary, hedge]) is hedge
+    silent = Attempt(None)
+    assert ollama_client._first_answered([silent, Attempt(None)]) is silent
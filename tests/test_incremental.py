@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import incremental
+from incremental import element_chunks, ensure_comma, process_incremental
+from shared_store import MemoryStore
+from swift_array import number_elements, parse_array_elements
+
+BASE = '''let text = [
+    "Dominus regit me,",
+    "in loco pascuae,",
+    "super aquam refectionis,",
+    "animam meam convertit."
+]
+'''
+
+
+def _fake_operation(monkeypatch):
+    """Numbering run_operation that records the elements it was sent"""
+    calls = []
+
+    def run_operation(operation, code, model, language):
+        calls.append([e.text for e in parse_array_elements(code)])
+        return {"corrected_code": number_elements(code)}
+
+    monkeypatch.setattr(incremental, 'run_operation', run_operation)
+    monkeypatch.setattr(incremental, 'STORE', MemoryStore())
+    return calls
+
+
+def test_edited_array_reuses_unchanged_elements(monkeypatch):
+    calls = _fake_operation(monkeypatch)
+    first = process_incremental('number-elements', BASE, 'm', document_id='psalm-22')
+    assert first["incremental"]["mode"] == "full"
+
+    edited = BASE.replace('    "in loco pascuae,",\n',
+                          '    "in loco pascuae ibi me collocavit,",\n    "deduxit me,",\n')
+    second = process_incremental('number-elements', edited, 'm', base_hash=first["content_hash"])
+
+    assert second["incremental"] == {"base_found": True, "reused_elements": 3,
+                                     "reprocessed_elements": 2, "mode": "incremental"}
+    # Only the changed window went to the model
+    assert calls[1] == ["in loco pascuae ibi me collocavit,", "deduxit me,"]
+    numbered = [(e.number, e.text) for e in parse_array_elements(second["corrected_code"])]
+    assert numbered == [(1, "Dominus regit me,"), (2, "in loco pascuae ibi me collocavit,"),
+                        (3, "deduxit me,"), (4, "super aquam refectionis,"), (5, "animam meam convertit.")]
+    assert second["edits"]
+
+
+def test_deleting_elements_renumbers_the_tail(monkeypatch):
+    calls = _fake_operation(monkeypatch)
+    first = process_incremental('number-elements', BASE, 'm', document_id='psalm-22')
+    shorter = BASE.replace('    "Dominus regit me,",\n', '')
+    second = process_incremental('number-elements', shorter, 'm', document_id='psalm-22')
+
+    assert len(calls) == 1
+    assert second["incremental"]["reused_elements"] == 3
+    assert [e.number for e in parse_array_elements(second["corrected_code"])] == [1, 2, 3]
+    assert second["base_hash"] == first["content_hash"]
+
+
+def test_edited_declaration_is_not_lost(monkeypatch):
+    calls = _fake_operation(monkeypatch)
+    first = process_incremental('number-elements', BASE, 'm', document_id='psalm-22')
+    edited = BASE.replace('let text', 'let verses').replace('"in loco pascuae,"', '"in loco pascuae ibi,"')
+    second = process_incremental('number-elements', edited, 'm', base_hash=first["content_hash"])
+
+    assert second["incremental"]["mode"] == "full"
+    assert second["corrected_code"].startswith('let verses = [')
+    assert '/* 2 */ "in loco pascuae ibi,"' in second["corrected_code"]
+    assert len(calls) == 2
+
+
+def test_element_chunks_and_ensure_comma():
+    texts, prefix, chunks, suffix = element_chunks(BASE)
+    assert texts[0] == "Dominus regit me,"
+    assert prefix + ''.join(chunks) + suffix == BASE
+    assert ensure_comma('    "a" // note\n') == '    "a", // note\n'
+    assert ensure_comma('    "a",\n') == '    "a",\n'
+    assert element_chunks('let a = ["x", "y"]') is None
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from latin_normalize import normalize_word, latin_words
+
+
+def test_spelling_variants_share_a_key():
+    for a, b in (("Jerusalem", "Ierusalem"), ("cæli", "caeli"), ("salutáris", "salutaris"), ("Vidit", "uidit")):
+        assert normalize_word(a).key == normalize_word(b).key
+    assert normalize_word("Jerusalem").display == "jerusalem"
+    assert normalize_word("Jerusalem").surface == "Jerusalem"
+
+
+def test_enclitics():
+    assert normalize_word("Dominumque")[1:] == ("dominum", "dominum", "que")
+    assert normalize_word("estne").enclitic == "ne"
+    assert normalize_word("plusve").enclitic == "ve"
+    for word in ("atque", "quisque", "quicumque", "carne", "sine", "nonne", "salve", "utrumque"):
+        assert normalize_word(word).enclitic is None, word
+
+
+def test_words_that_only_look_enclitic():
+    for word in ("aeque", "hucusque", "bove", "move", "Iove", "Jove", "relinque", "oblique"):
+        assert normalize_word(word).enclitic is None, word
+    assert normalize_word("eumve").enclitic == "ve"
+    assert normalize_word("Deusque").enclitic == "que"
+
+
+def test_words_keep_accented_and_ligature_forms():
+    assert latin_words("Cæli enárrant glóriam Dei, 19") == ["Cæli", "enárrant", "glóriam", "Dei"]
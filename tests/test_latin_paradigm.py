@@ -0,0 +1,74 @@
+import sys
+import os
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from latin_normalize import normalize_word
+from latin_paradigm import FormIndex, verb_forms, noun_forms, unpack
+
+RIGO = {
+    "input": "rigabo", "lemma": "rigo", "part_of_speech": "verb", "conjugation": 1,
+    "infinitive": "rigare", "perfect": "rigavi", "supine": "rigatum",
+    "translations": {"en": "to water"},
+    "analysis": {"tense": "future", "person": "1", "confidence": "high"}
+}
+REX = {
+    "input": "regis", "lemma": "rex", "part_of_speech": "noun", "declension": 3,
+    "gender": "masculine", "genitive": "regis", "translations": {"en": "king"},
+    "analysis": {"confidence": "high"}
+}
+
+
+def forms(generated):
+    return {form: unpack(code) for form, code in generated}
+
+
+def test_verb_paradigm_covers_both_systems():
+    amo = forms(verb_forms('amo', 1, 'amare', 'amavi', 'amatum'))
+    assert amo['amabunt'] == {"person": "3", "number": "plural", "tense": "future",
+                              "mood": "indicative", "voice": "active"}
+    assert amo['amaveratis']['tense'] == 'pluperfect'
+    assert amo['amarentur']['mood'] == 'subjunctive'
+    capio = forms(verb_forms('capio', 3, 'capere', 'cepi'))
+    assert 'capiunt' in capio and 'capiebam' in capio and 'caperet' in capio
+    # Deponent and irregular verbs are not expanded
+    assert verb_forms('loquor', 3, 'loqui') == []
+    assert verb_forms('sum', None, 'esse') == []
+
+
+def test_noun_paradigms():
+    assert forms(noun_forms('urbs', 3, 'feminine', 'urbis'))['urbium'] == {"case": "genitive", "number": "plural"}
+    assert 'patrum' in forms(noun_forms('pater', 3, 'masculine', 'patris'))
+    assert 'maria' in forms(noun_forms('mare', 3, 'neuter', 'maris'))
+    assert 'fili' in forms(noun_forms('filius', 2, 'masculine'))
+    assert noun_forms('rex', 3, 'masculine') == []   # no genitive, no stem
+
+
+def test_index_answers_related_forms():
+    index = FormIndex()
+    assert index.add(RIGO, 'm') > 90
+    assert index.add(RIGO, 'm') == 0   # lemma already expanded
+
+    result = index.lookup(normalize_word('rigabunt'), 'm')
+    assert result["lemma"] == "rigo" and result["source"] == "paradigm"
+    assert result["analysis"]["identified_form"] == "3rd person plural future active indicative"
+    assert result["translations"] == {"en": "to water"}
+    assert index.lookup(normalize_word('rigabunt'), 'other-model') is None
+
+    # "regis" is both a form of rex and of rego
+    index.add(REX, 'm')
+    index.add({"input": "rego", "lemma": "rego", "part_of_speech": "verb", "conjugation": 3,
+               "infinitive": "regere", "analysis": {"confidence": "high"}}, 'm')
+    result = index.lookup(normalize_word('regis'), 'm')
+    assert result["lemma"] == "rex"
+    assert result["alternatives"][0]["lemma"] == "rego"
+    assert index.stats()["lemmas"] == 3
+
+
+def test_index_skips_inconsistent_analyses():
+    index = FormIndex()
+    wrong = dict(RIGO, input="rigabo", conjugation=2, infinitive="rigere")
+    assert index.add(wrong, 'm') == 0
+    assert index.add(dict(RIGO, analysis={"confidence": "low"}), 'm') == 0
+    assert FormIndex(max_records=10).add(RIGO, 'm') == 0
+    assert index.stats()["records"] == 0
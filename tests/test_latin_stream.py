@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+TEXT = "Dominus regit populum, Dominusque regit"
+
+
+def _server(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)   # the server logs to server_debug.log in the working directory
+    import coding_server
+
+    analyzed = []
+
+    def cached(form, model):
+        return {"lemma": "dominus", "part_of_speech": "noun"} if form.key == "dominus" else None
+
+    def analyze(form, model):
+        analyzed.append(form.key)
+        if form.key == "populum":
+            return {"lemma": "unknown", "part_of_speech": "unknown", "error": "Error: timed out"}
+        return {"lemma": form.key, "part_of_speech": "verb"}
+
+    monkeypatch.setattr(coding_server, 'cached_form_analysis', cached)
+    monkeypatch.setattr(coding_server, 'analyze_canonical_form', analyze)
+    return coding_server.app.test_client(), analyzed
+
+
+def test_ndjson_stream_sends_cache_hits_first(monkeypatch, tmp_path):
+    client, analyzed = _server(monkeypatch, tmp_path)
+    response = client.post('/api/analyze-latin-text', json={"text": TEXT, "stream": True})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    start, words, done = lines[0], lines[1:-1], lines[-1]
+    assert start["words"] == ["Dominus", "regit", "populum", "Dominusque", "regit"]
+    assert start["unique_forms"] == 3 and start["cached_forms"] == 1
+    # Both spellings of the cached form come before any model result
+    assert [(w["index"], w["source"]) for w in words[:2]] == [(0, "cache"), (3, "cache")]
+    assert words[1]["enclitic"] == "que"
+    assert sorted(w["index"] for w in words) == [0, 1, 2, 3, 4]
+    # A repeated form is analyzed once and sent for every index
+    assert sorted(analyzed) == ["populum", "regit"]
+    assert done["done"] and done["model_forms"] == 2 and done["failed"] == 1
+
+
+def test_sse_stream_uses_named_events(monkeypatch, tmp_path):
+    client, _ = _server(monkeypatch, tmp_path)
+    response = client.post('/api/analyze-latin-text', json={"text": TEXT},
+                           headers={"Accept": "text/event-stream"})
+    assert response.mimetype == 'text/event-stream'
+    events = response.get_data(as_text=True).strip().split("\n\n")
+    names = [event.split("\n")[0] for event in events]
+    assert names == ["event: start"] + ["event: word"] * 5 + ["event: done"]
+    assert json.loads(events[-1].split("\n")[1][len("data: "):])["word_count"] == 5
@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import latin_morphology
+from lexicon_prebuild import collect_forms, corpus_texts, load_checkpoint, prebuild
+
+
+def test_forms_are_deduplicated_across_files(tmp_path):
+    (tmp_path / "ps1.swift").write_text('let text = [\n  /* 1 */ "Jerusalem cæli",\n  "Ierusalem caeli"\n]\n')
+    (tmp_path / "ps2.txt").write_text("Dominumque laudate dominum")
+    forms, counts = collect_forms(corpus_texts([str(tmp_path)], ('.swift', '.txt')))
+    assert counts["ierusalem"] == 2 and counts["caeli"] == 2
+    assert counts["dominum"] == 2
+    assert "let" not in forms and "text" not in forms
+
+
+def test_interrupted_run_resumes(tmp_path, monkeypatch):
+    forms, counts = collect_forms([("ps", "regit nihil deerit pascuae")])
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    calls = []
+
+    def failing_once(word, model):
+        calls.append(word)
+        if word == "deerit" and calls.count(word) == 1:
+            return {"error": "Error: timeout"}
+        return {"lemma": word, "part_of_speech": "verb"}
+
+    monkeypatch.setattr(latin_morphology, "analyze_latin_word_with_ai", failing_once)
+    monkeypatch.setattr("ollama_client.check_ollama_availability", lambda: True)
+
+    report = prebuild(forms, counts, "prebuild-test", 2, load_checkpoint(checkpoint_path, "prebuild-test"),
+                      checkpoint_path)
+    assert report["analyzed"] == 3 and report["failed"] == 1
+    assert report["word_coverage"] == 0.75
+    saved = json.load(open(checkpoint_path))
+    assert "deerit" in saved["failed"] and "regit" in saved["done"]
+
+    report = prebuild(forms, counts, "prebuild-test", 2, load_checkpoint(checkpoint_path, "prebuild-test"),
+                      checkpoint_path)
+    assert report["analyzed"] == 1 and report["form_coverage"] == 1.0
+    assert sorted(calls) == ["deerit", "deerit", "nihil", "pascuae", "regit"]
+
+
+def test_pending_forms_are_read_from_the_lexicon_once(tmp_path, monkeypatch):
+    from shared_store import MemoryStore
+
+    reads = []
+
+    class CountingStore(MemoryStore):
+        def get(self, namespace, key):
+            reads.append(key)
+            return super().get(namespace, key)
+
+    monkeypatch.setattr(latin_morphology, "STORE", CountingStore())
+    monkeypatch.setattr(latin_morphology, "analyze_latin_word_with_ai",
+                        lambda word, model: {"lemma": word, "part_of_speech": "adverb"})
+    monkeypatch.setattr("ollama_client.check_ollama_availability", lambda: True)
+
+    forms, counts = collect_forms([("ps", "nihil deerit mihi")])
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    report = prebuild(forms, counts, "prebuild-reads", 2, load_checkpoint(checkpoint_path, "prebuild-reads"),
+                      checkpoint_path)
+    assert report["analyzed"] == 3
+    assert sorted(reads) == ["prebuild-reads:deerit", "prebuild-reads:mihi", "prebuild-reads:nihil"]
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import threading
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import ollama_client
+from local_workers import LocalWorker
+from shared_store import MemoryStore
+
+
+def _daemon_down(monkeypatch):
+    def refuse(self, url, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+    monkeypatch.setattr(requests.Session, 'get', refuse)
+    monkeypatch.setattr(ollama_client, 'OLLAMA_BASE_URL', 'http://localhost:11434')
+
+    def no_spawn(self):
+        raise AssertionError("the probe started a local worker")
+    monkeypatch.setattr(LocalWorker, 'start', no_spawn)
+
+
+def test_probe_does_not_start_a_local_worker(monkeypatch):
+    _daemon_down(monkeypatch)
+    monkeypatch.setattr(ollama_client.shutil, 'which', lambda name: '/usr/bin/ollama')
+    snapshot = ollama_client.probe_ollama()
+    assert not snapshot.available
+    assert snapshot.method == "cli" and snapshot.models == ()
+
+    monkeypatch.setattr(ollama_client.shutil, 'which', lambda name: None)
+    assert ollama_client.probe_ollama().method == "none"
+
+
+def test_only_the_lease_holder_probes(monkeypatch):
+    monkeypatch.setattr(ollama_client, 'STORE', MemoryStore())
+    probes = []
+
+    def fake_probe():
+        probes.append(1)
+        snapshot = ollama_client.OllamaSnapshot(True, False, "http", 1.0, ("m",), {}, time.time(), None)
+        ollama_client._SNAPSHOT = snapshot
+        return snapshot
+    monkeypatch.setattr(ollama_client, 'probe_ollama', fake_probe)
+    monkeypatch.setattr(ollama_client, '_SNAPSHOT', ollama_client._SNAPSHOT._replace(checked_at=0, models=()))
+
+    assert ollama_client._probe_round('leader', 15)
+    published = ollama_client._SNAPSHOT
+    ollama_client._SNAPSHOT = published._replace(checked_at=0, models=())
+
+    assert not ollama_client._probe_round('follower', 15)
+    assert len(probes) == 1
+    assert ollama_client.get_ollama_snapshot().models == ("m",)
+    assert ollama_client._probe_round('leader', 15)
+    assert len(probes) == 2
+
+
+def test_stale_snapshot_is_probed_once(monkeypatch):
+    monkeypatch.setattr(ollama_client, '_SNAPSHOT', ollama_client._SNAPSHOT._replace(checked_at=0))
+    monkeypatch.setattr(ollama_client, 'prober_running', lambda: False)
+    release = threading.Event()
+    probes = []
+
+    def slow_probe():
+        probes.append(1)
+        release.wait(2)
+        return ollama_client._SNAPSHOT._replace(available=True)
+    monkeypatch.setattr(ollama_client, 'probe_ollama', slow_probe)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(ollama_client.check_ollama_availability()))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while not probes:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(probes) == 1
+    assert sorted(results) == [False] * 4 + [True]
@@ -0,0 +1,51 @@
+import sys
+import os
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import output_verifier
+from output_verifier import verify_output, repair_output
+
+VERSES = [f"verse {i}" for i in range(1, 11)]
+ORIGINAL = 'let text = [\n' + ''.join(f'  "{v}",\n' for v in VERSES) + ']'
+
+
+def numbered(verses, numbers=None):
+    numbers = numbers or range(1, len(verses) + 1)
+    return 'let text = [\n' + ''.join(f'  /* {n} */ "{v}",\n' for n, v in zip(numbers, verses)) + ']'
+
+
+def test_verify_locates_lost_altered_and_misnumbered_elements():
+    output = numbered(VERSES[:3] + ["verse FOUR"] + VERSES[4:6] + VERSES[7:],
+                      [1, 2, 3, 4, 5, 6, 7, 9, 9])
+    problems = verify_output(ORIGINAL, output, numbered=True)
+    assert [tuple(p) for p in problems] == [('altered', 3, 4), ('lost', 6, 7), ('misnumbered', 7, 8), ('misnumbered', 9, 10)]
+    assert verify_output(ORIGINAL, numbered(VERSES), numbered=True) == []
+
+
+def test_repair_regenerates_only_the_broken_window(monkeypatch):
+    windows = []
+
+    def fake_window(operation, chunks, model, language):
+        windows.append(chunks)
+        return chunks, None
+
+    monkeypatch.setattr(output_verifier, 'process_window', fake_window)
+    output = numbered(VERSES[:5] + VERSES[6:])
+    repaired, report = repair_output('fix-array-comments', ORIGINAL, output, 'model')
+    assert repaired == numbered(VERSES)
+    assert report["regenerated_elements"] == 3
+    assert len(windows) == 1
+    assert [c.strip() for c in windows[0]] == ['"verse 5",', '"verse 6",', '"verse 7",']
+
+
+def test_repair_drops_duplicates_and_rejects_wholesale_damage(monkeypatch):
+    monkeypatch.setattr(output_verifier, 'process_window', lambda *args: (None, "unused"))
+    duplicated = numbered(VERSES[:4] + ["verse 4"] + VERSES[4:])
+    repaired, report = repair_output('fix-array-comments', ORIGINAL, duplicated, 'model')
+    assert repaired == numbered(VERSES)
+    assert report["regenerated_elements"] == 0
+
+    repaired, reason = repair_output('fix-array-comments', ORIGINAL, numbered(VERSES[:3]), 'model')
+    assert repaired is None
+    assert "lost 4-10" in reason
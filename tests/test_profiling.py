@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import profiling
+from profiling import RequestProfile, collapsed, speedscope
+
+
+def test_collapsed_and_speedscope_formats():
+    outer = ('handler (server.py:1)', 'server.py', 1)
+    inner = ('clean (code.py:5)', 'code.py', 5)
+    samples = Counter({(outer, inner): 3, (outer,): 1})
+
+    assert collapsed(samples) == 'handler (server.py:1);clean (code.py:5) 3\nhandler (server.py:1) 1\n'
+
+    document = speedscope(samples, 'POST /api/x', 0.02, 0.005)
+    assert [f["name"] for f in document["shared"]["frames"]] == ['handler', 'clean']
+    profile = document["profiles"][0]
+    assert profile["samples"] == [[0, 1], [0]]
+    assert profile["weights"] == [0.015, 0.005]
+
+
+def test_attached_threads_are_sampled():
+    profile = RequestProfile('0' * 16, 'test')
+    token = profiling._current_profile.set(profile)
+    profile.start()
+
+    def busy_worker():
+        deadline = time.time() + 0.1
+        while time.time() < deadline:
+            pass
+
+    def worker():
+        with profiling.attached():
+            busy_worker()
+    # Like the scheduler, which runs tasks in a copy of the request's context
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(worker,))
+    thread.start()
+    thread.join()
+    profile.stop()
+    profiling._current_profile.reset(token)
+
+    assert any('busy_worker' in frame[0] for stack in profile.samples for frame in stack)
+
+
+def test_admin_check_denies_by_default(monkeypatch):
+    from flask import Flask
+
+    app = Flask(__name__)
+    loopback = {'REMOTE_ADDR': '127.0.0.1'}
+    monkeypatch.setattr(profiling, 'PROFILE_ADMIN_TOKEN', None)
+    monkeypatch.setattr(profiling, 'PROFILE_ALLOW_LOOPBACK', False)
+    with app.test_request_context(environ_base=loopback):
+        assert not profiling.is_admin()
+
+    monkeypatch.setattr(profiling, 'PROFILE_ALLOW_LOOPBACK', True)
+    with app.test_request_context(environ_base=loopback):
+        assert profiling.is_admin()
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.5'}):
+        assert not profiling.is_admin()
+
+    # A configured token is required even from loopback
+    monkeypatch.setattr(profiling, 'PROFILE_ADMIN_TOKEN', 'secret')
+    with app.test_request_context(environ_base=loopback):
+        assert not profiling.is_admin()
+    with app.test_request_context(headers={'X-Admin-Token': 'secret'}, environ_base={'REMOTE_ADDR': '10.0.0.5'}):
+        assert profiling.is_admin()
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import stat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import psalm_cli
+from psalm_cli import atomic_write, main, MANIFEST_NAME
+
+PSALM = '''let text = [
+    "Dominus regit me,",
+    "in loco pascuae."
+]
+'''
+
+
+def _tree(tmp_path):
+    root = tmp_path / 'psalms'
+    (root / 'book1').mkdir(parents=True)
+    (root / 'book1' / 'psalm22.swift').write_text(PSALM)
+    (root / 'psalm23.swift').write_text(PSALM.replace('Dominus', 'Deus'))
+    (root / 'notes.txt').write_text('not swift')
+    return root
+
+
+def test_batch_writes_output_tree_and_skips_unchanged(tmp_path, capsys):
+    root = _tree(tmp_path)
+    out = tmp_path / 'out'
+    assert main([str(root), '--operation', 'renumber', '--local', '--output', str(out), '--jobs', '2']) == 0
+
+    numbered = (out / 'book1' / 'psalm22.swift').read_text()
+    assert '/* 1 */ "Dominus regit me,"' in numbered and '/* 2 */ "in loco pascuae."' in numbered
+    assert numbered.endswith(']\n')
+    assert not (out / 'notes.txt').exists()
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert sorted(manifest["files"]) == [os.path.join('book1', 'psalm22.swift'), 'psalm23.swift']
+    assert (root / 'psalm23.swift').read_text() == PSALM.replace('Dominus', 'Deus')
+
+    # Only the edited file is processed again
+    (root / 'psalm23.swift').write_text(PSALM.replace('Dominus', 'Dominus Deus'))
+    capsys.readouterr()
+    assert main([str(root), '--operation', 'renumber', '--local', '--output', str(out), '--jobs', '1']) == 0
+    report = capsys.readouterr().out
+    assert "1 to process, 1 unchanged" in report
+    assert '/* 1 */ "Dominus Deus regit me,"' in (out / 'psalm23.swift').read_text()
+
+
+def test_in_place_output_is_not_processed_again(tmp_path, capsys):
+    root = _tree(tmp_path)
+    assert main([str(root), '--operation', 'renumber', '--local', '--jobs', '1']) == 0
+    assert '/* 1 */' in (root / 'psalm23.swift').read_text()
+    capsys.readouterr()
+    assert main([str(root), '--operation', 'renumber', '--local', '--jobs', '1']) == 0
+    assert "0 to process, 2 unchanged" in capsys.readouterr().out
+
+
+def test_atomic_write_keeps_mode_and_old_file_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / 'psalm.swift'
+    path.write_text('old')
+    os.chmod(path, 0o640)
+    atomic_write(str(path), 'new')
+    assert path.read_text() == 'new'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(psalm_cli.os, 'replace', fail)
+    try:
+        atomic_write(str(path), 'newer')
+        assert False, "atomic_write swallowed the error"
+    except OSError:
+        pass
+    assert path.read_text() == 'new'
+    assert os.listdir(tmp_path) == ['psalm.swift']
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from request_context import CancelToken, GenerationCancelled, token_scope, is_cancelled
+from scheduler import submit_model_task
+
+
+def test_cancel_runs_callbacks_once():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append(1))
+    unregister = token.on_cancel(lambda: calls.append(2))
+    unregister()
+    token.cancel("client disconnected")
+    token.cancel("again")
+    assert calls == [1]
+    assert token.reason == "client disconnected"
+
+
+def test_callback_registered_after_cancel_runs_immediately():
+    token = CancelToken()
+    token.cancel()
+    calls = []
+    token.on_cancel(lambda: calls.append(1))
+    assert calls == [1]
+
+
+def test_token_reaches_scheduler_worker():
+    token = CancelToken()
+    with token_scope(token):
+        seen = submit_model_task(is_cancelled).result(timeout=5)
+    assert seen is False
+    assert not is_cancelled()
+
+
+def test_cancelled_task_does_not_start():
+    token = CancelToken()
+    token.cancel()
+    started = threading.Event()
+    with token_scope(token):
+        future = submit_model_task(started.set)
+    try:
+        future.result(timeout=5)
+        assert False, "expected GenerationCancelled"
+    except GenerationCancelled:
+        pass
+    assert not started.is_set()
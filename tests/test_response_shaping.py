@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from response_shaping import check_shape, shape_response, unified_diff
+
+
+ORIGINAL = 'let a = [\n  "x",\n  "y"\n]'
+CORRECTED = 'let a = [\n  /* 1 */ "x",\n  /* 2 */ "y"\n]'
+
+
+def _response():
+    return {"original_code": ORIGINAL, "corrected_code": CORRECTED, "success": True}
+
+
+def test_full_is_unchanged_and_unknown_shape_rejected():
+    assert shape_response({}, ORIGINAL, _response(), 'corrected_code') == _response()
+    assert check_shape({"response_shape": "tiny"})
+    assert check_shape({"response_shape": "diff"}) is None
+
+
+def test_slim_diff_and_edits():
+    slim = shape_response({"response_shape": "slim"}, ORIGINAL, _response(), 'corrected_code')
+    assert "original_code" not in slim and slim["corrected_code"] == CORRECTED
+
+    diff = shape_response({"response_shape": "diff"}, ORIGINAL, _response(), 'corrected_code')
+    assert "corrected_code" not in diff
+    assert '+  /* 1 */ "x",' in diff["diff"] and '-  "y"' in diff["diff"]
+
+    edits = shape_response({"response_shape": "edits"}, ORIGINAL, _response(), 'corrected_code')
+    lines = ORIGINAL.split('\n')
+    for edit in reversed(edits["patch"]):
+        lines[edit["start_line"]:edit["end_line"]] = edit["lines"]
+    assert '\n'.join(lines) == CORRECTED
+
+
+def test_diff_marks_missing_final_newline():
+    assert '\\ No newline at end of file' in unified_diff('a\nb', 'a\nc')
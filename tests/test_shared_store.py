@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared_store import MemoryStore, SQLiteStore, TRIM_EVERY
+
+
+def _exercise(store):
+    store.set('ns', 'a', {"value": [1, 2]})
+    assert store.get('ns', 'a') == {"value": [1, 2]}
+    assert store.get('other', 'a') is None
+
+    store.set('ns', 'short', 'x', ttl=0.05)
+    time.sleep(0.1)
+    assert store.get('ns', 'short') is None
+
+    store.delete('ns', 'a')
+    assert store.get('ns', 'a') is None
+
+    assert store.try_lease('prober', 'one', 10)
+    assert store.try_lease('prober', 'one', 10)
+    assert not store.try_lease('prober', 'two', 10)
+
+
+def test_memory_store():
+    _exercise(MemoryStore())
+
+
+def test_memory_store_evicts_oldest_write():
+    store = MemoryStore()
+    for key in 'abc':
+        store.set('ns', key, key, max_entries=2)
+    store.set('other', 'x', 1, max_entries=1)
+    assert store.get('ns', 'a') is None and store.get('ns', 'b') == 'b'
+
+    # Rewriting a key makes it the newest
+    store.set('ns', 'b', 'B', max_entries=2)
+    store.set('ns', 'd', 'd', max_entries=2)
+    assert store.get('ns', 'c') is None
+    assert store.get('ns', 'b') == 'B' and store.get('other', 'x') == 1
+    assert store.describe()["entries"] == 3
+
+
+def test_sqlite_store_is_shared_between_instances():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'shared.sqlite3')
+        _exercise(SQLiteStore(path))
+
+        first, second = SQLiteStore(path), SQLiteStore(path)
+        first.set('health', 'ollama', {"available": True})
+        assert second.get('health', 'ollama') == {"available": True}
+        assert not second.try_lease('prober', 'two', 10)
+
+
+def test_sqlite_store_trims_each_capped_namespace():
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteStore(os.path.join(directory, 'shared.sqlite3'))
+        # Interleaved so the capped namespace never lands on a multiple of TRIM_EVERY overall
+        for i in range(3 * TRIM_EVERY + 8):
+            store.set('capped', f'k{i}', i, max_entries=4)
+            store.set('other', f'k{i}', i)
+        count = store._db().execute("SELECT COUNT(*) FROM kv WHERE namespace = 'capped'").fetchone()[0]
+        assert count <= 4 + TRIM_EVERY
+        assert store.get('capped', f'k{3 * TRIM_EVERY + 7}') == 3 * TRIM_EVERY + 7
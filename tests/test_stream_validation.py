@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from stream_validation import numbering_validator, literal_validator
+
+CODE = 'let a = [\n  "alpha",\n  "beta",\n  "gamma"\n]'
+
+
+def feed_all(validator, output, step=3):
+    for i in range(0, len(output), step):
+        reason = validator.feed(output[i:i + step])
+        if reason or validator.done:
+            return reason
+    return validator.finish()
+
+
+def test_valid_numbering_passes():
+    output = '```swift\nlet a = [\n  /* 1 */ "alpha",\n  /* 2 */ "beta",\n  /* 3 */ "gamma"\n]\n```'
+    assert feed_all(numbering_validator(CODE), output) is None
+
+
+def test_numbering_skip_aborts_before_the_end():
+    validator = numbering_validator(CODE)
+    output = 'let a = [\n  /* 1 */ "alpha",\n  /* 3 */ "beta",\n'
+    assert "numbering skipped" in feed_all(validator, output)
+
+
+def test_rewritten_literal_aborts():
+    output = 'let a = [\n  "alpha",\n  "BETA!",\n'
+    assert "unknown string content" in feed_all(literal_validator(CODE), output)
+
+
+def test_trailing_explanation_stops_without_rejecting():
+    validator = literal_validator(CODE)
+    output = '```\nlet a = [\n  "alpha",\n  "beta",\n  "gamma"\n]\n```\n' + 'Explanation. ' * 50
+    assert feed_all(validator, output) is None
+    assert validator.done
+
+
+def test_runaway_preamble_aborts():
+    assert "runaway" in feed_all(literal_validator(CODE), 'Sure! ' * 200)
+
+
+def test_bracketed_preamble_is_not_code():
+    verses = [f"verse {i} " + "lorem ipsum " * 5 for i in range(1, 8)]
+    code = 'let text = [\n' + ''.join(f'  "{v}",\n' for v in verses) + ']'
+    output = ('Fix items [1] and [2]:\n\nlet text: [String] = [\n'
+              + ''.join(f'  /* {i} */ "{v}",\n' for i, v in enumerate(verses, 1)) + ']\n')
+    validator = numbering_validator(code)
+    assert feed_all(validator, output) is None
+    assert not validator.done
+    assert validator.literal_count == len(verses)
+    assert validator.code_finished
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import structured_output
+from structured_output import parse_json, validate, generate_json
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lemma": {"type": "string", "minLength": 1},
+        "verses": {"type": "array", "items": {"type": "string"}, "minItems": 2}
+    },
+    "required": ["lemma", "verses"]
+}
+
+
+def test_parse_json_takes_first_complete_value():
+    value, error = parse_json('Here it is: {"a": {"b": 1}} and {"c": 2}')
+    assert error is None and value == {"a": {"b": 1}}
+    value, error = parse_json('{broken} then ["ok"]')
+    assert value == ["ok"]
+    value, error = parse_json('no json here')
+    assert value is None and error
+
+
+def test_validate_reports_paths():
+    assert validate({"lemma": "amo", "verses": ["a", "b"]}, SCHEMA) == []
+    errors = validate({"lemma": "", "verses": [3]}, SCHEMA)
+    paths = [path for path, _ in errors]
+    assert "lemma" in paths and "verses" in paths and "verses[0]" in paths
+    assert validate({"verses": True}, SCHEMA)[0] == ("lemma", "missing")
+
+
+def test_invalid_fields_are_repaired_alone(monkeypatch):
+    import ollama_client
+    prompts = []
+
+    def fake_call(model, prompt, timeout=None, operation=None, output_format=None):
+        prompts.append((prompt, output_format))
+        if len(prompts) == 1:
+            return json.dumps({"lemma": "amo", "verses": ["only one"]})
+        return json.dumps({"verses": ["one", "two"]})
+
+    monkeypatch.setattr(ollama_client, "call_ollama_smart", fake_call)
+    monkeypatch.setattr(structured_output, "STRUCTURED_OUTPUT", "schema")
+    value, error = generate_json("m", "prompt", SCHEMA, "test-op")
+    assert error is None
+    assert value == {"lemma": "amo", "verses": ["one", "two"]}
+    assert list(prompts[1][1]["properties"]) == ["verses"]
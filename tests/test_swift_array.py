@@ -0,0 +1,37 @@
+import sys
+import os
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from swift_array import parse_array_elements, number_elements, strip_comments, has_comments
+
+PSALM = os.path.join(os.path.dirname(__file__), '..', 'psalmut.swift')
+
+
+def test_parse_psalm_elements():
+    with open(PSALM, encoding='utf-8') as f:
+        code = f.read()
+    elements = parse_array_elements(code)
+    assert len(elements) == 18
+    assert elements[8].number == 9
+    # Continuation line has no number comment of its own
+    assert elements[9].number is None
+    assert elements[9].text.startswith("principes Juda")
+
+
+def test_number_elements_is_sequential():
+    code = 'let a = [\n  /* 7 */ "a",\n  "b", // note\n  /* 2 */ "c"\n]'
+    numbered = number_elements(code)
+    assert numbered == 'let a = [\n  /* 1 */ "a",\n  /* 2 */ "b", // note\n  /* 3 */ "c"\n]'
+
+
+def test_strings_containing_comment_markers_are_untouched():
+    code = 'let a = [\n  "a /* not a comment */ b", // real\n  "c // still text"\n]'
+    stripped = strip_comments(code)
+    assert stripped == 'let a = [\n  "a /* not a comment */ b",\n  "c // still text"\n]'
+    assert not has_comments(stripped)
+
+
+def test_strip_comments_drops_comment_only_lines():
+    code = 'let a = [\n  // heading\n  /* 1 */ "x", /* trailing */\n\n  "y"\n]'
+    assert strip_comments(code) == 'let a = [\n  "x",\n\n  "y"\n]'
@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from token_budget import plan_budget, restore_stop, check_input, MAX_CONTEXT, MIN_CONTEXT
+
+
+def test_code_budget_scales_with_input():
+    small = plan_budget('fix-array-comments', 'x' * 700)
+    large = plan_budget('fix-array-comments', 'x' * 70000)
+    assert small.num_ctx == MIN_CONTEXT
+    assert large.num_predict > small.num_predict
+    assert large.num_ctx >= large.prompt_tokens + large.num_predict
+    assert large.num_ctx & (large.num_ctx - 1) == 0  # power of two
+
+
+def test_json_budget_is_small_with_brace_stop():
+    budget = plan_budget('analyze-latin-word', 'Analyze "amo"')
+    assert budget.num_predict == 400
+    assert "\n}" in budget.stop
+
+
+def test_oversized_input_rejected():
+    budget = plan_budget('fix-array-comments', 'x' * (MAX_CONTEXT * 8))
+    assert budget.error.startswith("Error: Input too large")
+    assert check_input('fix-array-comments', 'x' * (MAX_CONTEXT * 8)) is not None
+    assert check_input('fix-array-comments', 'let a = ["x"]') is None
+
+
+def test_code_budget_does_not_stop_at_opening_fence():
+    code = plan_budget('fix-array-comments', 'x')
+    assert code.stop == ()
+    reply = 'Here is the fixed array:\n```\nlet x = [\n  /* 1 */ "a"\n]\n```'
+    assert restore_stop(reply, code) == reply
+    assert restore_stop('Here is the fixed array:\n```\n', code) == 'Here is the fixed array:\n```\n'
+
+
+def test_restore_closes_cut_json_only():
+    json_budget = plan_budget('analyze-latin-word', 'x')
+    assert restore_stop('{\n  "a": {"b": 1}', json_budget) == '{\n  "a": {"b": 1}\n}'
+    assert restore_stop('{"a": 1}', json_budget) == '{"a": 1}'
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+
+import requests
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import traffic_capture
+from traffic_capture import sanitize
+from traffic_replay import build_report, send
+
+
+def test_sanitize_masks_secrets_and_keeps_text_shape():
+    body = {"code": "let a = [\n  \"a long verse of the psalm text\"\n]", "api_key": "k", "nested": [{"token": "t"}]}
+    assert sanitize(body) == dict(body, api_key="***", nested=[{"token": "***"}])
+
+    redacted = sanitize(body, redact_text=True)["code"]
+    assert len(redacted) == len(body["code"])
+    assert redacted.count('\n') == body["code"].count('\n')
+    assert "psalm" not in redacted
+
+
+def test_report_groups_latency_by_route():
+    results = [{"path": "/api/a", "status": 200, "seconds": s, "lag": 0.0, "recorded_seconds": s}
+               for s in (0.1, 0.2, 0.3)]
+    results.append({"path": "/api/b", "status": 500, "seconds": 1.0, "lag": 0.5, "recorded_seconds": None})
+    report = build_report(results, 2.0, [(3, 1), (1, 1)])
+    assert report["statuses"] == {"200": 3, "500": 1}
+    assert report["by_path"]["/api/a"]["p50"] == 0.2
+    assert report["queue"]["max_queued"] == 3
+
+
+def test_captured_headers_are_replayed(tmp_path, monkeypatch):
+    path = tmp_path / 'capture.jsonl'
+    monkeypatch.setattr(traffic_capture, 'TRAFFIC_CAPTURE_PATH', str(path))
+    app = Flask(__name__)
+    app.add_url_rule('/api/chat', 'chat', lambda: jsonify({"ok": True}), methods=['POST'])
+    traffic_capture.install(app)
+    response = app.test_client().post('/api/chat', json={"messages": []}, headers={
+        "X-Conversation-Id": "psalm-22", "X-Request-Timeout": "30", "Authorization": "Bearer k"})
+    response.close()
+
+    record = json.loads(path.read_text())
+    assert record["headers"] == {"X-Conversation-Id": "psalm-22", "X-Request-Timeout": "30"}
+
+    sent = {}
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            sent.update(kwargs)
+            raise requests.exceptions.ConnectionError()
+
+    assert send(Session(), 'http://replay', record, 5)[0] == 0
+    assert sent["headers"] == record["headers"]
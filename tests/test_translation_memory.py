@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import ollama_client
+import translation_memory
+from shared_store import MemoryStore
+from translation_memory import TranslationMemory, normalize_verse, split_verses, translate_with_memory
+
+
+def test_normalize_ignores_spelling_variants():
+    assert normalize_verse("Et in sǽcula sæculórum. Amen.") == normalize_verse("et in saecula saeculorum, amen")
+    assert normalize_verse("Iustitia") == normalize_verse("Justitia")
+
+
+def test_exact_and_fuzzy_lookup():
+    memory = TranslationMemory(MemoryStore())
+    memory.add("Dixit Dominus Domino meo: Sede a dextris meis.", "The Lord said to my Lord...", "latin", "english", "m")
+
+    entry, similarity, kind = memory.lookup("dixit dominus domino meo sede a dextris meis", "latin", "english", "m")
+    assert kind == "exact" and similarity == 1.0
+
+    entry, similarity, kind = memory.lookup("Dixit Dominus Domino meo: Sede a dextris meis, donec ponam",
+                                            "latin", "english", "m")
+    assert kind == "fuzzy" and 0.6 < similarity < 1.0
+    assert entry["translation"].startswith("The Lord said")
+
+    assert memory.lookup("Dixit Dominus Domino meo: Sede a dextris meis.", "latin", "german", "m") is None
+    assert memory.lookup("Beatus vir qui non abiit in consilio impiorum", "latin", "english", "m") is None
+
+    # Another model's translation is only a hint
+    entry, similarity, kind = memory.lookup("Dixit Dominus Domino meo: Sede a dextris meis.",
+                                            "latin", "english", "other")
+    assert kind == "fuzzy" and similarity == 1.0
+
+
+def test_separator_lines_are_not_verses():
+    memory = TranslationMemory(MemoryStore())
+    assert memory.lookup("— ;", "latin", "english", "m") is None
+    memory.add("†", "†", "latin", "english", "m")
+    assert split_verses("Gloria Patri.\n†\n*\n— ;\nSicut erat.") == ["Gloria Patri.", "Sicut erat."]
+
+
+def test_near_identical_verse_is_only_a_hint(monkeypatch):
+    monkeypatch.setattr(translation_memory, 'MEMORY', TranslationMemory(MemoryStore()))
+    translation_memory.MEMORY.add("Laudate Dominum omnes gentes, laudate eum omnes populi",
+                                  "Praise the Lord, all ye nations",
+                                  "latin", "english", "m")
+    prompts = []
+    monkeypatch.setattr(ollama_client, 'call_ollama_smart',
+                        lambda model, prompt: prompts.append(prompt) or "Praise the Lord, all ye peoples")
+    batches = []
+
+    def run_all(fn, arg_lists):
+        batches.append(len(arg_lists))
+        return [fn(*args) for args in arg_lists]
+
+    text = ("Laudate Dominum omnes gentes, laudate eum omnes populi\n"
+            "Laudate Dominum omnes gentes, laudate eum omnes populi terrae\n"
+            "Laudate Dominum omnes gentes; laudate eum omnes populi terrae.")
+    results = translate_with_memory(text, "latin", "english", "m", run_all)
+
+    assert [r["source"] for r in results] == ["exact", "model", "model"]
+    assert results[1]["translation"] == "Praise the Lord, all ye peoples"
+    assert results[1]["hint"]["matched_text"] == "Laudate Dominum omnes gentes, laudate eum omnes populi"
+    assert results[2]["text"] == "Laudate Dominum omnes gentes; laudate eum omnes populi terrae."
+    # The two spellings of the new verse are one model call, in one batch
+    assert batches == [1] and len(prompts) == 1
+    assert "Praise the Lord, all ye nations" in prompts[0]
+
+
+def test_split_verses():
+    assert split_verses("Gloria Patri.\n\n  Sicut erat.  \n") == ["Gloria Patri.", "Sicut erat."]
@@ -0,0 +1,62 @@
+import sys
+import os
+import re
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from liturgical_processor import parse_verse_lines, segment_verses
+
+PSALM = os.path.join(os.path.dirname(__file__), '..', 'psalmut.swift')
+
+
+def load_psalm():
+    with open(PSALM, encoding='utf-8') as f:
+        return parse_verse_lines(f.read())
+
+
+def squash(text):
+    return re.sub(r'\s+', '', text)
+
+
+def test_continuation_and_gap_flags():
+    lines, continuation, gap = load_psalm()
+    assert len(lines) == 18
+    # "principes Juda" continues verse 9; verse 10 follows directly
+    assert continuation[9] and not gap[9]
+    # " Dissipa gentes" sits where verse 13 is missing
+    assert continuation[13] and gap[13]
+
+
+def test_exact_count_preserves_text():
+    lines, continuation, gap = load_psalm()
+    for target in (10, 17, 18, 20):
+        result = segment_verses(lines, target, continuation, gap)
+        assert len(result["new_verses"]) == target
+        joined = ''.join(v["content"] for v in result["new_verses"])
+        assert squash(joined) == squash(''.join(lines))
+
+
+def test_continuation_merges_before_gap_lines():
+    lines, continuation, gap = load_psalm()
+    result = segment_verses(lines, 17, continuation, gap)
+    sources = [v["source_lines"] for v in result["new_verses"]]
+    assert [8, 9] in sources
+
+
+def test_split_inside_line_at_punctuation():
+    result = segment_verses(["Dixit Dominus: Ex Basan convertam; convertam in profundum maris."], 2)
+    first, second = (v["content"] for v in result["new_verses"])
+    assert first.endswith(';')
+    assert second == "convertam in profundum maris."
+
+
+def test_impossible_count():
+    assert segment_verses(["Amen"], 3) is None
+
+
+def test_split_between_words_when_punctuation_runs_out():
+    result = segment_verses(["Regna terrae, cantate Deo psallite Domino"], 3)
+    contents = [v["content"] for v in result["new_verses"]]
+    assert len(contents) == 3 and contents[0] == "Regna terrae,"
+    assert " ".join(contents) == "Regna terrae, cantate Deo psallite Domino"
+    assert len(segment_verses(["one two three four"], 3)["new_verses"]) == 3
@@ -0,0 +1,63 @@
+import sys
+import os
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from swift_array import find_array_literals
+from whole_file import has_several_arrays, process_whole_file
+
+CODE = '''import Foundation
+
+// Psalm 22 [Vulgate]
+struct Psalm22 {
+    private let titles: [String] = [
+        "Psalmus David", // title
+        "In finem"
+    ]
+
+    private let text = [
+        /* 3 */ "Dominus regit me, [et] nihil mihi deerit:",
+        "in loco pascuae ibi me collocavit."
+    ]
+} // end ]
+'''
+
+
+def run_all(fn, arg_lists):
+    return [fn(*args) for args in arg_lists]
+
+
+def test_find_array_literals_skips_type_annotations_and_strings():
+    arrays = find_array_literals(CODE)
+    assert [a.name for a in arrays] == ['titles', 'text']
+    assert CODE[arrays[0].start:arrays[0].end].startswith('private let titles: [String] = [')
+    assert CODE[arrays[1].end - 1] == ']'
+    assert CODE[arrays[1].open] == '['
+    assert has_several_arrays(CODE)
+    assert not has_several_arrays('let a = [\n  "x"\n]')
+
+
+def test_whole_file_keeps_code_outside_arrays():
+    result = process_whole_file('number-elements', CODE, 'model', 'swift', run_all)
+    output = result['corrected_code']
+    assert result['arrays_count'] == 2
+    assert result['elements_count'] == 4
+    assert '/* 2 */ "In finem"' in output
+    assert '/* 1 */ "Dominus regit me, [et] nihil mihi deerit:"' in output
+
+    before, after = find_array_literals(CODE), find_array_literals(output)
+    assert CODE[:before[0].start] == output[:after[0].start]
+    assert CODE[before[0].end:before[1].start] == output[after[0].end:after[1].start]
+    assert CODE[before[1].end:] == output[after[1].end:]
+
+
+def test_whole_file_reports_failed_arrays():
+    def failing(fn, arg_lists):
+        results = run_all(fn, arg_lists)
+        results[1] = {"error": "Error: timed out"}
+        return results
+
+    result = process_whole_file('strip-comments', CODE, 'model', 'swift', failing)
+    assert result['error'] == '1 of 2 arrays failed'
+    assert result['arrays'][1]['error'] == 'Error: timed out'
+    assert result['arrays'][0]['elements_count'] == 2